@@ -20,7 +20,8 @@ from modulos.solicitacao import mod_solicitacao, init_app as init_solicitacao
 from modulos.cadastros import mod_cadastros, init_app as init_cadastros
 
 # Importações das funções centralizadas
-from utils.db import get_db_connection, execute_query, get_single_result, insert_data, update_data, init_app as init_db
+from utils.db import get_db_connection, execute_query, get_single_result, insert_data, update_data, get_pool_stats, init_app as init_db
+from utils.cache import get_cache_stats
 from utils.auth import login_obrigatorio, admin_obrigatorio, verificar_permissao, get_user_id
 
 # Limpar variáveis de ambiente existentes que possam interferir
@@ -47,11 +48,25 @@ app.config['MYSQL_CURSORCLASS'] = 'DictCursor'
 app.config['WTF_CSRF_ENABLED'] = True
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=8)
 
+# Pool de conexões com o banco de dados
+app.config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', 5))
+app.config['DB_POOL_MAX_OVERFLOW'] = int(os.getenv('DB_POOL_MAX_OVERFLOW', 10))
+app.config['DB_POOL_IDLE_TIMEOUT'] = int(
+    os.getenv('DB_POOL_IDLE_TIMEOUT', 300))  # segundos
+app.config['DB_POOL_TIMEOUT'] = int(os.getenv('DB_POOL_TIMEOUT', 30))
+app.config['DB_POOL_PING'] = os.getenv('DB_POOL_PING', '1') == '1'
+
 # Aumentar os limites de upload de arquivos
+# (o upload de XML/ZIP em /importar_xml é lido em streaming, com limites próprios:
+# NF_UPLOAD_LIMITE_ARQUIVO_MB e NF_UPLOAD_LIMITE_TOTAL_MB)
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50 MB
 app.config['UPLOAD_EXTENSIONS'] = ['.xml', '.zip']
 app.config['MAX_CONTENT_PATH'] = None
 
+# Importações de XML/ZIP processadas pela fila (scripts/worker_importacao_nf.py)
+app.config['NF_IMPORTACAO_ASSINCRONA'] = os.getenv(
+    'NF_IMPORTACAO_ASSINCRONA', '1') == '1'
+
 # Configuração de logging
 log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
 os.makedirs(log_dir, exist_ok=True)
@@ -416,6 +431,24 @@ def editar_perfil():
 
     return redirect(url_for('perfil'))
 
+# Estatísticas do pool de conexões
+
+
+@app.route('/api/db/pool')
+@admin_obrigatorio
+def api_db_pool():
+    """Retorna as estatísticas do pool de conexões do processo"""
+    return jsonify(get_pool_stats())
+
+# Estatísticas do cache (acertos/falhas)
+
+
+@app.route('/api/cache')
+@admin_obrigatorio
+def api_cache():
+    """Retorna as estatísticas do cache do processo"""
+    return jsonify(get_cache_stats())
+
 # Rota para acessar uploads
 
 
@@ -0,0 +1,32 @@
+-- Chave natural dos lançamentos do ERP (centro de custo, categoria, documento,
+-- data de pagamento, valor e histórico) como SHA-256: reimportações e períodos
+-- sobrepostos atualizam as linhas existentes em vez de duplicá-las.
+-- A expressão é a mesma de EXPRESSAO_CHAVE_NATURAL em modulos/integracao_erp/persistencia.py
+ALTER TABLE erp_transacoes
+    ADD COLUMN chave_natural CHAR(64) CHARACTER SET ascii NULL AFTER data_processamento;
+
+UPDATE erp_transacoes
+SET chave_natural = SHA2(CONCAT_WS(CHAR(31 USING utf8mb4),
+    COALESCE(CONVERT(centro_custo USING utf8mb4), ''),
+    COALESCE(CONVERT(categoria USING utf8mb4), ''),
+    COALESCE(CONVERT(documento USING utf8mb4), ''),
+    COALESCE(CONVERT(data_pagamento USING utf8mb4), ''),
+    CAST(CAST(valor AS DECIMAL(15,2)) AS CHAR),
+    COALESCE(CONVERT(historico USING utf8mb4), '')), 256);
+
+-- Remove as cópias criadas por importações repetidas, mantendo a mais recente
+ALTER TABLE erp_transacoes ADD INDEX idx_chave_natural_tmp (chave_natural);
+
+DELETE t FROM erp_transacoes t
+JOIN (
+    SELECT chave_natural, MAX(id) AS manter
+    FROM erp_transacoes
+    GROUP BY chave_natural
+    HAVING COUNT(*) > 1
+) d ON d.chave_natural = t.chave_natural
+WHERE t.id <> d.manter;
+
+ALTER TABLE erp_transacoes
+    MODIFY chave_natural CHAR(64) CHARACTER SET ascii NOT NULL,
+    ADD UNIQUE KEY uk_erp_transacoes_chave (chave_natural),
+    DROP INDEX idx_chave_natural_tmp;
@@ -0,0 +1,37 @@
+-- Data de pagamento como DATE (data_pagamento continua com o texto dd/mm/aaaa
+-- do relatório e entra na chave natural). As importações preenchem dt_pagamento
+-- na leitura do relatório; os filtros por período usam esta coluna.
+-- Execute depois de db-update-erp-transacoes-chave.sql. Para particionar a
+-- tabela por mês: python scripts/particionar_erp_transacoes.py
+ALTER TABLE erp_transacoes
+    ADD COLUMN dt_pagamento DATE NULL AFTER data_pagamento;
+
+-- Só converte textos no formato dd/mm/aaaa; sql_mode vazio para que datas
+-- impossíveis (31/02/2024) fiquem NULL em vez de interromper o UPDATE
+SET @sql_mode_anterior = @@SESSION.sql_mode;
+SET SESSION sql_mode = '';
+
+UPDATE erp_transacoes
+SET dt_pagamento = STR_TO_DATE(data_pagamento, '%d/%m/%Y')
+WHERE data_pagamento REGEXP '^[0-9]{1,2}/[0-9]{1,2}/[0-9]{4}$';
+
+SET SESSION sql_mode = @sql_mode_anterior;
+
+-- Lançamentos sem data válida (a importação já os rejeita): guardados em
+-- erp_transacoes_sem_data para conferência e removidos de erp_transacoes
+CREATE TABLE IF NOT EXISTS erp_transacoes_sem_data LIKE erp_transacoes;
+
+INSERT INTO erp_transacoes_sem_data
+SELECT * FROM erp_transacoes
+WHERE dt_pagamento IS NULL;
+
+DELETE FROM erp_transacoes
+WHERE dt_pagamento IS NULL;
+
+-- Mesma definição de SQL_CRIAR_TRANSACOES (modulos/integracao_erp/persistencia.py)
+ALTER TABLE erp_transacoes
+    MODIFY dt_pagamento DATE NOT NULL,
+    ADD INDEX idx_dt_pagamento (dt_pagamento);
+
+SELECT id, data_pagamento, documento
+FROM erp_transacoes_sem_data;
@@ -0,0 +1,4 @@
+-- Tempos por etapa e arquivos mais lentos de cada importação (JSON gravado
+-- pelo worker e exibido em /importacao_nf/importar_xml/status/<job_id>).
+-- Execute depois de db-update-importacao-jobs.sql
+ALTER TABLE nf_importacao_jobs ADD COLUMN metricas TEXT NULL AFTER mensagem;
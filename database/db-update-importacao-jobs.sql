@@ -0,0 +1,23 @@
+-- Fila de importações de XML/ZIP processadas em segundo plano
+-- Execute este script antes de iniciar scripts/worker_importacao_nf.py
+CREATE TABLE IF NOT EXISTS nf_importacao_jobs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    usuario_id INT NULL,
+    status ENUM('pendente', 'processando', 'concluido', 'erro') NOT NULL DEFAULT 'pendente',
+    diretorio VARCHAR(500) NOT NULL,
+    arquivos TEXT NOT NULL,
+    total_arquivos INT NOT NULL DEFAULT 0,
+    arquivo_atual VARCHAR(255) NULL,
+    processados INT NOT NULL DEFAULT 0,
+    novos INT NOT NULL DEFAULT 0,
+    atualizados INT NOT NULL DEFAULT 0,
+    erros INT NOT NULL DEFAULT 0,
+    mensagem TEXT,
+    worker VARCHAR(100) NULL,
+    criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    iniciado_em DATETIME NULL,
+    atualizado_em DATETIME NULL,
+    finalizado_em DATETIME NULL,
+    INDEX idx_status (status, id),
+    INDEX idx_worker (worker)
+);
@@ -0,0 +1,8 @@
+-- Posição (cursor) da última sincronização com a API Arquivei, por CNPJ
+-- cnpj vazio ('') corresponde à sincronização sem filtro de CNPJ
+CREATE TABLE IF NOT EXISTS nf_arquivei_cursor (
+    cnpj VARCHAR(14) NOT NULL PRIMARY KEY,
+    cursor_api BIGINT NOT NULL DEFAULT 0,
+    data_inicial DATE NOT NULL,
+    atualizado_em DATETIME NULL
+);
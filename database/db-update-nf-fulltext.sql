@@ -0,0 +1,15 @@
+-- Índices FULLTEXT da busca de notas fiscais (MySQL 5.7+ / InnoDB)
+-- Os índices são atualizados pelo próprio InnoDB a cada INSERT/UPDATE da importação.
+
+-- Sem a lista de stopwords padrão (em inglês), que descarta palavras como "com"
+-- das descrições; vale para os índices criados nesta sessão
+SET SESSION innodb_ft_enable_stopword = OFF;
+
+ALTER TABLE nf_notas
+    ADD FULLTEXT INDEX ft_nome_emitente (nome_emitente),
+    ADD FULLTEXT INDEX ft_nome_destinatario (nome_destinatario);
+
+ALTER TABLE nf_itens ADD FULLTEXT INDEX ft_descricao (descricao);
+
+-- O índice de prefixo de descrição deixa de ser usado pela busca
+ALTER TABLE nf_itens DROP INDEX idx_descricao;
@@ -0,0 +1,9 @@
+-- Hash do conteúdo do XML para ignorar reimportações sem alteração
+-- Execute este script antes de atualizar o módulo de importação NF
+ALTER TABLE nf_notas ADD COLUMN hash_conteudo CHAR(64) NULL AFTER xml_data;
+
+-- Índice de cobertura para o pré-carregamento (chave_acesso -> hash) em lote
+CREATE INDEX idx_chave_hash ON nf_notas(chave_acesso, hash_conteudo);
+
+-- Contador de notas sem alteração na fila de importação
+ALTER TABLE nf_importacao_jobs ADD COLUMN inalterados INT NOT NULL DEFAULT 0 AFTER atualizados;
@@ -0,0 +1,18 @@
+-- Número do item na nota (nItem do det), chave das atualizações de itens:
+-- ao reimportar uma nota alterada, apenas os itens diferentes são gravados
+-- (upsert por nf_id + numero_item) e os itens iguais mantêm a linha e o id
+ALTER TABLE nf_itens ADD COLUMN numero_item SMALLINT UNSIGNED NULL AFTER nf_id;
+
+-- Numera os itens já importados na ordem em que foram inseridos (MySQL 8.0+)
+UPDATE nf_itens i
+JOIN (
+    SELECT id, ROW_NUMBER() OVER (PARTITION BY nf_id ORDER BY id) AS numero
+    FROM nf_itens
+) n ON n.id = i.id
+SET i.numero_item = n.numero;
+
+-- A chave única também atende à FOREIGN KEY de nf_id, substituindo idx_nf_id
+ALTER TABLE nf_itens
+    MODIFY numero_item SMALLINT UNSIGNED NOT NULL,
+    ADD UNIQUE KEY uk_nf_itens_numero (nf_id, numero_item),
+    DROP INDEX idx_nf_id;
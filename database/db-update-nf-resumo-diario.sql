@@ -0,0 +1,17 @@
+-- Resumo diário das notas fiscais (painel e relatórios da importação NF)
+-- Mantido pela importação; para preencher o histórico execute depois:
+--     python scripts/reconstruir_resumo_nf.py
+CREATE TABLE IF NOT EXISTS nf_resumo_diario (
+    dia_importacao DATE NOT NULL,
+    dia_emissao DATE NOT NULL,
+    status_processamento VARCHAR(20) NOT NULL,
+    cnpj_emitente VARCHAR(14) NOT NULL,
+    nome_emitente VARCHAR(100) NOT NULL DEFAULT '',
+    total_notas INT NOT NULL DEFAULT 0,
+    valor_total DECIMAL(18,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (dia_importacao, dia_emissao, status_processamento, cnpj_emitente),
+    INDEX idx_resumo_dia_emissao (dia_emissao)
+);
+
+-- Usado na reconstrução por dia de importação
+CREATE INDEX idx_data_importacao ON nf_notas(data_importacao);
@@ -0,0 +1,10 @@
+-- Soma do valor dos itens gravada em nf_notas pela importação (mesma transação
+-- dos itens). Execute depois de db-update-nf-total-itens.sql e preencha as
+-- notas já importadas com:
+--     python scripts/reconciliar_totais_nf.py
+ALTER TABLE nf_notas ADD COLUMN soma_itens DECIMAL(15,2) NOT NULL DEFAULT 0 AFTER total_itens;
+
+-- Verificadas pelo MySQL 8.0.16+ (versões anteriores aceitam e ignoram)
+ALTER TABLE nf_notas
+    ADD CONSTRAINT chk_nf_total_itens CHECK (total_itens >= 0),
+    ADD CONSTRAINT chk_nf_soma_itens CHECK (total_itens > 0 OR soma_itens = 0);
@@ -0,0 +1,11 @@
+-- Quantidade de itens gravada em nf_notas pela importação (mesma transação dos
+-- itens), para que as listagens não precisem agregar nf_itens
+ALTER TABLE nf_notas ADD COLUMN total_itens INT NOT NULL DEFAULT 0 AFTER valor_total;
+
+-- Preenche as notas já importadas
+UPDATE nf_notas n
+JOIN (SELECT nf_id, COUNT(*) AS total FROM nf_itens GROUP BY nf_id) i ON i.nf_id = n.id
+SET n.total_itens = i.total;
+
+-- A paginação por chave percorre (data_emissao, id) em ordem decrescente usando
+-- idx_data_emissao: no InnoDB o índice secundário já inclui a chave primária (id)
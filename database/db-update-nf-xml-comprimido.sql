@@ -0,0 +1,8 @@
+-- XML original das notas comprimido (zlib) e fora da linha de nf_notas
+-- Execute este script e depois migre os XMLs existentes com:
+--     python scripts/migrate_xml_nf.py
+CREATE TABLE IF NOT EXISTS nf_xml (
+    nf_id INT PRIMARY KEY,
+    xml_comprimido LONGBLOB NOT NULL,
+    FOREIGN KEY (nf_id) REFERENCES nf_notas(id) ON DELETE CASCADE
+);
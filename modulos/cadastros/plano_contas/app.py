@@ -3,8 +3,7 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 import os
 import logging
 from datetime import datetime
-import mysql.connector
-from mysql.connector import Error
+from utils.db import get_pooled_connection
 from utils.auth import verificar_permissao
 import pandas as pd
 from werkzeug.utils import secure_filename
@@ -49,17 +48,8 @@ mod_plano_contas = Blueprint('plano_contas', __name__,
 
 
 def get_db_connection():
-    try:
-        connection = mysql.connector.connect(
-            host=os.environ.get('DB_HOST', 'localhost'),
-            database=os.environ.get('DB_NAME', 'sistema_solicitacoes'),
-            user=os.environ.get('DB_USER', 'root'),
-            password=os.environ.get('DB_PASSWORD', 'sua_senha')
-        )
-        return connection
-    except Error as e:
-        logger.error(f"Erro ao conectar ao MySQL: {e}")
-        return None
+    # Conexão emprestada do pool central; close() devolve ao pool
+    return get_pooled_connection()
 
 # Rota principal - redirecionamento para lista de planos de conta
 
@@ -6,8 +6,7 @@ import logging
 from datetime import datetime
 import uuid
 from werkzeug.utils import secure_filename
-import mysql.connector
-from mysql.connector import Error
+from utils.db import get_pooled_connection
 
 # Configuração de logging
 log_dir = os.path.join(os.path.dirname(
@@ -33,17 +32,8 @@ mod_checklist = Blueprint('checklist', __name__,
 
 
 def get_db_connection():
-    try:
-        connection = mysql.connector.connect(
-            host=os.environ.get('DB_HOST', 'localhost'),
-            database=os.environ.get('DB_NAME', 'sistema_solicitacoes'),
-            user=os.environ.get('DB_USER', 'root'),
-            password=os.environ.get('DB_PASSWORD', 'sua_senha')
-        )
-        return connection
-    except Error as e:
-        logger.error(f"Erro ao conectar ao MySQL: {e}")
-        return None
+    # Conexão emprestada do pool central; close() devolve ao pool
+    return get_pooled_connection()
 
 # Verificar permissões de acesso
 
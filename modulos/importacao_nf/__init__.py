@@ -1,9 +1,13 @@
 # modulo_importacao_nf/__init__.py
-from .app import mod_importacao_nf
+from .app import mod_importacao_nf, importar_xml
 
 
 def init_app(app):
     """Função para inicializar o módulo com a aplicação Flask"""
+    # O upload de XML/ZIP é lido em streaming e valida o token CSRF na própria rota
+    csrf = app.extensions.get('csrf')
+    if csrf is not None:
+        csrf.exempt(importar_xml)
     return app
 
 
@@ -1,19 +1,33 @@
 # modulo_importacao_nf/app.py
-from modulos.importacao_nf.xml_utils import decodificar_base64_xml, identificar_xml_base64
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session, send_file
+from modulos.importacao_nf.xml_utils import decodificar_base64_bytes, identificar_xml_base64, codificacoes_candidatas, decodificar_bytes_xml, chave_acesso_rapida, hash_conteudo_xml, comprimir_xml, descomprimir_xml, CODIFICACOES_XML
+from modulos.importacao_nf.extrator_nfe import extrair_nfe_iterparse, completar_nfe_por_regex, nfe_vazia, remover_caracteres_controle, converter_data_emissao, numero_item_det
+from modulos.importacao_nf.persistencia import salvar_nfe, salvar_lote_nfe, CacheHashNfe
+from modulos.importacao_nf.arquivei import SincronizadorArquivei, ErroArquivei
+from modulos.importacao_nf.upload_streaming import ReceptorUpload, ErroUpload, LIMITE_ARQUIVO, MB
+from modulos.importacao_nf.busca import buscar_notas, listar_notas, COLUNAS_NOTA
+from modulos.importacao_nf.jobs import criar_diretorio_job, criar_job, obter_job, resumo_resultados, CAMPOS_CONTADORES
+from modulos.importacao_nf.metricas import MetricasImportacao, ativar_metricas, metricas_atuais, etapa
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session, send_file, current_app
 import requests
 import json
-from datetime import datetime, timedelta
+from datetime import datetime
 import os
 from mysql.connector import Error
-import mysql
+from utils.db import get_pooled_connection
+from utils.cache import em_cache, invalidar_cache
 import tempfile
 import zipfile
+import multiprocessing
+import queue
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 import shutil
+from time import perf_counter
 import xml.etree.ElementTree as ET
-from werkzeug.utils import secure_filename
 import logging
 from flask_wtf import FlaskForm
+from flask_wtf.csrf import validate_csrf
+from wtforms import ValidationError
 import base64
 
 # Configurar logger
@@ -23,7 +37,8 @@ os.makedirs(log_dir, exist_ok=True)
 log_file = os.path.join(log_dir, 'importacao_xml.log')
 
 logger = logging.getLogger('importacao_xml')
-logger.setLevel(logging.DEBUG)
+# DEBUG registra cada nota processada; em produção o padrão é INFO
+logger.setLevel(os.environ.get('NF_IMPORTACAO_LOG_NIVEL', 'INFO').upper())
 if not logger.handlers:
     handler = logging.FileHandler(log_file)
     formatter = logging.Formatter(
@@ -41,10 +56,27 @@ mod_importacao_nf = Blueprint('importacao_nf', __name__,
                               template_folder='templates',
                               static_folder='static')
 
-# Configurações da API Arquivei
-ARQUIVEI_API_ID = os.environ.get('ARQUIVEI_API_ID', 'seu_api_id')
-ARQUIVEI_API_KEY = os.environ.get('ARQUIVEI_API_KEY', 'sua_api_key')
-ARQUIVEI_API_ENDPOINT = 'https://api.arquivei.com.br/v1/nfe/received'
+# Processos de parse dos XMLs de um ZIP nos workers da fila (0 = número de
+# CPUs, 1 = sequencial). No processo web o parse é sempre sequencial.
+PROCESSOS_PARSE = int(os.environ.get('NF_IMPORTACAO_PROCESSOS_PARSE', 0))
+# Ligado por scripts/worker_importacao_nf.py em cada processo worker
+_parse_em_processos = False
+# Notas gravadas por transação na importação de ZIPs
+LOTE_GRAVACAO = int(os.environ.get('NF_IMPORTACAO_LOTE_GRAVACAO', 200))
+# Membros de ZIP lidos por vez (e chaves pré-carregadas por consulta)
+JANELA_PREFETCH = int(os.environ.get('NF_IMPORTACAO_JANELA_PREFETCH', 200))
+# Namespace do cache dos relatórios (/api/dados_relatorio)
+CACHE_RELATORIOS_NF = 'importacao_nf.relatorios'
+# Notas por página de /api/notas_recentes (padrão e máximo do parâmetro limite)
+LIMITE_API_NOTAS = int(os.environ.get('NF_API_NOTAS_POR_PAGINA', 100))
+LIMITE_MAXIMO_API_NOTAS = 500
+
+# Contador de resultados correspondente a cada status de gravação
+CONTADOR_POR_STATUS = {
+    'novo': 'novos',
+    'atualizado': 'atualizados',
+    'inalterado': 'inalterados',
+}
 
 # Importar o módulo xml_utils
 
@@ -52,17 +84,8 @@ ARQUIVEI_API_ENDPOINT = 'https://api.arquivei.com.br/v1/nfe/received'
 
 
 def get_db_connection():
-    try:
-        connection = mysql.connector.connect(
-            host=os.environ.get('DB_HOST', 'localhost'),
-            database=os.environ.get('DB_NAME', 'sistema_solicitacoes'),
-            user=os.environ.get('DB_USER', 'root'),
-            password=os.environ.get('DB_PASSWORD', 'sua_senha')
-        )
-        return connection
-    except Error as e:
-        logger.error(f"Erro ao conectar ao MySQL: {e}")
-        return None
+    # Conexão emprestada do pool central; close() devolve ao pool
+    return get_pooled_connection()
 
 # Função para buscar NFes da API Arquivei
 
@@ -74,20 +97,74 @@ def process_xml_file(file_path):
     """
     logger.debug(f"Processando arquivo XML: {file_path}")
 
+    try:
+        with open(file_path, 'rb') as f:
+            dados = f.read()
+    except Exception as e:
+        logger.error(f"Não foi possível ler o arquivo XML {file_path}: {str(e)}")
+        return None
+
+    return extrair_nfe_xml(dados, file_path)
+
+
+def _textos_xml(dados):
+    """
+    Gera (codificação, texto) para cada tentativa de leitura do XML.
+    Conteúdo já decodificado (str) é usado diretamente na primeira tentativa;
+    as demais reinterpretam seus bytes UTF-8, como fazia a leitura do arquivo.
+    """
+    if isinstance(dados, str):
+        if '\r' in dados:
+            dados = dados.replace('\r\n', '\n').replace('\r', '\n')
+        yield CODIFICACOES_XML[0], dados
+        dados = dados.encode('utf-8')
+        encodings = CODIFICACOES_XML[1:]
+    else:
+        encodings = codificacoes_candidatas(dados)
+
+    for encoding in encodings:
+        yield encoding, decodificar_bytes_xml(dados, encoding)
+
+
+def extrair_nfe_xml(dados, file_path='<memória>'):
+    """
+    Extrai os dados de uma NF-e a partir do conteúdo do XML em memória
+
+    Args:
+        dados: Conteúdo do XML em bytes ou já decodificado (str)
+        file_path: Origem do conteúdo, usada nos logs e no arquivo de debug
+
+    Returns:
+        dict: Dados da NF-e ou None se não for possível extrair
+    """
+    # Caminho rápido: passagem única com iterparse sobre a primeira leitura
+    try:
+        codificacao, texto = next(_textos_xml(dados))
+        nfe_data = extrair_nfe_iterparse(texto)
+        if nfe_data is not None:
+            if not completar_nfe_por_regex(nfe_data, nfe_data['xml']):
+                debug_xml_content(nfe_data['xml'], file_path)
+                logger.error(
+                    f"Não foi possível extrair a chave de acesso do arquivo {file_path}")
+                return None
+
+            logger.debug(
+                f"XML processado com sucesso: {nfe_data['access_key']}, {len(nfe_data['items'])} itens encontrados")
+            return nfe_data
+    except Exception as e:
+        logger.warning(
+            f"Falha no extrator iterparse, usando extração completa: {str(e)}")
+
+    return _extrair_nfe_arvore(dados, file_path)
+
+
+def _extrair_nfe_arvore(dados, file_path):
+    """
+    Extração completa (árvore ElementTree/lxml) com todas as tentativas de
+    codificação. Usada quando o extrator iterparse não consegue tratar o XML.
+    """
     # Criar um objeto básico para a nota fiscal
-    nfe_data = {
-        'access_key': None,
-        'number': None,
-        'emission_date': None,
-        'value': 0.0,
-        'cnpj_sender': '',
-        'sender_name': '',
-        'cnpj_receiver': '',
-        'receiver_name': '',
-        'items': [],
-        'xml': '',
-        'observacoes': f"Importado via XML em {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}"
-    }
+    nfe_data = nfe_vazia()
 
     # Abordagem 1: Tentar com parser XML nativo
     try:
@@ -95,14 +172,10 @@ def process_xml_file(file_path):
         xml_content = None
 
         # Tentar diferentes codificações
-        encodings = ['utf-8', 'latin1', 'iso-8859-1', 'cp1252']
         success = False
 
-        for encoding in encodings:
+        for encoding, xml_content in _textos_xml(dados):
             try:
-                with open(file_path, 'r', encoding=encoding, errors='ignore') as f:
-                    xml_content = f.read()
-
                 # Verificar se parece um XML válido
                 if not xml_content or not ('<' in xml_content and '>' in xml_content):
                     logger.warning(
@@ -112,13 +185,12 @@ def process_xml_file(file_path):
                 # Tentar construir a árvore XML
                 try:
                     # Remover caracteres inválidos que podem atrapalhar o parsing
-                    xml_content = ''.join(char for char in xml_content if ord(
-                        char) < 128 or ord(char) > 159)
+                    xml_content = remover_caracteres_controle(xml_content)
 
                     # Tentar parse com ElementTree
                     tree = ET.fromstring(xml_content)
                     success = True
-                    logger.info(
+                    logger.debug(
                         f"XML parseado com sucesso usando codificação {encoding}")
                     break
 
@@ -129,7 +201,7 @@ def process_xml_file(file_path):
 
             except Exception as e:
                 logger.warning(
-                    f"Falha ao ler arquivo com codificação {encoding}: {str(e)}")
+                    f"Falha ao ler conteúdo com codificação {encoding}: {str(e)}")
                 continue
 
         # Se não conseguiu ler o arquivo com nenhuma codificação
@@ -204,17 +276,7 @@ def process_xml_file(file_path):
         if dh_emi is not None and dh_emi.text:
             date_str = dh_emi.text.strip()
             try:
-                if 'T' in date_str:
-                    # Formato com timezone: 2023-01-01T14:30:00-03:00
-                    clean_date = date_str.replace('T', ' ')
-                    if '-03:00' in clean_date:
-                        clean_date = clean_date.split('-03:00')[0]
-                    nfe_data['emission_date'] = datetime.fromisoformat(
-                        clean_date)
-                else:
-                    # Formato antigo: AAAA-MM-DD
-                    nfe_data['emission_date'] = datetime.strptime(
-                        date_str, '%Y-%m-%d')
+                nfe_data['emission_date'] = converter_data_emissao(date_str)
             except Exception as e:
                 logger.warning(f"Erro ao converter data de emissão: {e}")
                 nfe_data['emission_date'] = datetime.now()
@@ -324,6 +386,7 @@ def process_xml_file(file_path):
                     item['total_value'] = item['quantity']*item['unit_value']
 
                 # Adicionar item à lista
+                item['numero_item'] = numero_item_det(det)
                 itens.append(item)
             else:
                 # Tentar extrair informações diretamente do det
@@ -365,156 +428,19 @@ def process_xml_file(file_path):
                                     item['unit_value']
 
                 # Adicionar item à lista
+                item['numero_item'] = numero_item_det(det)
                 itens.append(item)
 
         # Adicionar itens ao dicionário de retorno
         nfe_data['items'] = itens
 
-        # Se não conseguimos extrair a chave de acesso, tentar com regex de forma mais agressiva
-        if nfe_data['access_key'] is None and xml_content:
-            logger.info(
-                "Chave de acesso não encontrada com ElementTree, tentando com regex")
-
-            # Extrair chave de acesso com regex - padrões ampliados
-            import re
-            chave_patterns = [
-                r'Id="NFe([0-9]{44})"',
-                r'Id=["\']NFe([0-9]{44})["\']',
-                r'chNFe>([0-9]{44})<',
-                r'<chNFe>([0-9]{44})</chNFe>',
-                r'chave="([0-9]{44})"',
-                r'chave=["\']([0-9]{44})["\']',
-                r'Chave de acesso: ([0-9]{44})',
-                r'chave>([0-9]{44})<',
-                r'chnfe>([0-9]{44})<',
-                r'chave.{0,20}([0-9]{44})',
-                r'<infNFe.*?Id="NFe([0-9]{44})"',
-                r'<NFe.*?Id="NFe([0-9]{44})"',
-                r'["\']NFe([0-9]{44})["\']',
-                # Último recurso: qualquer sequência de 44 dígitos
-                r'([0-9]{44})'
-            ]
-
-            for pattern in chave_patterns:
-                chave_match = re.search(pattern, xml_content, re.IGNORECASE)
-                if chave_match:
-                    chave_candidata = chave_match.group(1)
-                    # Verificar se é realmente uma chave de acesso (44 dígitos)
-                    if len(chave_candidata) == 44 and chave_candidata.isdigit():
-                        nfe_data['access_key'] = chave_candidata
-                        logger.info(
-                            f"Chave de acesso encontrada com regex: {nfe_data['access_key']}")
-                        break
-
-            # Se ainda não encontrou, buscar 44 dígitos em sequência como último recurso
-            if nfe_data['access_key'] is None:
-                all_numbers = re.findall(r'\d+', xml_content)
-                for num in all_numbers:
-                    if len(num) == 44:
-                        nfe_data['access_key'] = num
-                        logger.info(
-                            f"Chave de acesso encontrada como sequência de 44 dígitos: {num}")
-                        break
-
-            if nfe_data['access_key'] is None:
-                # Temos um problema sério, depurar o conteúdo XML
-                debug_xml_content(xml_content, file_path)
-                logger.error(
-                    f"Não foi possível extrair a chave de acesso do arquivo {file_path}")
-                return None
-
-        # Se não temos número da NF, tentar com regex
-        if not nfe_data['number']:
-            import re
-            num_patterns = [
-                r'<nNF>(\d+)</nNF>',
-                r'nNF>(\d+)<',
-                r'Número: (\d+)',
-                r'numero>(\d+)<',
-                r'num>(\d+)<'
-            ]
-
-            for pattern in num_patterns:
-                num_match = re.search(pattern, xml_content, re.IGNORECASE)
-                if num_match:
-                    nfe_data['number'] = num_match.group(1)
-                    break
-
-        # Se não temos data de emissão, tentar com regex
-        if not nfe_data['emission_date']:
-            import re
-            date_patterns = [
-                r'<dhEmi>(.*?)</dhEmi>',
-                r'<dEmi>(.*?)</dEmi>',
-                r'dhEmi>(.*?)<',
-                r'dEmi>(.*?)<',
-                r'Data de emissão: (\d{2}/\d{2}/\d{4})',
-                r'data>(\d{2}/\d{2}/\d{4})<'
-            ]
-
-            for pattern in date_patterns:
-                date_match = re.search(pattern, xml_content, re.IGNORECASE)
-                if date_match:
-                    date_str = date_match.group(1)
-                    try:
-                        if 'T' in date_str:
-                            # Formato com timezone: 2023-01-01T14:30:00-03:00
-                            clean_date = date_str.replace('T', ' ')
-                            if '-03:00' in clean_date:
-                                clean_date = clean_date.split('-03:00')[0]
-                            nfe_data['emission_date'] = datetime.fromisoformat(
-                                clean_date)
-                        elif '/' in date_str:
-                            # Formato DD/MM/YYYY
-                            nfe_data['emission_date'] = datetime.strptime(
-                                date_str, '%d/%m/%Y')
-                        else:
-                            # Formato antigo: AAAA-MM-DD
-                            nfe_data['emission_date'] = datetime.strptime(
-                                date_str, '%Y-%m-%d')
-                        break
-                    except Exception as e:
-                        logger.warning(
-                            f"Regex: Erro ao converter data de emissão: {e}")
-                        continue
-
-        # Se ainda não temos data de emissão, usar data atual
-        if not nfe_data['emission_date']:
-            nfe_data['emission_date'] = datetime.now()
-            logger.warning(
-                f"Data de emissão não encontrada, usando data atual")
-
-        # Se não temos valor total, tentar com regex
-        if nfe_data['value'] == 0:
-            import re
-            value_patterns = [
-                r'<vNF>(.*?)</vNF>',
-                r'vNF>(.*?)<',
-                r'Valor Total: ([\d.,]+)',
-                r'total>([\d.,]+)<'
-            ]
-
-            for pattern in value_patterns:
-                value_match = re.search(pattern, xml_content, re.IGNORECASE)
-                if value_match:
-                    try:
-                        nfe_data['value'] = float(value_match.group(
-                            1).replace('.', '').replace(',', '.'))
-                        break
-                    except:
-                        continue
-
-        # Se não encontrou itens, adicionar item genérico
-        if not nfe_data['items'] and nfe_data['access_key']:
-            logger.warning(
-                f"Nenhum item encontrado, adicionando item genérico para a NFe {nfe_data['access_key']}")
-            nfe_data['items'] = [{
-                'code': 'GENERICO',
-                'description': f"Nota Fiscal {nfe_data['access_key']}",
-                'quantity': 1,
-                'unit_value': nfe_data['value'],
-                'total_value': nfe_data['value']
-            }]
+        # Complementar com regex os campos que o parser não encontrou
+        if not completar_nfe_por_regex(nfe_data, xml_content):
+            # Temos um problema sério, depurar o conteúdo XML
+            debug_xml_content(xml_content, file_path)
+            logger.error(
+                f"Não foi possível extrair a chave de acesso do arquivo {file_path}")
+            return None
 
     except Exception as e:
         logger.error(
@@ -554,7 +480,7 @@ def process_xml_file(file_path):
 
     # Log do sucesso da operação
     num_itens = len(nfe_data['items'])
-    logger.info(
+    logger.debug(
         f"XML processado com sucesso: {nfe_data['access_key']}, {num_itens} itens encontrados")
 
     return nfe_data
@@ -576,7 +502,11 @@ def debug_xml_content(xml_content, file_path, salvar_debug=True):
 
     # Salvar conteúdo para análise posterior
     if salvar_debug and xml_content:
-        debug_file = os.path.join(os.path.dirname(file_path), 'debug_xml.txt')
+        debug_dir = os.path.dirname(file_path)
+        if not os.path.isdir(debug_dir):
+            # Conteúdo em memória (ZIP, API) não tem diretório de origem
+            debug_dir = tempfile.gettempdir()
+        debug_file = os.path.join(debug_dir, 'debug_xml.txt')
         try:
             with open(debug_file, 'w', encoding='utf-8') as f:
                 f.write(f"XML original de {file_path}:\n\n")
@@ -588,354 +518,151 @@ def debug_xml_content(xml_content, file_path, salvar_debug=True):
     return False
 
 
-def buscar_nfes_arquivei(dias_atras=30, cnpj=None):
-    try:
-        # Calcular data inicial (30 dias atrás por padrão)
-        data_inicial = (datetime.now() -
-                        timedelta(days=dias_atras)).strftime('%Y-%m-%d')
-
-        # Parâmetros da requisição
-        params = {
-            'start_date': data_inicial,
-            'limit': 50  # Limite de NFes a serem retornadas
-        }
-
-        # Adicionar CNPJ aos parâmetros se fornecido
-        if cnpj:
-            cnpj_formatado = ''.join(filter(str.isdigit, cnpj))
-            params['cnpj'] = cnpj_formatado
-
-        # Cabeçalhos da requisição
-        headers = {
-            'Content-Type': 'application/json',
-            'X-API-ID': ARQUIVEI_API_ID,
-            'X-API-KEY': ARQUIVEI_API_KEY
-        }
+def _bytes_documento_arquivei(documento):
+    """
+    Conteúdo (bytes) do XML de um documento retornado pela API Arquivei,
+    que envia o XML em Base64
 
-        # Fazer a requisição
-        response = requests.get(ARQUIVEI_API_ENDPOINT,
-                                headers=headers, params=params)
+    Returns:
+        bytes: XML da nota ou None se o documento não tiver um XML válido
+    """
+    base64_str = identificar_xml_base64(documento)
+    if base64_str:
+        return decodificar_base64_bytes(base64_str)
 
-        # Verificar se a requisição foi bem-sucedida
-        if response.status_code == 200:
-            return response.json()
-        else:
-            logger.error(
-                f"Erro ao buscar NFes: {response.status_code} - {response.text}")
-            return None
-    except Exception as e:
-        logger.error(f"Exceção ao buscar NFes: {str(e)}")
-        return None
+    if isinstance(documento, dict) and isinstance(documento.get('xml'), str):
+        return documento['xml'].encode('utf-8')
+    return None
 
 
-# Função para salvar NFe no banco de dados
+def processar_pagina_arquivei(documentos, cache):
+    """
+    Importa uma página de documentos da API Arquivei: descarta os que já
+    foram importados sem alteração e grava os demais em um único lote
 
+    Args:
+        documentos: Lista de documentos da página
+        cache: CacheHashNfe da sincronização
 
-def save_nfe_to_db(nfe_data):
-    """
-    Salva os dados da NFe no banco de dados
-    Retorna True se for uma nova NFe, False se for uma atualização
+    Returns:
+        list: Status de cada documento, na mesma ordem ('invalido' para os
+            que não têm um XML de NF-e válido, que não adianta buscar de novo)
     """
-    is_new = True
-    connection = get_db_connection()
-
-    if not connection:
-        logger.error("Falha ao conectar ao banco de dados")
-        return False
+    with etapa('decodificacao'):
+        conteudos = [_bytes_documento_arquivei(documento) for documento in documentos]
+    cache.carregar([chave_acesso_rapida(dados) for dados in conteudos if dados])
+
+    status_documentos = ['invalido'] * len(documentos)
+    notas = []
+    posicoes = []
+    for posicao, dados in enumerate(conteudos):
+        if dados:
+            with etapa('deduplicacao'):
+                hash_conteudo = hash_conteudo_xml(dados)
+                inalterada = cache.inalterada(chave_acesso_rapida(dados), hash_conteudo)
+            if inalterada:
+                status_documentos[posicao] = 'inalterado'
+                continue
+            nfe_data = _preparar_nfe_membro(f'arquivei:{posicao}', dados, hash_conteudo)
+            if nfe_data:
+                notas.append(nfe_data)
+                posicoes.append(posicao)
+                continue
 
-    try:
-        cursor = connection.cursor(dictionary=True)
+        documento = documentos[posicao]
+        chave = documento.get('access_key') if isinstance(documento, dict) else None
+        logger.warning(f"Documento Arquivei sem XML de NF-e válido ignorado "
+                       f"(chave {chave or 'desconhecida'})")
 
-        # Verificar se a nota já existe
-        cursor.execute("SELECT id FROM nf_notas WHERE chave_acesso = %s",
-                       (nfe_data.get('access_key'),))
-        nota_existente = cursor.fetchone()
+    for posicao, status in zip(posicoes, salvar_lote_nfe(notas, cache)):
+        status_documentos[posicao] = status
 
-        if nota_existente:
-            # Atualizar nota existente
-            is_new = False
-            nota_id = nota_existente['id']
+    if 'novo' in status_documentos or 'atualizado' in status_documentos:
+        invalidar_cache(CACHE_RELATORIOS_NF)
+    return status_documentos
 
-            cursor.execute("""
-                UPDATE nf_notas SET 
-                data_emissao = %s, 
-                valor_total = %s, 
-                cnpj_emitente = %s, 
-                nome_emitente = %s, 
-                cnpj_destinatario = %s, 
-                nome_destinatario = %s, 
-                status_processamento = 'atualizado',
-                data_atualizacao = NOW(),
-                observacoes = %s
-                WHERE id = %s
-            """, (
-                nfe_data.get('emission_date'),
-                nfe_data.get('value', 0),
-                nfe_data.get('cnpj_sender', ''),
-                nfe_data.get('sender_name', ''),
-                nfe_data.get('cnpj_receiver', ''),
-                nfe_data.get('receiver_name', ''),
-                nfe_data.get('observacoes', ''),
-                nota_id
-            ))
-
-            # Remover itens antigos
-            cursor.execute("DELETE FROM nf_itens WHERE nf_id = %s", (nota_id,))
-        else:
-            # Inserir nova nota
-            cursor.execute("""
-                INSERT INTO nf_notas (
-                    chave_acesso, numero_nf, data_emissao, valor_total, cnpj_emitente, 
-                    nome_emitente, cnpj_destinatario, nome_destinatario, status_processamento, data_importacao, observacoes
-                ) VALUES (%s, %s, %s,%s,%s, %s, %s, %s, %s, NOW(), %s)
-            """, (
-                nfe_data.get('access_key', ''),
-                nfe_data.get('number'),
-                nfe_data.get('emission_date'),
-                nfe_data.get('value', 0),
-                nfe_data.get('cnpj_sender', ''),
-                nfe_data.get('sender_name', ''),
-                nfe_data.get('cnpj_receiver', ''),
-                nfe_data.get('receiver_name', ''),
-                'importado',
-                nfe_data.get('observacoes', '')
-            ))
-
-            nota_id = cursor.lastrowid
-
-        # Inserir itens
-        for item in nfe_data.get('items', []):
-            cursor.execute("""
-                INSERT INTO nf_itens (
-                    nf_id, codigo, descricao, quantidade, 
-                    valor_unitario, valor_total
-                ) VALUES (%s, %s, %s, %s, %s, %s)
-            """, (
-                nota_id,
-                item.get('code', ''),
-                item.get('description', ''),
-                item.get('quantity', 0),
-                item.get('unit_value', 0),
-                item.get('total_value', 0)
-            ))
-
-        connection.commit()
-        logger.info(f"NFe {nfe_data.get('access_key')} salva com sucesso")
-        return is_new
-
-    except Exception as e:
-        connection.rollback()
-        logger.error(f"Erro ao salvar NFe no banco: {str(e)}", exc_info=True)
-        return False
-
-    finally:
-        cursor.close()
-        connection.close()
 
 # Função para processar e salvar NFe no banco de dados (para API Arquivei)
 
 
-def processar_e_salvar_nfe(nfe_data):
-    connection = get_db_connection()
-    if not connection:
-        logger.error("Não foi possível conectar ao banco de dados")
-        return 'erro'
-
-    try:
-        logger.info("Iniciando processamento de NFe")
-        cursor = connection.cursor(dictionary=True)
-
-        # 1. Tratamento inicial dos dados
-        # Se nfe_data for uma string (conteúdo XML direto), transformar em dicionário
-        if isinstance(nfe_data, str):
-            # Tratar como XML direto
-            logger.info("Recebido conteúdo XML direto, processando")
-            xml_content = nfe_data
-
-            # Verificar se o conteúdo parece ser XML
-            if not xml_content or not ('<' in xml_content[:100]):
-                logger.error("Conteúdo não parece ser XML válido")
-                logger.debug(f"Primeiros 100 caracteres: {xml_content[:100]}")
-                return 'erro'
+def extrair_nfe_de_conteudo(xml_content):
+    """
+    Extrai os dados de uma NF-e a partir do conteúdo XML em texto.
 
-            try:
-                # Salvar em arquivo temporário
-                temp_file = tempfile.NamedTemporaryFile(
-                    mode='w', suffix='.xml', delete=False, encoding='utf-8')
-                temp_file.write(xml_content)
-                temp_file_path = temp_file.name
-                temp_file.close()
+    Returns:
+        dict: Dados da NF-e com o XML original em 'xml' ou None se falhar
+    """
+    # Verificar se o conteúdo parece ser XML
+    if not xml_content or not ('<' in xml_content[:100]):
+        logger.error("Conteúdo não parece ser XML válido")
+        logger.debug(f"Primeiros 100 caracteres: {xml_content[:100]}")
+        return None
 
-                # Processar XML para extrair dados
-                processed_nfe = process_xml_file(temp_file_path)
+    try:
+        # Processar XML para extrair dados
+        processed_nfe = extrair_nfe_xml(xml_content)
 
-                # Remover arquivo temporário
-                try:
-                    os.unlink(temp_file_path)
-                except:
-                    pass
+        if not processed_nfe:
+            logger.error("Falha ao processar o XML")
+            return None
 
-                if not processed_nfe:
-                    logger.error("Falha ao processar o XML")
-                    return 'erro'
+        # Adicionar o conteúdo original ao dicionário processado
+        processed_nfe['xml'] = xml_content
+        return processed_nfe
+    except Exception as e:
+        logger.error(f"Erro ao processar XML: {str(e)}")
+        return None
 
-                # Adicionar o conteúdo original ao dicionário processado
-                processed_nfe['xml'] = xml_content
-                nfe_data = processed_nfe
-            except Exception as e:
-                logger.error(f"Erro ao processar XML: {str(e)}")
-                return 'erro'
 
-        elif not isinstance(nfe_data, dict):
-            logger.error(
-                f"Dados NFe inválidos, não é um dicionário ou string: {type(nfe_data)}")
-            return 'erro'
+# O parse (etapa aninhada) é descontado: o restante é a gravação
+@etapa('gravacao_banco')
+def processar_e_salvar_nfe(nfe_data, hash_conteudo=None, cache=None):
+    logger.debug("Iniciando processamento de NFe")
 
-        # 2. Verificar se temos os dados mínimos necessários
-        if not isinstance(nfe_data, dict):
-            logger.error(
-                "Dados NFe inválidos após processamento, não é um dicionário")
+    # 1. Tratamento inicial dos dados
+    # Se nfe_data for uma string (conteúdo XML direto), transformar em dicionário
+    if isinstance(nfe_data, str):
+        # Tratar como XML direto
+        logger.debug("Recebido conteúdo XML direto, processando")
+        with etapa('parse'):
+            nfe_data = extrair_nfe_de_conteudo(nfe_data)
+        if not nfe_data:
             return 'erro'
 
-        chave_acesso = nfe_data.get('access_key')
-        if not chave_acesso:
-            logger.error("Chave de acesso não encontrada nos dados")
-            return 'erro'
+    elif not isinstance(nfe_data, dict):
+        logger.error(
+            f"Dados NFe inválidos, não é um dicionário ou string: {type(nfe_data)}")
+        return 'erro'
 
-        # 3. Extração de dados para persistência
-        numero_nf = nfe_data.get('number', '')
-        data_emissao = nfe_data.get('emission_date')
+    connection = get_db_connection()
+    if not connection:
+        logger.error("Não foi possível conectar ao banco de dados")
+        return 'erro'
 
-        # Verificar se data_emissao está presente
-        if data_emissao is None:
-            # Usar a data atual como fallback
-            data_emissao = datetime.now()
-            logger.warning(
-                f"Data de emissão ausente para NFe {chave_acesso}, usando data atual como fallback")
-
-        valor_total = nfe_data.get('value', 0)
-        cnpj_emitente = nfe_data.get('cnpj_sender', '')
-        nome_emitente = nfe_data.get('sender_name', '')
-        cnpj_destinatario = nfe_data.get('cnpj_receiver', '')
-        nome_destinatario = nfe_data.get('receiver_name', '')
-        xml_data = nfe_data.get('xml', '')
-
-        # 4. Persistência no banco de dados
-        # Verificar se a NFe já existe no banco
-        cursor.execute(
-            "SELECT id FROM nf_notas WHERE chave_acesso = %s", (chave_acesso,))
-        resultado = cursor.fetchone()
-
-        if resultado:
-            # Atualizar NFe existente
-            cursor.execute("""
-                UPDATE nf_notas SET 
-                numero_nf = %s,
-                data_emissao = %s, 
-                valor_total = %s, 
-                cnpj_emitente = %s, 
-                nome_emitente = %s, 
-                cnpj_destinatario = %s, 
-                nome_destinatario = %s, 
-                status_processamento = 'atualizado',
-                data_atualizacao = NOW(),
-                observacoes = %s
-                WHERE chave_acesso = %s
-            """, (
-                numero_nf,
-                data_emissao,
-                valor_total,
-                cnpj_emitente,
-                nome_emitente,
-                cnpj_destinatario,
-                nome_destinatario,
-                'Atualizado em ' + datetime.now().strftime('%d/%m/%Y %H:%M:%S'),
-                chave_acesso
-            ))
-
-            nfe_id = resultado['id']
-
-            # Remover itens antigos
-            cursor.execute("DELETE FROM nf_itens WHERE nf_id = %s", (nfe_id,))
-
-            logger.info(f"NFe {chave_acesso} atualizada com sucesso")
-
-            # 5. Processamento de itens
-            # Processar itens da NFe
-            itens = nfe_data.get('items', [])
-            for item in itens:
-                codigo = item.get('code', '')
-                descricao = item.get('description', '')
-                quantidade = item.get('quantity', 0)
-                valor_unitario = item.get('unit_value', 0)
-                valor_total_item = item.get('total_value', 0)
-
-                cursor.execute("""
-                    INSERT INTO nf_itens (
-                        nf_id, codigo, descricao, quantidade,
-                        valor_unitario, valor_total
-                    ) VALUES (%s, %s, %s, %s, %s, %s)
-                """, (nfe_id, codigo, descricao, quantidade,
-                      valor_unitario, valor_total_item))
+    cursor = None
+    try:
+        cursor = connection.cursor(dictionary=True)
 
-            connection.commit()
-            return 'atualizado'
+        # 2. Persistência no banco de dados
+        if hash_conteudo:
+            nfe_data['hash_conteudo'] = hash_conteudo
+        resultado = salvar_nfe(cursor, nfe_data)
+        if resultado == 'erro':
+            connection.rollback()
         else:
-            # Inserir nova NFe
-            cursor.execute("""
-                INSERT INTO nf_notas (
-                    chave_acesso, numero_nf, data_emissao, valor_total, cnpj_emitente, 
-                    nome_emitente, cnpj_destinatario, nome_destinatario, 
-                    xml_data, status_processamento, data_importacao, observacoes
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW(), %s)
-            """, (
-                chave_acesso,
-                numero_nf,
-                data_emissao,
-                valor_total,
-                cnpj_emitente,
-                nome_emitente,
-                cnpj_destinatario,
-                nome_destinatario,
-                xml_data,
-                'importado',
-                'Importado em ' + datetime.now().strftime('%d/%m/%Y %H:%M:%S')
-            ))
-
-            # Obter o ID da NFe inserida
-            nfe_id = cursor.lastrowid
-
-            logger.info(f"NFe {chave_acesso} inserida com sucesso")
-
-            # 5. Processamento de itens
-        # Processar itens da NFe
-        itens = nfe_data.get('items', [])
-        for item in itens:
-            codigo = item.get('code', '')
-            descricao = item.get('description', '')
-            quantidade = item.get('quantity', 0)
-            valor_unitario = item.get('unit_value', 0)
-            valor_total_item = item.get('total_value', 0)
-
-            cursor.execute("""
-                INSERT INTO nf_itens (
-                    nf_id, codigo, descricao, quantidade, 
-                    valor_unitario, valor_total
-                ) VALUES (%s, %s, %s, %s, %s, %s)
-            """, (nfe_id, codigo, descricao, quantidade,
-                  valor_unitario, valor_total_item))
-
-        connection.commit()
-        return 'novo'
+            connection.commit()
+            if cache is not None:
+                cache.registrar(nfe_data.get('access_key'),
+                                nfe_data.get('hash_conteudo'))
+        return resultado
     except Exception as e:
         logger.error(f"Erro ao processar NFe: {str(e)}", exc_info=True)
-        if connection:
-            connection.rollback()
+        connection.rollback()
         return 'erro'
     finally:
-        if connection and hasattr(connection, 'is_connected') and connection.is_connected():
+        if cursor:
             cursor.close()
-            connection.close()
+        connection.close()
 
 # Rota principal - dashboard de importação
 
@@ -963,36 +690,30 @@ def index():
         try:
             cursor = connection.cursor(dictionary=True)
 
-            # Total de notas importadas
-            cursor.execute("SELECT COUNT(*) as total FROM nf_notas")
-            result = cursor.fetchone()
-            estatisticas['total_notas'] = result['total'] if result else 0
-
-            # Total de notas importadas hoje
-            cursor.execute(
-                "SELECT COUNT(*) as total FROM nf_notas WHERE DATE(data_importacao) = CURDATE()")
-            result = cursor.fetchone()
-            estatisticas['notas_hoje'] = result['total'] if result else 0
-
-            # Valor total das notas
-            cursor.execute(
-                "SELECT COALESCE(SUM(valor_total), 0) as total FROM nf_notas")
-            result = cursor.fetchone()
-            estatisticas['valor_total'] = float(
-                result['total']) if result else 0
-
-            # Total de fornecedores únicos
-            cursor.execute(
-                "SELECT COUNT(DISTINCT cnpj_emitente) as total FROM nf_notas")
+            # Estatísticas gerais a partir do resumo diário (nf_resumo_diario)
+            cursor.execute("""
+                SELECT
+                    CAST(COALESCE(SUM(total_notas), 0) AS SIGNED) as total_notas,
+                    CAST(COALESCE(SUM(CASE WHEN dia_importacao = CURDATE()
+                                           THEN total_notas END), 0) AS SIGNED) as notas_hoje,
+                    COALESCE(SUM(valor_total), 0) as valor_total,
+                    COUNT(DISTINCT CASE WHEN total_notas > 0 THEN cnpj_emitente END) as fornecedores
+                FROM nf_resumo_diario
+            """)
             result = cursor.fetchone()
-            estatisticas['fornecedores'] = result['total'] if result else 0
+            if result:
+                estatisticas['total_notas'] = result['total_notas']
+                estatisticas['notas_hoje'] = result['notas_hoje']
+                estatisticas['valor_total'] = float(result['valor_total'])
+                estatisticas['fornecedores'] = result['fornecedores']
 
             # Dados para o gráfico de importações por dia
             cursor.execute("""
-                SELECT DATE(data_importacao) as data, COUNT(*) as total
-                FROM nf_notas
-                WHERE data_importacao >= DATE_SUB(CURDATE(), INTERVAL 7 DAY)
-                GROUP BY DATE(data_importacao)
+                SELECT dia_importacao as data, CAST(SUM(total_notas) AS SIGNED) as total
+                FROM nf_resumo_diario
+                WHERE dia_importacao >= DATE_SUB(CURDATE(), INTERVAL 7 DAY)
+                GROUP BY dia_importacao
+                HAVING total > 0
                 ORDER BY data
             """)
             for row in cursor.fetchall():
@@ -1001,9 +722,10 @@ def index():
 
             # Dados para o gráfico de status
             cursor.execute("""
-                SELECT status_processamento as status, COUNT(*) as total
-                FROM nf_notas
+                SELECT status_processamento as status, CAST(SUM(total_notas) AS SIGNED) as total
+                FROM nf_resumo_diario
                 GROUP BY status_processamento
+                HAVING total > 0
             """)
             for row in cursor.fetchall():
                 if row['status'] == 'SUCESSO':
@@ -1039,24 +761,30 @@ def importar():
     if request.method == 'POST':
         dias = int(request.form.get('dias', 30))
         cnpj = request.form.get('cnpj', '')
+        reiniciar = bool(request.form.get('reiniciar'))
 
-        # Buscar notas fiscais
-        resultado = buscar_nfes_arquivei(
-            dias_atras=dias, cnpj=cnpj if cnpj else None)
-
-        if resultado and 'data' in resultado:
-            notas = resultado['data']
-            total_importadas = 0
+        # Buscar as notas novas desde a última sincronização
+        resultados = novos_resultados()
+        cache = CacheHashNfe()
+        metricas = MetricasImportacao()
 
-            for nfe in notas:
-                if processar_e_salvar_nfe(nfe):
-                    total_importadas += 1
+        def processar_pagina(documentos):
+            status_documentos = processar_pagina_arquivei(documentos, cache)
+            for status in status_documentos:
+                contabilizar(resultados, status)
+            resultados.update(metricas.resultados_itens())
+            return status_documentos
 
-            flash(
-                f'Importação concluída. {total_importadas} nota(s) fiscal(is) importada(s).', 'success')
-        else:
-            flash(
-                'Erro ao importar notas fiscais. Verifique os logs para mais detalhes.', 'danger')
+        try:
+            with ativar_metricas(metricas):
+                SincronizadorArquivei().sincronizar(
+                    processar_pagina, cnpj=cnpj or None, dias_atras=dias, reiniciar=reiniciar)
+            flash(resumo_resultados(resultados), 'success')
+        except (ErroArquivei, requests.RequestException) as e:
+            logger.error(f"Erro na sincronização com a Arquivei: {str(e)}")
+            flash('Erro ao importar notas fiscais. Verifique os logs para mais detalhes. '
+                  + resumo_resultados(resultados), 'danger')
+        metricas.registrar_log(origem='arquivei', **resultados)
 
         # Renderizar template para ambos GET e POST
     return render_template('importacao_nf/importar.html', form=form)
@@ -1069,135 +797,301 @@ def importar_xml():
     if 'usuario_id' not in session:
         return redirect(url_for('login'))
 
-    # Verificar token CSRF para requisições POST
     if request.method == 'POST':
-        logger.info(f"Método: {request.method}")
-        logger.info(f"Headers: {request.headers}")
-        logger.info(f"Form: {request.form}")
-        logger.info(f"Files: {request.files}")
-
-        if 'files[]' not in request.files:
-            flash('Nenhum arquivo selecionado', 'danger')
-            return redirect(request.url)
-
-        files = request.files.getlist('files[]')
-
-        if not files or all(file.filename == '' for file in files):
-            flash('Nenhum arquivo selecionado', 'danger')
-            return redirect(request.url)
-
-        # Criar diretório temporário para processar os arquivos
-        temp_dir = tempfile.mkdtemp()
+        assincrono = current_app.config.get('NF_IMPORTACAO_ASSINCRONA', False)
+
+        # Diretório do job (modo assíncrono) ou temporário (modo síncrono)
+        temp_dir = criar_diretorio_job() if assincrono else tempfile.mkdtemp()
+        manter_diretorio = False
+        metricas = MetricasImportacao()
+        # O corpo é lido em streaming (a rota é isenta do CSRFProtect, que
+        # leria o formulário inteiro antes): o token é validado aqui
+        receptor = ReceptorUpload(request.environ, temp_dir,
+                                  validar_campos=_validar_csrf_upload)
         try:
-            processados = 0
-            novos = 0
-            atualizados = 0
-            erros = 0
-
-            # Reduzir o tamanho do lote para processar menos arquivos por vez
-            # e evitar o erro "Request Entity Too Large"
-            lote_size = 3  # Reduzido de 5 para 3 arquivos por vez
-
-            # Dividir os arquivos em lotes menores para processamento
-            for i in range(0, len(files), lote_size):
-                lote_atual = files[i:i+lote_size]
-                logger.info(
-                    f"Processando lote {i//lote_size + 1} de {(len(files) + lote_size - 1)//lote_size}")
+            if assincrono:
+                arquivos = list(receptor.arquivos())
+                for categoria, texto in receptor.avisos:
+                    flash(texto, categoria)
+                if not arquivos:
+                    flash('Nenhum arquivo selecionado', 'danger')
+                    return redirect(request.url)
+
+                job_id = criar_job(session.get('usuario_id'), temp_dir,
+                                   [os.path.basename(caminho) for _, caminho in arquivos])
+                if job_id:
+                    manter_diretorio = True
+                    if request.accept_mimetypes.best == 'application/json':
+                        return jsonify({
+                            'job_id': job_id,
+                            'status_url': url_for('importacao_nf.status_importacao_xml', job_id=job_id)
+                        }), 202
+
+                    flash(
+                        f'Arquivos recebidos. A importação #{job_id} está sendo processada em segundo plano.', 'info')
+                    return redirect(url_for('importacao_nf.importar_xml', job_id=job_id))
 
-                for file in lote_atual:
-                    if file.filename == '':
-                        continue
-
-                    filename = secure_filename(file.filename)
-                    file_path = os.path.join(temp_dir, filename)
+                logger.warning(
+                    "Não foi possível enfileirar a importação, processando na requisição")
+                resultados, avisos = processar_arquivos_importacao(
+                    arquivos, temp_dir, metricas=metricas)
+            else:
+                # Cada arquivo é processado assim que termina de chegar
+                resultados, avisos = processar_durante_recepcao(
+                    receptor, temp_dir, metricas)
+                avisos = receptor.avisos + avisos
+                if not receptor.recebidos and not receptor.avisos:
+                    flash('Nenhum arquivo selecionado', 'danger')
+                    return redirect(request.url)
 
-                    try:
-                        # Salvar o arquivo em disco para processamento
-                        file.save(file_path)
-                        logger.info(f"Arquivo salvo: {file_path}")
-
-                        # Verificar o tamanho do arquivo
-                        file_size = os.path.getsize(file_path)
-                        logger.info(
-                            f"Tamanho do arquivo {filename}: {file_size/1024:.2f} KB")
-
-                        # Processar arquivo com base na extensão
-                        if filename.lower().endswith('.xml'):
-                            # Processar arquivo XML individualmente
-                            resultado = processar_arquivo_xml(file_path)
-                            processados += 1
-                            if resultado == 'novo':
-                                novos += 1
-                                logger.info(
-                                    f"Arquivo {filename} processado como NOVO")
-                            elif resultado == 'atualizado':
-                                atualizados += 1
-                                logger.info(
-                                    f"Arquivo {filename} processado como ATUALIZADO")
-                            else:
-                                erros += 1
-                                logger.warning(
-                                    f"Erro ao processar arquivo {filename}")
-
-                        elif filename.lower().endswith('.zip'):
-                            # Processar arquivo ZIP (extrai XMLs internos)
-                            # Primeiro verificar o tamanho do ZIP
-                            if file_size > 20 * 1024 * 1024:  # 20 MB
-                                logger.warning(
-                                    f"Arquivo ZIP muito grande: {file_size/1024/1024:.2f} MB. Processando em modo otimizado")
-                                # Para arquivos muito grandes, usar método otimizado
-                                zip_resultados = processar_arquivo_zip_otimizado(
-                                    file_path, temp_dir)
-                            else:
-                                # Para arquivos menores, usar método padrão
-                                zip_resultados = processar_arquivo_zip(
-                                    file_path, temp_dir)
-
-                            processados += zip_resultados['processados']
-                            novos += zip_resultados['novos']
-                            atualizados += zip_resultados['atualizados']
-                            erros += zip_resultados['erros']
-                            logger.info(
-                                f"ZIP {filename} processado: {zip_resultados['processados']} arquivos")
-
-                        else:
-                            flash(
-                                f'Tipo de arquivo não suportado: {filename}', 'warning')
-                            logger.warning(
-                                f"Tipo de arquivo não suportado: {filename}")
-                            continue
-
-                    except Exception as e:
-                        logger.error(
-                            f"Erro ao processar arquivo {filename}: {str(e)}", exc_info=True)
-                        erros += 1
-                        flash(
-                            f'Erro ao processar {filename}: {str(e)}', 'danger')
-
-                # Liberar memória entre lotes
-                import gc
-                gc.collect()
+            for categoria, texto in avisos:
+                flash(texto, categoria)
 
             # Resultado final
-            mensagem = f'Processamento concluído: {processados} arquivos processados ({novos} novos, {atualizados} atualizados, {erros} erros)'
+            mensagem = resumo_resultados(resultados)
             logger.info(mensagem)
-            flash(mensagem, 'success' if erros == 0 else 'warning')
+            metricas.registrar_log(origem='upload', **resultados)
+            flash(mensagem, 'success' if resultados['erros'] == 0 else 'warning')
 
+        except ErroUpload as e:
+            logger.warning(f"Upload recusado: {str(e)}")
+            flash(str(e), 'danger')
         except Exception as e:
             logger.error(
                 f"Erro durante o processamento de arquivos: {str(e)}", exc_info=True)
             flash(
                 f'Erro durante o processamento de arquivos: {str(e)}', 'danger')
         finally:
-            # Limpar diretório temporário
-            shutil.rmtree(temp_dir, ignore_errors=True)
+            # Limpar diretório temporário (o do job fica para o worker)
+            if not manter_diretorio:
+                shutil.rmtree(temp_dir, ignore_errors=True)
 
         return redirect(url_for('importacao_nf.importar_xml'))
 
-    return render_template('importacao_nf/importar_xml.html')
+    return render_template('importacao_nf/importar_xml.html',
+                           job_id=request.args.get('job_id', type=int),
+                           limite_arquivo_mb=LIMITE_ARQUIVO // MB)
+
+# Rota para acompanhar uma importação em segundo plano
+
+
+@mod_importacao_nf.route('/importar_xml/status/<int:job_id>')
+def status_importacao_xml(job_id):
+    if 'usuario_id' not in session:
+        return jsonify({'error': 'Não autorizado'}), 401
+
+    # Só quem enviou os arquivos (ou um administrador) acompanha o job; para os
+    # demais ele não existe, sem revelar que o ID é válido
+    job = obter_job(job_id)
+    if not job or (job['usuario_id'] != session['usuario_id']
+                   and session.get('cargo') != 'admin'):
+        return jsonify({'error': 'Importação não encontrada'}), 404
+
+    # Converter datas para string para permitir serialização em JSON
+    for campo in ('criado_em', 'iniciado_em', 'atualizado_em', 'finalizado_em'):
+        if job.get(campo) is not None:
+            job[campo] = job[campo].strftime('%Y-%m-%d %H:%M:%S')
+    job['metricas'] = json.loads(job['metricas']) if job.get('metricas') else None
+
+    return jsonify(job)
 
 
-def processar_arquivo_xml(file_path):
+def _validar_csrf_upload(campos):
+    """Valida o token CSRF recebido no upload em streaming (campo ou cabeçalho)"""
+    try:
+        validate_csrf(campos.get('csrf_token') or request.headers.get('X-CSRFToken'))
+    except ValidationError:
+        raise ErroUpload(
+            'Sessão expirada ou token de segurança inválido. Recarregue a página e envie novamente.')
+
+
+def processar_durante_recepcao(receptor, temp_dir, metricas=None):
+    """
+    Processa os arquivos de um upload em uma thread à parte, à medida que o
+    ReceptorUpload termina de receber cada um nesta thread
+    (`metricas`: MetricasImportacao opcional, como em processar_arquivos_importacao)
+
+    Returns:
+        tuple: (resultados, avisos) como em processar_arquivos_importacao
+    """
+    fila = queue.Queue()
+    erro_recepcao = None
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        futuro = executor.submit(
+            processar_arquivos_importacao, iter(fila.get, None), temp_dir, None, metricas)
+        try:
+            for arquivo in receptor.arquivos():
+                fila.put(arquivo)
+        except ErroUpload as e:
+            # Os arquivos já recebidos continuam sendo processados
+            erro_recepcao = e
+        finally:
+            fila.put(None)
+        resultados, avisos = futuro.result()
+
+    if erro_recepcao:
+        avisos.append(('danger', str(erro_recepcao)))
+    return resultados, avisos
+
+
+def novos_resultados():
+    """Contadores zerados de uma importação"""
+    return dict.fromkeys(CAMPOS_CONTADORES, 0)
+
+
+def contabilizar(resultados, resultado):
+    """Soma o status de uma nota ('novo', 'atualizado', 'inalterado' ou 'erro') aos contadores"""
+    resultados['processados'] += 1
+    resultados[CONTADOR_POR_STATUS.get(resultado, 'erros')] += 1
+
+
+def processar_arquivos_importacao(arquivos, temp_dir, progresso=None, metricas=None):
+    """
+    Processa uma lista de arquivos XML/ZIP já gravados em disco.
+    Usado tanto pela rota de upload quanto pelos workers da fila de importação.
+
+    Args:
+        arquivos: Lista de tuplas (nome_arquivo, caminho)
+        temp_dir: Diretório de trabalho para extração dos ZIPs
+        progresso: Callback opcional chamado com (resultados_parciais, arquivo_atual)
+        metricas: MetricasImportacao que recebe os tempos por arquivo e por etapa
+            (opcional; sem ele os tempos não são medidos)
+
+    Returns:
+        tuple: (resultados, avisos) onde avisos é uma lista de (categoria, mensagem)
+    """
+    resultados = novos_resultados()
+    avisos = []
+    # Hashes já gravados, compartilhados entre todos os arquivos da importação
+    cache = CacheHashNfe()
+
+    def notificar(filename, parcial=None):
+        if not progresso:
+            return
+        atual = dict(resultados)
+        if parcial:
+            for chave in atual:
+                atual[chave] += parcial.get(chave, 0)
+        progresso(atual, filename)
+
+    with ativar_metricas(metricas):
+        for filename, file_path in arquivos:
+            inicio = perf_counter()
+            processados = resultados['processados']
+            file_size = None
+            try:
+                file_size = os.path.getsize(file_path)
+                notificar(filename)
+
+                # Processar arquivo com base na extensão
+                if filename.lower().endswith('.xml'):
+                    # Processar arquivo XML individualmente
+                    resultado = processar_arquivo_xml(file_path, cache)
+                    contabilizar(resultados, resultado)
+                    if resultado == 'erro':
+                        logger.warning(f"Erro ao processar arquivo {filename}")
+                    else:
+                        logger.debug(f"Arquivo {filename} processado: {resultado}")
+
+                elif filename.lower().endswith('.zip'):
+                    # Processar arquivo ZIP (extrai XMLs internos)
+                    def progresso_zip(parcial, filename=filename):
+                        notificar(filename, parcial)
+
+                    if file_size > 20 * 1024 * 1024:  # 20 MB
+                        logger.warning(
+                            f"Arquivo ZIP muito grande: {file_size/1024/1024:.2f} MB. Processando em modo otimizado")
+                        # Para arquivos muito grandes, usar método otimizado
+                        zip_resultados = processar_arquivo_zip_otimizado(
+                            file_path, temp_dir, progresso=progresso_zip, cache=cache)
+                    else:
+                        # Para arquivos menores, usar método padrão
+                        zip_resultados = processar_arquivo_zip(
+                            file_path, temp_dir, progresso=progresso_zip, cache=cache)
+
+                    for chave in resultados:
+                        resultados[chave] += zip_resultados[chave]
+                    logger.info(
+                        f"ZIP {filename} processado: {zip_resultados['processados']} arquivos")
+
+                else:
+                    avisos.append(
+                        ('warning', f'Tipo de arquivo não suportado: {filename}'))
+                    logger.warning(f"Tipo de arquivo não suportado: {filename}")
+
+            except Exception as e:
+                logger.error(
+                    f"Erro ao processar arquivo {filename}: {str(e)}", exc_info=True)
+                resultados['erros'] += 1
+                avisos.append(
+                    ('danger', f'Erro ao processar {filename}: {str(e)}'))
+            finally:
+                if metricas is not None:
+                    metricas.registrar_arquivo(filename, file_size, perf_counter() - inicio,
+                                               resultados['processados'] - processados)
+
+    notificar(None)
+    if metricas is not None:
+        resultados.update(metricas.resultados_itens())
+    if resultados['novos'] or resultados['atualizados']:
+        invalidar_cache(CACHE_RELATORIOS_NF)
+    return resultados, avisos
+
+
+def ler_conteudo_xml(dados, origem):
+    """
+    Decodifica o conteúdo bruto de um arquivo XML tentando primeiro a
+    codificação declarada (BOM ou prólogo) e depois as codificações padrão.
+    Arquivos em disco e membros lidos direto do ZIP geram o mesmo texto.
+
+    Args:
+        dados: Conteúdo do arquivo em bytes
+        origem: Caminho ou nome do arquivo (apenas para log)
+
+    Returns:
+        str: Conteúdo XML decodificado ou None se não parecer XML
+    """
+    xml_content = None
+    encodings = codificacoes_candidatas(dados)
+
+    for encoding in encodings:
+        try:
+            xml_content = decodificar_bytes_xml(dados, encoding)
+
+            # Verificação básica se o conteúdo parece ser XML
+            if xml_content and ('<' in xml_content[:100]):
+                logger.debug(
+                    f"Arquivo lido com sucesso usando codificação {encoding}")
+                return xml_content
+            else:
+                xml_content = None
+        except Exception as e:
+            logger.warning(
+                f"Falha ao ler com codificação {encoding}: {str(e)}")
+            continue
+
+    logger.error(f"Não foi possível ler o arquivo como texto: {origem}")
+    # Tentar decodificar manualmente em último caso
+    for enc in encodings:
+        try:
+            xml_content = dados.decode(enc)
+            if '<' in xml_content[:100]:
+                logger.debug(
+                    f"Arquivo decodificado como binário usando {enc}")
+                break
+        except:
+            pass
+
+    if not xml_content:
+        logger.error(f"Conteúdo não é XML válido: {origem}")
+        # Mostrar primeiros bytes para diagnóstico
+        logger.error(f"Primeiros bytes: {dados[:100]}")
+        return None
+
+    return xml_content
+
+
+def processar_arquivo_xml(file_path, cache=None):
     """Processa um único arquivo XML e salva no banco de dados."""
     try:
         # Verificar se o arquivo existe
@@ -1214,183 +1108,226 @@ def processar_arquivo_xml(file_path):
         logger.debug(
             f"Processando arquivo XML: {file_path} (Tamanho: {file_size} bytes)")
 
-        # Tentar diferentes codificações
-        xml_content = None
-        encodings = ['utf-8', 'latin1', 'iso-8859-1', 'cp1252']
-
-        for encoding in encodings:
-            try:
-                with open(file_path, 'r', encoding=encoding, errors='ignore') as f:
-                    xml_content = f.read()
+        with etapa('leitura'), open(file_path, 'rb') as f:
+            dados = f.read()
+        return processar_conteudo_arquivo_xml(dados, file_path, cache)
 
-                # Verificação básica se o conteúdo parece ser XML
-                if xml_content and ('<' in xml_content[:100]):
-                    logger.debug(
-                        f"Arquivo lido com sucesso usando codificação {encoding}")
-                    break
-                else:
-                    xml_content = None
-            except Exception as e:
-                logger.warning(
-                    f"Falha ao ler com codificação {encoding}: {str(e)}")
-                continue
+    except Exception as e:
+        logger.error(
+            f"Erro ao processar arquivo XML {file_path}: {str(e)}", exc_info=True)
+        return 'erro'
 
-        # Se não conseguiu ler o arquivo com nenhuma codificação
-        if not xml_content:
-            logger.error(
-                f"Não foi possível ler o arquivo como texto: {file_path}")
-            # Tentar ler como binário em último caso
-            try:
-                with open(file_path, 'rb') as f:
-                    binary_content = f.read()
-                    # Tentar decodificar manualmente
-                    for enc in encodings:
-                        try:
-                            xml_content = binary_content.decode(enc)
-                            if '<' in xml_content[:100]:
-                                logger.debug(
-                                    f"Arquivo decodificado como binário usando {enc}")
-                                break
-                        except:
-                            pass
-            except Exception as e:
-                logger.error(f"Falha também ao ler como binário: {str(e)}")
 
-            if not xml_content:
-                logger.error(f"Conteúdo não é XML válido: {file_path}")
-                # Mostrar primeiros bytes para diagnóstico
-                try:
-                    with open(file_path, 'rb') as f:
-                        first_bytes = f.read(100)
-                    logger.error(f"Primeiros bytes: {first_bytes}")
-                except:
-                    pass
-                return 'erro'
+def processar_conteudo_arquivo_xml(dados, origem, cache=None):
+    """
+    Processa o conteúdo (bytes) de um arquivo XML e salva no banco de dados.
+    Conteúdo idêntico ao já importado para a mesma chave é ignorado antes do parse.
 
-        # Log para diagnóstico
-        logger.debug(f"Primeiros 100 caracteres do XML: {xml_content[:100]}")
+    Args:
+        dados: Conteúdo do arquivo em bytes
+        origem: Caminho ou nome do arquivo (apenas para log)
+        cache: CacheHashNfe da importação (opcional)
 
-        # Processar o conteúdo XML com a função existente
-        resultado = processar_e_salvar_nfe(xml_content)
-        return resultado
+    Returns:
+        str: 'novo', 'atualizado', 'inalterado' ou 'erro'
+    """
+    if not dados:
+        logger.error(f"Arquivo vazio: {origem}")
+        return 'erro'
 
-    except Exception as e:
-        logger.error(
-            f"Erro ao processar arquivo XML {file_path}: {str(e)}", exc_info=True)
+    cache = cache if cache is not None else CacheHashNfe()
+    with etapa('deduplicacao'):
+        hash_conteudo = hash_conteudo_xml(dados)
+        inalterada = cache.inalterada(chave_acesso_rapida(dados), hash_conteudo)
+    if inalterada:
+        logger.debug(f"Conteúdo já importado, ignorando: {origem}")
+        return 'inalterado'
+
+    with etapa('decodificacao'):
+        xml_content = ler_conteudo_xml(dados, origem)
+    if not xml_content:
         return 'erro'
 
+    # Log para diagnóstico
+    logger.debug(f"Primeiros 100 caracteres do XML: {xml_content[:100]}")
 
-def processar_arquivo_zip(zip_path, temp_dir):
-    """Extrai e processa os arquivos XML de um arquivo ZIP."""
-    resultados = {
-        'processados': 0,
-        'novos': 0,
-        'atualizados': 0,
-        'erros': 0
-    }
+    # Processar o conteúdo XML com a função existente
+    return processar_e_salvar_nfe(xml_content, hash_conteudo, cache)
 
-    try:
-        extract_dir = os.path.join(temp_dir, 'extracted')
-        os.makedirs(extract_dir, exist_ok=True)
 
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            # Extrai apenas arquivos XML
-            for item in zip_ref.infolist():
-                if item.filename.lower().endswith('.xml'):
-                    zip_ref.extract(item, extract_dir)
+def _preparar_nfe_membro(nome, dados, hash_conteudo=None):
+    """
+    Etapa de parse executada nos processos do pool: decodifica e extrai os
+    dados de um XML lido do ZIP. Não acessa o banco de dados.
 
-                    # Processar cada arquivo XML extraído
-                    xml_path = os.path.join(extract_dir, item.filename)
-                    try:
-                        resultado = processar_arquivo_xml(xml_path)
-                        resultados['processados'] += 1
+    Returns:
+        dict: Dados da NF-e ou None se o conteúdo não for um XML válido
+    """
+    if not dados:
+        logger.error(f"Arquivo vazio: {nome}")
+        return None
 
-                        if resultado == 'novo':
-                            resultados['novos'] += 1
-                        elif resultado == 'atualizado':
-                            resultados['atualizados'] += 1
-                        else:
-                            resultados['erros'] += 1
+    with etapa('decodificacao'):
+        xml_content = ler_conteudo_xml(dados, nome)
+    if not xml_content:
+        return None
 
-                    except Exception as e:
-                        logger.error(
-                            f"Erro ao processar XML extraído {xml_path}: {str(e)}")
-                        resultados['erros'] += 1
+    with etapa('parse'):
+        nfe_data = extrair_nfe_de_conteudo(xml_content)
+    if nfe_data:
+        nfe_data['hash_conteudo'] = hash_conteudo or hash_conteudo_xml(dados)
+        # Comprime aqui, no pool: menos dados devolvidos ao escritor e menos CPU nele
+        with etapa('compressao'):
+            nfe_data['xml_comprimido'] = comprimir_xml(nfe_data.pop('xml', ''))
+    return nfe_data
 
-        return resultados
-    except Exception as e:
-        logger.error(f"Erro ao processar arquivo ZIP {zip_path}: {str(e)}")
-        return resultados
 
+def _preparar_nfe_membro_medido(nome, dados, hash_conteudo=None, medir=False):
+    """
+    _preparar_nfe_membro com os tempos das etapas medidos no próprio processo
+    do pool, para serem somados às métricas da importação pelo escritor
 
-def processar_arquivo_zip_otimizado(zip_path, temp_dir):
+    Returns:
+        tuple: (dados da NF-e ou None, tempos por etapa ou None)
     """
-    Versão otimizada para extrair e processar XMLs de arquivos ZIP muito grandes
-    Faz a extração e processamento de forma mais eficiente para grandes volumes
+    if not medir:
+        return _preparar_nfe_membro(nome, dados, hash_conteudo), None
+    metricas = MetricasImportacao()
+    with ativar_metricas(metricas):
+        return _preparar_nfe_membro(nome, dados, hash_conteudo), metricas.etapas
+
+
+def habilitar_parse_em_processos():
     """
-    resultados = {
-        'processados': 0,
-        'novos': 0,
-        'atualizados': 0,
-        'erros': 0
-    }
+    Permite o pool de processos no parse dos ZIPs neste processo. Chamado
+    apenas pelos workers da fila: no processo web (requisições e thread de
+    recebimento) cada importação criaria seu próprio pool ao lado do pool
+    de conexões
+    """
+    global _parse_em_processos
+    _parse_em_processos = True
 
-    try:
-        extract_dir = os.path.join(temp_dir, 'extracted')
-        os.makedirs(extract_dir, exist_ok=True)
 
-        # Extrair apenas arquivos XML do ZIP
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            # Identificar apenas os arquivos XML dentro do ZIP
+def processos_parse_zip():
+    """Número de processos usados no parse dos XMLs de um ZIP (1 = sequencial)"""
+    # Processos daemon (ex.: workers de alguns servidores WSGI) não podem criar filhos
+    if not _parse_em_processos or multiprocessing.current_process().daemon:
+        return 1
+    return PROCESSOS_PARSE or os.cpu_count() or 1
+
+
+class _ExecutorLocal:
+    """
+    Substituto do ProcessPoolExecutor quando há um único processo de parse:
+    executa cada tarefa no próprio processo e devolve um Future já concluído
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def submit(self, funcao, *args):
+        futuro = Future()
+        try:
+            futuro.set_result(funcao(*args))
+        except Exception as e:
+            futuro.set_exception(e)
+        return futuro
+
+
+def _ler_membros_xml(zip_ref, itens, cache=None):
+    """
+    Lê os membros XML de um ZIP em janelas, pré-carregando no cache os hashes
+    das chaves de cada janela com uma única consulta
+
+    Yields:
+        tuple: (item, dados em bytes)
+    """
+    for inicio in range(0, len(itens), JANELA_PREFETCH):
+        with etapa('leitura'):
+            bloco = [(item, zip_ref.read(item))
+                     for item in itens[inicio:inicio + JANELA_PREFETCH]]
+        if cache is not None:
+            cache.carregar([chave_acesso_rapida(dados) for _, dados in bloco])
+        yield from bloco
+
+
+def processar_arquivo_zip_paralelo(zip_path, workers=None, progresso=None, cache=None):
+    """
+    Processa os XMLs de um ZIP em pipeline: um pool de processos faz o parse
+    dos membros lidos direto do ZipFile e este processo, como escritor único,
+    grava as notas em lotes (uma transação por lote). Com um único processo
+    de parse o parse é feito aqui mesmo, mantendo a gravação em lotes.
+    A ordem de gravação é a mesma do ZIP, então os resultados coincidem com o
+    processamento sequencial. Membros já importados com o mesmo conteúdo
+    (mesmo hash) são contados como inalterados sem passar pelo parse.
+
+    Args:
+        zip_path: Caminho do arquivo ZIP
+        workers: Número de processos de parse (padrão: processos_parse_zip())
+        progresso: Callback opcional chamado com os resultados parciais após cada lote
+        cache: CacheHashNfe compartilhado pela importação (opcional)
+
+    Returns:
+        dict: Contadores de processados, novos, atualizados, inalterados e erros
+    """
+    resultados = novos_resultados()
+    workers = workers or processos_parse_zip()
+    cache = cache if cache is not None else CacheHashNfe()
+    # Limita os XMLs em memória aguardando parse ou gravação
+    max_pendentes = workers * 4
+    notas = []
+    metricas = metricas_atuais()
+
+    def gravar_lote():
+        for resultado in salvar_lote_nfe(notas, cache):
+            contabilizar(resultados, resultado)
+        notas.clear()
+        if progresso:
+            progresso(resultados)
+
+    def coletar(futuro):
+        try:
+            nfe_data, tempos = futuro.result()
+            notas.append(nfe_data)
+            if tempos:
+                metricas.mesclar(tempos)
+        except Exception as e:
+            logger.error(f"Erro no parse de XML do ZIP {zip_path}: {str(e)}")
+            notas.append(None)
+        if len(notas) >= LOTE_GRAVACAO:
+            gravar_lote()
+
+    try:
+        executor_parse = (ProcessPoolExecutor(max_workers=workers)
+                          if workers > 1 else _ExecutorLocal())
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref, executor_parse as executor:
             xml_files = [item for item in zip_ref.infolist()
                          if item.filename.lower().endswith('.xml')]
-
             logger.info(
-                f"Encontrados {len(xml_files)} arquivos XML no arquivo ZIP")
-
-            # Processar em lotes menores para evitar consumo excessivo de memória
-            batch_size = 10
-            for i in range(0, len(xml_files), batch_size):
-                current_batch = xml_files[i:i+batch_size]
-                logger.info(
-                    f"Processando lote {i//batch_size + 1} de {(len(xml_files) + batch_size - 1)//batch_size}")
-
-                # Extrair e processar cada arquivo XML do lote atual
-                for item in current_batch:
-                    if item.filename.lower().endswith('.xml'):
-                        # Extrair apenas este arquivo
-                        zip_ref.extract(item, extract_dir)
-
-                        # Caminho completo do arquivo extraído
-                        xml_path = os.path.join(extract_dir, item.filename)
-
-                        try:
-                            # Processar o XML
-                            resultado = processar_arquivo_xml(xml_path)
-                            resultados['processados'] += 1
-
-                            if resultado == 'novo':
-                                resultados['novos'] += 1
-                            elif resultado == 'atualizado':
-                                resultados['atualizados'] += 1
-                            else:
-                                resultados['erros'] += 1
-
-                            # Remover o arquivo após processamento para economizar espaço
-                            try:
-                                os.remove(xml_path)
-                            except:
-                                pass
+                f"Encontrados {len(xml_files)} arquivos XML no arquivo ZIP ({workers} processos de parse)")
+
+            pendentes = deque()
+            for item, dados in _ler_membros_xml(zip_ref, xml_files, cache):
+                with etapa('deduplicacao'):
+                    hash_conteudo = hash_conteudo_xml(dados)
+                    inalterada = cache.inalterada(chave_acesso_rapida(dados), hash_conteudo)
+                if inalterada:
+                    contabilizar(resultados, 'inalterado')
+                    continue
 
-                        except Exception as e:
-                            logger.error(
-                                f"Erro ao processar XML extraído {xml_path}: {str(e)}", exc_info=True)
-                            resultados['erros'] += 1
+                pendentes.append(executor.submit(
+                    _preparar_nfe_membro_medido, item.filename, dados, hash_conteudo,
+                    metricas is not None))
+                if len(pendentes) >= max_pendentes:
+                    coletar(pendentes.popleft())
 
-                            # Liberar memória entre lotes
-                            import gc
-                            gc.collect()
+            while pendentes:
+                coletar(pendentes.popleft())
 
+        gravar_lote()
         return resultados
     except Exception as e:
         logger.error(
@@ -1398,6 +1335,24 @@ def processar_arquivo_zip_otimizado(zip_path, temp_dir):
         resultados['erros'] += 1
         return resultados
 
+
+def processar_arquivo_zip(zip_path, temp_dir, progresso=None, cache=None):
+    """
+    Lê (sem extrair para o disco) e processa os arquivos XML de um arquivo ZIP.
+    Se informado, `progresso` é chamado com os resultados parciais após cada lote gravado.
+    """
+    return processar_arquivo_zip_paralelo(zip_path, processos_parse_zip(), progresso, cache)
+
+
+def processar_arquivo_zip_otimizado(zip_path, temp_dir, progresso=None, cache=None):
+    """
+    Versão para arquivos ZIP muito grandes. Os membros já são lidos em janelas
+    e gravados em lotes pelo pipeline de processar_arquivo_zip_paralelo, então
+    o processamento é o mesmo de processar_arquivo_zip.
+    """
+    logger.info(f"Processando ZIP grande em lotes de {LOTE_GRAVACAO} notas: {zip_path}")
+    return processar_arquivo_zip_paralelo(zip_path, processos_parse_zip(), progresso, cache)
+
 # Rota para buscar notas fiscais
 
 
@@ -1414,6 +1369,8 @@ def buscar():
     tipo_busca = 'fornecedor'
     data_inicio = ''
     data_fim = ''
+    cursor_pagina = ''
+    proximo_cursor = None
 
     if request.method == 'POST':
         termo_busca = request.form.get('termo', '')
@@ -1421,52 +1378,14 @@ def buscar():
         data_inicio = request.form.get('data_inicio', '')
         data_fim = request.form.get('data_fim', '')
 
-        # Construir a consulta SQL
+        cursor_pagina = request.form.get('cursor', '')
+
         connection = get_db_connection()
         if connection:
             try:
                 cursor = connection.cursor(dictionary=True)
-
-                # Base da consulta SQL
-                base_query = """
-                    SELECT n.*, COUNT(i.id) as total_itens 
-                    FROM nf_notas n 
-                    LEFT JOIN nf_itens i ON n.id = i.nf_id 
-                    WHERE 1=1
-                """
-
-                params = []
-
-                # Adicionar filtro por termo de busca
-                if termo_busca:
-                    if tipo_busca == 'fornecedor':
-                        base_query += " AND (n.nome_emitente LIKE %s OR n.cnpj_emitente LIKE %s)"
-                        params.extend([f'%{termo_busca}%', f'%{termo_busca}%'])
-                    elif tipo_busca == 'destinatario':
-                        base_query += " AND (n.nome_destinatario LIKE %s OR n.cnpj_destinatario LIKE %s)"
-                        params.extend([f'%{termo_busca}%', f'%{termo_busca}%'])
-                    elif tipo_busca == 'descricao':
-                        base_query += " AND n.id IN (SELECT nf_id FROM nf_itens WHERE descricao LIKE %s)"
-                        params.append(f'%{termo_busca}%')
-                    else:  # chave
-                        base_query += " AND n.chave_acesso LIKE %s"
-                        params.append(f'%{termo_busca}%')
-
-                # Adicionar filtro por data de emissão
-                if data_inicio:
-                    base_query += " AND n.data_emissao >= %s"
-                    params.append(data_inicio)
-
-                if data_fim:
-                    base_query += " AND n.data_emissao <= %s"
-                    params.append(data_fim)
-
-                # Finalizar a consulta
-                base_query += " GROUP BY n.id ORDER BY n.data_emissao DESC"
-
-                # Executar a consulta
-                cursor.execute(base_query, params)
-                resultados = cursor.fetchall()
+                resultados, proximo_cursor = buscar_notas(
+                    cursor, termo_busca, tipo_busca, data_inicio, data_fim, cursor_pagina)
 
                 # Converter datas para formato mais amigável
                 for nota in resultados:
@@ -1488,6 +1407,8 @@ def buscar():
                            tipo_busca=tipo_busca,
                            data_inicio=data_inicio,
                            data_fim=data_fim,
+                           cursor_pagina=cursor_pagina,
+                           proximo_cursor=proximo_cursor,
                            form=form)
 
 # Rota para visualizar detalhes da nota fiscal
@@ -1508,7 +1429,8 @@ def visualizar(nf_id):
             cursor = connection.cursor(dictionary=True)
 
             # Buscar dados da nota fiscal
-            cursor.execute("SELECT * FROM nf_notas WHERE id = %s", (nf_id,))
+            cursor.execute(
+                f"SELECT {COLUNAS_NOTA} FROM nf_notas WHERE id = %s", (nf_id,))
             nota = cursor.fetchone()
 
             if nota:
@@ -1532,6 +1454,56 @@ def visualizar(nf_id):
 
     return render_template('importacao_nf/visualizar.html', nota=nota, itens=itens)
 
+# Rota para baixar o XML original da nota fiscal
+
+
+@mod_importacao_nf.route('/visualizar/<int:nf_id>/xml')
+def visualizar_xml(nf_id):
+    if 'usuario_id' not in session:
+        flash('Faça login para acessar o sistema', 'warning')
+        return redirect(url_for('login'))
+
+    connection = get_db_connection()
+    nota = None
+    xml_content = None
+
+    if connection:
+        try:
+            cursor = connection.cursor(dictionary=True)
+
+            # O XML comprimido só é lido (e descomprimido) quando solicitado;
+            # notas ainda não migradas mantêm o texto em nf_notas.xml_data
+            cursor.execute("""
+                SELECT n.chave_acesso, n.xml_data, x.xml_comprimido
+                FROM nf_notas n
+                LEFT JOIN nf_xml x ON x.nf_id = n.id
+                WHERE n.id = %s
+            """, (nf_id,))
+            nota = cursor.fetchone()
+
+            if nota and nota['xml_comprimido'] is not None:
+                xml_content = descomprimir_xml(nota['xml_comprimido'])
+            elif nota:
+                xml_content = nota['xml_data']
+
+            cursor.close()
+        except Exception as e:
+            logger.error(f"Erro ao buscar XML da nota fiscal: {e}")
+            flash(f'Erro ao buscar XML da nota fiscal: {str(e)}', 'danger')
+        finally:
+            connection.close()
+
+    if not xml_content:
+        flash('XML da nota fiscal não encontrado', 'warning')
+        return redirect(url_for('importacao_nf.visualizar', nf_id=nf_id))
+
+    response = current_app.response_class(
+        xml_content, mimetype='application/xml')
+    if request.args.get('download'):
+        response.headers['Content-Disposition'] = (
+            f'attachment; filename=NFe{nota["chave_acesso"]}.xml')
+    return response
+
 # Rota para criar uma solicitação a partir de uma nota fiscal
 
 
@@ -1553,7 +1525,8 @@ def solicitar(nf_id):
             cursor = connection.cursor(dictionary=True)
 
             # Buscar dados da nota fiscal
-            cursor.execute("SELECT * FROM nf_notas WHERE id = %s", (nf_id,))
+            cursor.execute(
+                f"SELECT {COLUNAS_NOTA} FROM nf_notas WHERE id = %s", (nf_id,))
             nota = cursor.fetchone()
 
             if nota:
@@ -1605,9 +1578,12 @@ def api_notas_recentes():
     if 'usuario_id' not in session:
         return jsonify({'error': 'Não autorizado', 'data': []}), 401
 
-    # Obter parâmetros de filtro de data
+    # Obter parâmetros de filtro de data e de paginação
     data_inicio = request.args.get('data_inicio')
     data_fim = request.args.get('data_fim')
+    cursor_pagina = request.args.get('cursor')
+    limite = request.args.get('limite', LIMITE_API_NOTAS, type=int) or LIMITE_API_NOTAS
+    limite = max(1, min(limite, LIMITE_MAXIMO_API_NOTAS))
 
     connection = get_db_connection()
     if not connection:
@@ -1616,38 +1592,13 @@ def api_notas_recentes():
     try:
         cursor = connection.cursor(dictionary=True)
 
-        # Construir a consulta SQL com filtros de data
-        query = """
-            SELECT n.id, n.chave_acesso, n.numero_nf, n.data_emissao, n.valor_total, 
-            n.nome_emitente, n.nome_destinatario, n.status_processamento,
-            n.observacoes,
-            COUNT(i.id) as total_itens
-            FROM nf_notas n
-            LEFT JOIN nf_itens i ON n.id = i.nf_id
-            WHERE 1=1
-        """
-
-        params = []
-
-        # Adicionar filtros de data, se fornecidos
-        if data_inicio:
-            query += " AND DATE(n.data_emissao) >= %s"
-            params.append(data_inicio)
-
-        if data_fim:
-            query += " AND DATE(n.data_emissao) <= %s"
-            params.append(data_fim)
-
-        # Finalizar a consulta
-        query += """
-            GROUP BY n.id
-            ORDER BY n.data_emissao DESC
-            LIMIT 100
-        """
-
-        # Executar a consulta
-        cursor.execute(query, params)
-        notas = cursor.fetchall()
+        # Página seguinte à posição do cursor, na ordem (data_emissao, id) decrescente
+        notas, proximo_cursor = listar_notas(
+            cursor,
+            "n.id, n.chave_acesso, n.numero_nf, n.data_emissao, n.valor_total, "
+            "n.nome_emitente, n.nome_destinatario, n.status_processamento, "
+            "n.observacoes, n.total_itens",
+            data_inicio, data_fim, cursor_pagina, limite)
 
         # Converter objetos datetime para string para permitir serialização em JSON
         for nota in notas:
@@ -1659,13 +1610,11 @@ def api_notas_recentes():
             if 'valor_total' in nota and hasattr(nota['valor_total'], 'as_integer_ratio'):
                 nota['valor_total'] = float(nota['valor_total'])
 
-            if 'total_itens' in nota and hasattr(nota['total_itens'], 'as_integer_ratio'):
-                nota['total_itens'] = float(nota['total_itens'])
-
         cursor.close()
         connection.close()
 
-        return jsonify({'data': notas})
+        return jsonify({'data': notas, 'cursor': cursor_pagina or None,
+                        'proximo_cursor': proximo_cursor})
     except Exception as e:
         logger.error(f"Erro ao buscar notas recentes: {e}")
         if connection:
@@ -1690,10 +1639,32 @@ def api_dados_relatorio():
         return jsonify({'error': 'Não autorizado'}), 401
 
     tipo = request.args.get('tipo', 'mensal')
+    if tipo not in ('mensal', 'fornecedor'):
+        tipo = 'status'
+
+    try:
+        # Invalidado ao final de cada importação que grava notas
+        dados = em_cache(CACHE_RELATORIOS_NF, {'tipo': tipo},
+                         lambda: consultar_dados_relatorio(tipo))
+        return jsonify({'data': dados})
+    except Error as e:
+        logger.error(f"Erro ao buscar dados do relatório: {e}")
+        return jsonify({'error': str(e)}), 500
 
+
+def consultar_dados_relatorio(tipo):
+    """
+    Consulta no resumo diário os dados de um relatório
+
+    Args:
+        tipo: 'mensal', 'fornecedor' ou 'status'
+
+    Returns:
+        list: Linhas do relatório (rotulo/periodo, total_notas, valor_total)
+    """
     connection = get_db_connection()
     if not connection:
-        return jsonify({'error': 'Erro de conexão com o banco de dados'}), 500
+        raise Error('Erro de conexão com o banco de dados')
 
     try:
         cursor = connection.cursor(dictionary=True)
@@ -1702,12 +1673,13 @@ def api_dados_relatorio():
             # Dados mensais
             cursor.execute("""
                 SELECT 
-                    DATE_FORMAT(data_emissao, '%Y-%m') as periodo,
-                    COUNT(*) as total_notas,
+                    DATE_FORMAT(dia_emissao, '%Y-%m') as periodo,
+                    CAST(SUM(total_notas) AS SIGNED) as total_notas,
                     SUM(valor_total) as valor_total
-                FROM nf_notas
-                WHERE data_emissao >= DATE_SUB(CURDATE(), INTERVAL 12 MONTH)
-                GROUP BY DATE_FORMAT(data_emissao, '%Y-%m')
+                FROM nf_resumo_diario
+                WHERE dia_emissao >= DATE_SUB(CURDATE(), INTERVAL 12 MONTH)
+                GROUP BY DATE_FORMAT(dia_emissao, '%Y-%m')
+                HAVING SUM(total_notas) > 0
                 ORDER BY periodo
             """)
         elif tipo == 'fornecedor':
@@ -1715,10 +1687,11 @@ def api_dados_relatorio():
             cursor.execute("""
                 SELECT 
                     nome_emitente as rotulo,
-                    COUNT(*) as total_notas,
+                    CAST(SUM(total_notas) AS SIGNED) as total_notas,
                     SUM(valor_total) as valor_total
-                FROM nf_notas
+                FROM nf_resumo_diario
                 GROUP BY nome_emitente
+                HAVING SUM(total_notas) > 0
                 ORDER BY valor_total DESC
                 LIMIT 10
             """)
@@ -1727,18 +1700,15 @@ def api_dados_relatorio():
             cursor.execute("""
                 SELECT 
                     status_processamento as rotulo,
-                    COUNT(*) as total_notas,
+                    CAST(SUM(total_notas) AS SIGNED) as total_notas,
                     SUM(valor_total) as valor_total
-                FROM nf_notas
+                FROM nf_resumo_diario
                 GROUP BY status_processamento
+                HAVING SUM(total_notas) > 0
             """)
 
         dados = cursor.fetchall()
         cursor.close()
-
-        return jsonify({'data': dados})
-    except Error as e:
-        logger.error(f"Erro ao buscar dados do relatório: {e}")
-        return jsonify({'error': str(e)}), 500
+        return dados
     finally:
         connection.close()
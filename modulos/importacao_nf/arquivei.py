@@ -0,0 +1,218 @@
+"""
+Sincronização incremental de NF-e recebidas pela API Arquivei
+
+A API pagina os documentos por um cursor numérico (posição na lista de
+documentos do cliente). As páginas seguintes ao cursor salvo são buscadas em
+paralelo, com no máximo ARQUIVEI_PAGINAS_SIMULTANEAS requisições em andamento,
+usando uma única requests.Session (conexões HTTP reaproveitadas). O cursor é
+gravado por CNPJ em nf_arquivei_cursor após cada página processada, então a
+próxima execução busca apenas os documentos novos.
+"""
+import os
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils.db import execute_query, get_single_result
+
+logger = logging.getLogger('importacao_xml')
+
+ARQUIVEI_API_ID = os.environ.get('ARQUIVEI_API_ID', 'seu_api_id')
+ARQUIVEI_API_KEY = os.environ.get('ARQUIVEI_API_KEY', 'sua_api_key')
+# Pode apontar para um servidor local de testes
+ARQUIVEI_API_ENDPOINT = os.environ.get(
+    'ARQUIVEI_API_ENDPOINT', 'https://api.arquivei.com.br/v1/nfe/received')
+
+# Documentos por página (máximo aceito pela API: 50)
+ARQUIVEI_LIMITE_PAGINA = int(os.environ.get('ARQUIVEI_LIMITE_PAGINA', 50))
+# Requisições de página em andamento ao mesmo tempo
+ARQUIVEI_PAGINAS_SIMULTANEAS = int(
+    os.environ.get('ARQUIVEI_PAGINAS_SIMULTANEAS', 4))
+# Timeout (segundos) de conexão e leitura de cada requisição
+ARQUIVEI_TIMEOUT = float(os.environ.get('ARQUIVEI_TIMEOUT', 30))
+
+
+class ErroArquivei(Exception):
+    """Falha ao consultar a API Arquivei"""
+
+
+def criar_sessao(conexoes=None, api_id=None, api_key=None):
+    """
+    Cria uma requests.Session com pool de conexões do tamanho da concorrência
+    e novas tentativas automáticas para erros temporários (429/5xx)
+
+    Args:
+        conexoes: Tamanho do pool de conexões HTTP
+        api_id: X-API-ID (padrão: ARQUIVEI_API_ID)
+        api_key: X-API-KEY (padrão: ARQUIVEI_API_KEY)
+
+    Returns:
+        requests.Session: Sessão configurada
+    """
+    conexoes = conexoes or ARQUIVEI_PAGINAS_SIMULTANEAS
+    tentativas = Retry(total=3, backoff_factor=0.5,
+                       status_forcelist=(429, 500, 502, 503, 504),
+                       allowed_methods=frozenset(['GET']))
+    adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=conexoes,
+                            max_retries=tentativas)
+
+    sessao = requests.Session()
+    sessao.mount('https://', adaptador)
+    sessao.mount('http://', adaptador)
+    sessao.headers.update({
+        'Content-Type': 'application/json',
+        'X-API-ID': api_id or ARQUIVEI_API_ID,
+        'X-API-KEY': api_key or ARQUIVEI_API_KEY
+    })
+    return sessao
+
+
+def carregar_cursor(cnpj):
+    """
+    Retorna o estado salvo da sincronização de um CNPJ ('' = todos)
+
+    Returns:
+        dict: {'cursor': ..., 'data_inicial': ...} ou None se nunca sincronizado
+    """
+    return get_single_result("""
+        SELECT cursor_api AS cursor, data_inicial
+        FROM nf_arquivei_cursor
+        WHERE cnpj = %s
+    """, (cnpj,))
+
+
+def salvar_cursor(cnpj, cursor, data_inicial):
+    """Grava o cursor da sincronização de um CNPJ (checkpoint após cada página)"""
+    resultado = execute_query("""
+        INSERT INTO nf_arquivei_cursor (cnpj, cursor_api, data_inicial, atualizado_em)
+        VALUES (%s, %s, %s, NOW())
+        ON DUPLICATE KEY UPDATE cursor_api = VALUES(cursor_api), atualizado_em = NOW()
+    """, (cnpj, cursor, data_inicial))
+    if resultado is None:
+        raise ErroArquivei(f"Não foi possível gravar o cursor do CNPJ '{cnpj}'")
+
+
+def reiniciar_cursor(cnpj):
+    """Descarta o cursor salvo: a próxima sincronização começa do início"""
+    execute_query("DELETE FROM nf_arquivei_cursor WHERE cnpj = %s", (cnpj,))
+
+
+class SincronizadorArquivei:
+    """
+    Busca as páginas de NF-e recebidas a partir do cursor salvo e entrega os
+    documentos de cada página, em ordem, para a função de processamento
+    """
+
+    def __init__(self, endpoint=None, sessao=None, limite=None,
+                 paginas_simultaneas=None, timeout=None):
+        self.endpoint = endpoint or ARQUIVEI_API_ENDPOINT
+        self.limite = limite or ARQUIVEI_LIMITE_PAGINA
+        self.paginas_simultaneas = max(
+            1, paginas_simultaneas or ARQUIVEI_PAGINAS_SIMULTANEAS)
+        self.timeout = timeout or ARQUIVEI_TIMEOUT
+        self.sessao = sessao or criar_sessao(self.paginas_simultaneas)
+
+    def buscar_pagina(self, cursor, data_inicial=None, cnpj=None):
+        """
+        Busca uma página de documentos a partir do cursor informado
+
+        Returns:
+            list: Documentos da página (dicionários com access_key e xml)
+        """
+        params = {'cursor': cursor, 'limit': self.limite}
+        if data_inicial:
+            params['start_date'] = data_inicial
+        if cnpj:
+            params['cnpj'] = cnpj
+
+        response = self.sessao.get(
+            self.endpoint, params=params, timeout=self.timeout)
+        if response.status_code != 200:
+            raise ErroArquivei(
+                f"Erro ao buscar NFes (cursor {cursor}): {response.status_code} - {response.text[:500]}")
+        return response.json().get('data') or []
+
+    def sincronizar(self, processar_pagina, cnpj=None, dias_atras=30, reiniciar=False):
+        """
+        Importa os documentos novos desde a última sincronização do CNPJ
+
+        Args:
+            processar_pagina: Função que recebe a lista de documentos de uma
+                página e retorna a lista de status ('novo', 'atualizado',
+                'inalterado', 'invalido' ou 'erro')
+            cnpj: CNPJ para filtrar os documentos (None = todos)
+            dias_atras: Período inicial, usado apenas na primeira sincronização
+                (o mesmo filtro é mantido nas seguintes para o cursor continuar válido)
+            reiniciar: Descarta o cursor salvo e busca todo o período novamente
+
+        O cursor salvo avança apenas até o primeiro documento com erro
+        transitório ('erro', ex.: falha ao gravar no banco) e a sincronização
+        para nele, então esses documentos são buscados de novo na execução
+        seguinte. Documentos que nunca poderão ser importados ('invalido':
+        Base64 ou XML inválido) são registrados no log e o cursor passa por eles.
+
+        Returns:
+            dict: {'paginas', 'documentos', 'status': [...], 'cursor'}
+        """
+        cnpj = ''.join(filter(str.isdigit, cnpj or ''))
+        if reiniciar:
+            reiniciar_cursor(cnpj)
+
+        estado = carregar_cursor(cnpj)
+        if estado:
+            cursor = int(estado['cursor'])
+            data_inicial = estado['data_inicial']
+            if hasattr(data_inicial, 'strftime'):
+                data_inicial = data_inicial.strftime('%Y-%m-%d')
+        else:
+            cursor = 0
+            data_inicial = (datetime.now() -
+                            timedelta(days=dias_atras)).strftime('%Y-%m-%d')
+
+        logger.info(
+            f"Sincronização Arquivei (CNPJ '{cnpj or 'todos'}') a partir do cursor {cursor}")
+
+        resumo = {'paginas': 0, 'documentos': 0, 'status': [], 'cursor': cursor}
+        with ThreadPoolExecutor(max_workers=self.paginas_simultaneas) as executor:
+            pendentes = deque()
+            proximo = cursor
+            fim = False
+            while not fim:
+                # Mantém até paginas_simultaneas requisições em andamento
+                while len(pendentes) < self.paginas_simultaneas:
+                    pendentes.append((proximo, executor.submit(
+                        self.buscar_pagina, proximo, data_inicial, cnpj or None)))
+                    proximo += self.limite
+
+                inicio, futuro = pendentes.popleft()
+                documentos = futuro.result()
+                # Página incompleta: não há documentos além dela
+                fim = len(documentos) < self.limite
+                if documentos:
+                    status = processar_pagina(documentos)
+                    resumo['status'].extend(status)
+                    resumo['paginas'] += 1
+                    resumo['documentos'] += len(documentos)
+                    # O cursor não passa do primeiro documento com erro transitório:
+                    # a próxima sincronização tenta de novo a partir dele
+                    processados = status.index('erro') if 'erro' in status else len(documentos)
+                    resumo['cursor'] = inicio + processados
+                    salvar_cursor(cnpj, resumo['cursor'], data_inicial)
+                    if processados < len(documentos):
+                        logger.warning(
+                            f"Documento com erro na posição {resumo['cursor']}: sincronização "
+                            f"interrompida, será retomada a partir dele")
+                        fim = True
+
+            for _, futuro in pendentes:
+                futuro.cancel()
+
+        logger.info(
+            f"Sincronização Arquivei concluída: {resumo['documentos']} documento(s) "
+            f"em {resumo['paginas']} página(s), cursor {resumo['cursor']}")
+        return resumo
@@ -0,0 +1,314 @@
+"""
+Busca de notas fiscais pelos índices FULLTEXT de nf_notas e nf_itens
+
+Nomes de emitente/destinatário e descrições de itens são pesquisados com
+MATCH ... AGAINST em modo booleano (todas as palavras obrigatórias, com
+prefixo), ordenados por relevância e paginados. CNPJs e chaves de acesso são
+pesquisados por prefixo, usando os índices B-tree dessas colunas. Os índices
+são mantidos pelo próprio InnoDB a cada gravação da importação
+(ver database/db-update-nf-fulltext.sql).
+
+As listagens sem ordenação por relevância são paginadas por chave
+(data_emissao, id): cada página continua a partir da última nota da anterior,
+sem OFFSET. A quantidade de itens vem de nf_notas.total_itens, gravada na
+importação, sem consultar nf_itens.
+"""
+import os
+import re
+import logging
+from datetime import datetime
+
+logger = logging.getLogger('importacao_xml')
+
+# Colunas de nf_notas usadas nas telas (o XML fica em nf_xml e só é lido sob demanda)
+COLUNAS_NOTA = ('id, chave_acesso, numero_nf, data_emissao, valor_total, '
+                'cnpj_emitente, nome_emitente, cnpj_destinatario, nome_destinatario, '
+                'status_processamento, data_importacao, data_atualizacao, observacoes')
+COLUNAS_NOTA_PREFIXADAS = ', '.join(
+    f'n.{coluna.strip()}' for coluna in COLUNAS_NOTA.split(','))
+
+# Resultados por página da busca
+POR_PAGINA = int(os.environ.get('NF_BUSCA_POR_PAGINA', 50))
+# Palavras menores que innodb_ft_min_token_size não entram no índice FULLTEXT
+TAMANHO_MINIMO_PALAVRA = int(os.environ.get('NF_BUSCA_TAMANHO_MINIMO_PALAVRA', 3))
+
+# Coluna de nome (FULLTEXT) e de CNPJ de cada tipo de busca por pessoa
+COLUNAS_PESSOA = {
+    'fornecedor': ('n.nome_emitente', 'n.cnpj_emitente'),
+    'destinatario': ('n.nome_destinatario', 'n.cnpj_destinatario'),
+}
+
+_RE_PALAVRA = re.compile(r'\w+')
+_RE_DOCUMENTO = re.compile(r'^[\d./\-\s]+$')
+
+
+def separar_palavras(termo):
+    """
+    Separa o termo em palavras pesquisáveis no índice FULLTEXT e palavras
+    curtas demais para ele
+
+    Returns:
+        tuple: (expressão booleana '+palavra* ...' ou None, lista de palavras curtas)
+    """
+    indexaveis = []
+    curtas = []
+    for palavra in _RE_PALAVRA.findall(termo or ''):
+        if len(palavra) >= TAMANHO_MINIMO_PALAVRA:
+            indexaveis.append(f'+{palavra}*')
+        else:
+            curtas.append(palavra)
+    return (' '.join(indexaveis) or None), curtas
+
+
+def somente_digitos(termo):
+    """Retorna os dígitos de um CNPJ/chave digitado com ou sem máscara, ou None"""
+    termo = (termo or '').strip()
+    if termo and _RE_DOCUMENTO.match(termo):
+        digitos = ''.join(filter(str.isdigit, termo))
+        return digitos or None
+    return None
+
+
+def _filtro_texto(coluna, termo):
+    """
+    Condição e parâmetros de busca textual em `coluna`, com a relevância
+
+    Palavras curtas (fora do índice) restringem apenas as linhas já
+    encontradas pelo MATCH; sem nenhuma palavra indexável a busca volta a
+    ser LIKE na coluna.
+
+    Returns:
+        tuple: (condição, parâmetros, expressão de relevância ou None, parâmetros da relevância)
+    """
+    expressao, curtas = separar_palavras(termo)
+    if not expressao:
+        return f"{coluna} LIKE %s", [f'%{termo}%'], None, []
+
+    condicoes = [f"MATCH({coluna}) AGAINST (%s IN BOOLEAN MODE)"]
+    params = [expressao]
+    for palavra in curtas:
+        condicoes.append(f"{coluna} LIKE %s")
+        params.append(f'%{palavra}%')
+    relevancia = f"MATCH({coluna}) AGAINST (%s IN BOOLEAN MODE)"
+    return ' AND '.join(condicoes), params, relevancia, [expressao]
+
+
+def filtro_periodo(data_inicio=None, data_fim=None):
+    """
+    Condições de período de emissão (datas inclusivas) que usam o índice de
+    data_emissao, sem aplicar DATE() sobre a coluna
+
+    Returns:
+        tuple: (lista de condições, parâmetros)
+    """
+    condicoes = []
+    params = []
+    if data_inicio:
+        condicoes.append("n.data_emissao >= %s")
+        params.append(data_inicio)
+    if data_fim:
+        condicoes.append("n.data_emissao < %s + INTERVAL 1 DAY")
+        params.append(data_fim)
+    return condicoes, params
+
+
+def codificar_cursor(nota):
+    """Cursor da posição logo após `nota` na ordem (data_emissao, id) decrescente"""
+    return f"{nota['data_emissao']:%Y-%m-%dT%H:%M:%S}_{nota['id']}"
+
+
+def decodificar_cursor(texto):
+    """
+    Interpreta um cursor de paginação
+
+    Returns:
+        tuple: ('chave', data_emissao, id), ('deslocamento', n) ou None
+            (primeira página ou cursor inválido)
+    """
+    texto = (texto or '').strip()
+    try:
+        if texto.startswith('+'):
+            return ('deslocamento', max(0, int(texto[1:])))
+        if texto:
+            data, nf_id = texto.rsplit('_', 1)
+            return ('chave', datetime.strptime(data, '%Y-%m-%dT%H:%M:%S'), int(nf_id))
+    except ValueError:
+        logger.warning(f"Cursor de paginação inválido ignorado: {texto[:50]}")
+    return None
+
+
+def filtro_cursor(posicao):
+    """
+    Condição de busca (seek) das linhas após a posição do cursor na ordem
+    (data_emissao DESC, id DESC), atendida pelo índice idx_data_emissao
+    (que no InnoDB já inclui o id)
+
+    Returns:
+        tuple: (lista de condições, parâmetros)
+    """
+    if not posicao or posicao[0] != 'chave':
+        return [], []
+    _, data_emissao, nf_id = posicao
+    return (["(n.data_emissao < %s OR (n.data_emissao = %s AND n.id < %s))"],
+            [data_emissao, data_emissao, nf_id])
+
+
+def _paginar(cursor, sql, params, por_pagina, posicao, por_relevancia):
+    """
+    Executa a consulta (já com LIMIT por_pagina + 1) e calcula o cursor da
+    próxima página
+
+    Returns:
+        tuple: (notas da página, cursor da próxima página ou None)
+    """
+    cursor.execute(sql, params)
+    notas = cursor.fetchall()
+    if len(notas) <= por_pagina:
+        return notas, None
+
+    notas = notas[:por_pagina]
+    if por_relevancia:
+        deslocamento = posicao[1] if posicao and posicao[0] == 'deslocamento' else 0
+        return notas, f"+{deslocamento + por_pagina}"
+    return notas, codificar_cursor(notas[-1])
+
+
+def montar_consulta_busca(termo, tipo, data_inicio=None, data_fim=None,
+                          posicao=None, por_pagina=None):
+    """
+    Monta a consulta paginada da busca de notas
+
+    Buscas por nome ou descrição são ordenadas por relevância e paginadas
+    por deslocamento; as demais seguem a ordem (data_emissao, id)
+    decrescente com paginação por chave. Uma linha além do tamanho da página
+    indica se há próxima página, sem COUNT(*) sobre todo o resultado.
+
+    Returns:
+        tuple: (sql, parâmetros, ordenada por relevância)
+    """
+    por_pagina = por_pagina or POR_PAGINA
+    termo = (termo or '').strip()
+    origem = "nf_notas n"
+    condicoes = []
+    params = []
+    relevancia = None
+    params_relevancia = []
+
+    if termo:
+        digitos = somente_digitos(termo)
+        if tipo in COLUNAS_PESSOA:
+            coluna_nome, coluna_cnpj = COLUNAS_PESSOA[tipo]
+            if digitos:
+                condicoes.append(f"{coluna_cnpj} LIKE %s")
+                params.append(f'{digitos}%')
+            else:
+                condicao, params_filtro, relevancia, params_relevancia = _filtro_texto(
+                    coluna_nome, termo)
+                condicoes.append(condicao)
+                params.extend(params_filtro)
+        elif tipo == 'descricao':
+            # Uma linha por nota, com a relevância do item mais relevante
+            condicao, params_filtro, relevancia_item, params_item = _filtro_texto(
+                'descricao', termo)
+            origem = f"""(
+                SELECT nf_id, MAX({relevancia_item or '0'}) AS relevancia
+                FROM nf_itens
+                WHERE {condicao}
+                GROUP BY nf_id
+            ) r
+            JOIN nf_notas n ON n.id = r.nf_id"""
+            params.extend(params_item + params_filtro)
+            relevancia = "r.relevancia" if relevancia_item else None
+        else:  # chave
+            if digitos and len(digitos) == 44:
+                condicoes.append("n.chave_acesso = %s")
+                params.append(digitos)
+            else:
+                condicoes.append("n.chave_acesso LIKE %s")
+                params.append(f'{digitos or termo}%')
+
+    condicoes_periodo, params_periodo = filtro_periodo(data_inicio, data_fim)
+    condicoes.extend(condicoes_periodo)
+    params.extend(params_periodo)
+
+    por_relevancia = relevancia is not None
+    if por_relevancia:
+        deslocamento = posicao[1] if posicao and posicao[0] == 'deslocamento' else 0
+        ordem = "relevancia DESC, n.data_emissao DESC, n.id DESC"
+        limite = "LIMIT %s OFFSET %s"
+        params_limite = [por_pagina + 1, deslocamento]
+    else:
+        relevancia = "0"
+        condicoes_cursor, params_cursor = filtro_cursor(posicao)
+        condicoes.extend(condicoes_cursor)
+        params.extend(params_cursor)
+        ordem = "n.data_emissao DESC, n.id DESC"
+        limite = "LIMIT %s"
+        params_limite = [por_pagina + 1]
+
+    sql = f"""
+        SELECT {COLUNAS_NOTA_PREFIXADAS}, n.total_itens, {relevancia} AS relevancia
+        FROM {origem}
+        WHERE {' AND '.join(condicoes) or '1=1'}
+        ORDER BY {ordem}
+        {limite}
+    """
+    # Os parâmetros da relevância aparecem antes dos filtros no SQL
+    return sql, params_relevancia + params + params_limite, por_relevancia
+
+
+def buscar_notas(cursor, termo, tipo, data_inicio=None, data_fim=None,
+                 cursor_pagina=None, por_pagina=None):
+    """
+    Executa a busca de notas fiscais
+
+    Args:
+        cursor: Cursor (dictionary=True) de uma conexão ativa
+        termo: Texto digitado pelo usuário
+        tipo: 'fornecedor', 'destinatario', 'descricao' ou 'chave'
+        data_inicio: Data de emissão mínima (YYYY-MM-DD)
+        data_fim: Data de emissão máxima (YYYY-MM-DD, inclusiva)
+        cursor_pagina: Cursor devolvido pela página anterior (None = primeira página)
+        por_pagina: Resultados por página (padrão: POR_PAGINA)
+
+    Returns:
+        tuple: (notas da página, cursor da próxima página ou None)
+    """
+    por_pagina = por_pagina or POR_PAGINA
+    posicao = decodificar_cursor(cursor_pagina)
+    sql, params, por_relevancia = montar_consulta_busca(
+        termo, tipo, data_inicio, data_fim, posicao, por_pagina)
+    return _paginar(cursor, sql, params, por_pagina, posicao, por_relevancia)
+
+
+def listar_notas(cursor, colunas, data_inicio=None, data_fim=None,
+                 cursor_pagina=None, por_pagina=None):
+    """
+    Lista as notas mais recentes, em ordem (data_emissao, id) decrescente,
+    com paginação por chave
+
+    Args:
+        cursor: Cursor (dictionary=True) de uma conexão ativa
+        colunas: Colunas de nf_notas (prefixadas com n.) a retornar
+        data_inicio: Data de emissão mínima (YYYY-MM-DD)
+        data_fim: Data de emissão máxima (YYYY-MM-DD, inclusiva)
+        cursor_pagina: Cursor devolvido pela página anterior (None = primeira página)
+        por_pagina: Notas por página (padrão: POR_PAGINA)
+
+    Returns:
+        tuple: (notas da página, cursor da próxima página ou None)
+    """
+    por_pagina = por_pagina or POR_PAGINA
+    posicao = decodificar_cursor(cursor_pagina)
+    condicoes, params = filtro_periodo(data_inicio, data_fim)
+    condicoes_cursor, params_cursor = filtro_cursor(posicao)
+
+    sql = f"""
+        SELECT {colunas}
+        FROM nf_notas n
+        WHERE {' AND '.join(condicoes + condicoes_cursor) or '1=1'}
+        ORDER BY n.data_emissao DESC, n.id DESC
+        LIMIT %s
+    """
+    return _paginar(cursor, sql, params + params_cursor + [por_pagina + 1],
+                    por_pagina, posicao, False)
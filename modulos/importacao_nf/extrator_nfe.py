@@ -0,0 +1,485 @@
+"""
+Extrator de NF-e em passagem única (iterparse) para o módulo de importação NF
+
+Percorre o XML uma única vez, reconhecendo as tags com e sem o namespace da
+NF-e. O parser recebe o texto em blocos (sem copiá-lo para um StringIO) e cada
+item (det) já lido é retirado da árvore, então a árvore montada não cresce com
+o número de itens. O texto do XML continua em memória, pois é gravado com a
+nota. As regras de busca reproduzem as de process_xml_file para que o
+resultado seja idêntico.
+"""
+import re
+import logging
+from datetime import datetime
+import xml.etree.ElementTree as ET
+
+logger = logging.getLogger('importacao_xml')
+
+NS_NFE = 'http://www.portalfiscal.inf.br/nfe'
+_PREFIXO_NS = '{' + NS_NFE + '}'
+
+# Caracteres de controle C1 (128-159) que atrapalham o parsing
+_RE_CONTROLE = re.compile('[\x80-\x9f]')
+
+_CAMPOS_CABECALHO = ('nNF', 'dhEmi', 'dEmi', 'vNF')
+_CAMPOS_PROD = ('cProd', 'xProd', 'qCom', 'vUnCom', 'vProd')
+
+# Caracteres do XML entregues ao parser por vez
+TAMANHO_BLOCO_PARSE = 64 * 1024
+
+
+def _mapa_tags(nomes):
+    """Mapeia a tag (sem e com namespace) para (nome, índice: 0 sem ns, 1 com ns)"""
+    mapa = {nome: (nome, 0) for nome in nomes}
+    mapa.update({_PREFIXO_NS + nome: (nome, 1) for nome in nomes})
+    return mapa
+
+
+_TAGS_CABECALHO = _mapa_tags(('infNFe', 'emit', 'dest') + _CAMPOS_CABECALHO)
+_TAGS_PROD = _mapa_tags(_CAMPOS_PROD)
+
+
+def nfe_vazia():
+    """Cria o dicionário básico de uma nota fiscal"""
+    return {
+        'access_key': None,
+        'number': None,
+        'emission_date': None,
+        'value': 0.0,
+        'cnpj_sender': '',
+        'sender_name': '',
+        'cnpj_receiver': '',
+        'receiver_name': '',
+        'items': [],
+        'xml': '',
+        'observacoes': f"Importado via XML em {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}"
+    }
+
+
+def remover_caracteres_controle(xml_content):
+    """Remove os caracteres 128-159, que atrapalham o parsing do XML"""
+    if _RE_CONTROLE.search(xml_content) is None:
+        return xml_content
+    return _RE_CONTROLE.sub('', xml_content)
+
+
+def converter_data_emissao(date_str):
+    """
+    Converte a data de emissão da NF-e (dhEmi ou dEmi) para datetime
+
+    Raises:
+        ValueError: Se a data não estiver em um formato reconhecido
+    """
+    if 'T' in date_str:
+        # Formato com timezone: 2023-01-01T14:30:00-03:00
+        clean_date = date_str.replace('T', ' ')
+        if '-03:00' in clean_date:
+            clean_date = clean_date.split('-03:00')[0]
+        return datetime.fromisoformat(clean_date)
+    # Formato antigo: AAAA-MM-DD
+    return datetime.strptime(date_str, '%Y-%m-%d')
+
+
+def _buscar(elem, nome, descendente=False):
+    """
+    Busca um elemento na mesma ordem de find_element em process_xml_file:
+    sem namespace, depois com o namespace da NF-e em qualquer nível e, por
+    último, sem namespace em qualquer nível
+    """
+    achado = elem.find(('.//' if descendente else '') + nome)
+    if achado is None:
+        achado = elem.find('.//' + _PREFIXO_NS + nome)
+    if achado is None and not descendente:
+        achado = elem.find('.//' + nome)
+    return achado
+
+
+def _texto(elem):
+    return elem.text if elem is not None else None
+
+
+def _campos_filhos_folha(prod):
+    """
+    Caminho rápido de _buscar para um prod cujos filhos são todos folhas: os
+    descendentes são os próprios filhos, então basta uma varredura
+    """
+    encontrados = ({}, {})
+    for filho in prod:
+        if len(filho):
+            return None
+        chave = _TAGS_PROD.get(filho.tag)
+        if chave is not None:
+            encontrados[chave[1]].setdefault(chave[0], filho.text)
+    sem_ns, com_ns = encontrados
+    return {campo: sem_ns[campo] if campo in sem_ns else com_ns.get(campo)
+            for campo in _CAMPOS_PROD}
+
+
+def _buscar_prod(det):
+    """_buscar(det, 'prod') sem ElementPath no caso comum (prod é o primeiro filho)"""
+    if len(det) and det[0].tag == _PREFIXO_NS + 'prod':
+        # O primeiro filho é o primeiro descendente; só um prod sem
+        # namespace em outro filho teria precedência
+        for filho in det:
+            if filho.tag == 'prod':
+                return filho
+        return det[0]
+    if len(det) and det[0].tag == 'prod':
+        return det[0]
+    return _buscar(det, 'prod')
+
+
+def _campos_det(det):
+    """Lê os textos dos campos de produto de um elemento det"""
+    prod = _buscar_prod(det)
+    if prod is not None:
+        campos = _campos_filhos_folha(prod)
+        if campos is None:
+            campos = {campo: _texto(_buscar(prod, campo))
+                      for campo in _CAMPOS_PROD}
+        return True, campos
+    return False, {campo: _texto(_buscar(det, campo, descendente=True))
+                   for campo in _CAMPOS_PROD}
+
+
+def numero_item_det(det):
+    """nItem de um elemento det como inteiro ou None se ausente ou inválido"""
+    try:
+        return int(det.get('nItem', '').strip())
+    except ValueError:
+        return None
+
+
+def _float_ou(texto, padrao):
+    try:
+        return float(texto.replace(',', '.'))
+    except:
+        return padrao
+
+
+def _montar_item(i, tem_prod, campos, numero_item=None):
+    """Converte os campos de um det no item, com os mesmos padrões do legado"""
+    if tem_prod:
+        item = {
+            'code': campos['cProd'].strip() if campos['cProd'] else f"ITEM{i}",
+            'description': campos['xProd'].strip() if campos['xProd'] else f"Item {i}",
+            'quantity': _float_ou(campos['qCom'], 1) if campos['qCom'] else 1,
+        }
+        item['unit_value'] = _float_ou(
+            campos['vUnCom'], 0) if campos['vUnCom'] else 0
+        if campos['vProd']:
+            item['total_value'] = _float_ou(
+                campos['vProd'], item['quantity'] * item['unit_value'])
+        else:
+            item['total_value'] = item['quantity'] * item['unit_value']
+        item['numero_item'] = numero_item
+        return item
+
+    # det sem prod: campos buscados diretamente, falhas mantêm o padrão
+    item = {
+        'code': f"ITEM{i}",
+        'description': f"Item {i}",
+        'quantity': 1,
+        'unit_value': 0,
+        'total_value': 0
+    }
+    if campos['cProd']:
+        item['code'] = campos['cProd'].strip()
+    if campos['xProd']:
+        item['description'] = campos['xProd'].strip()
+    if campos['qCom']:
+        item['quantity'] = _float_ou(campos['qCom'], item['quantity'])
+    if campos['vUnCom']:
+        item['unit_value'] = _float_ou(campos['vUnCom'], item['unit_value'])
+    if campos['vProd']:
+        item['total_value'] = _float_ou(
+            campos['vProd'], item['quantity'] * item['unit_value'])
+    item['numero_item'] = numero_item
+    return item
+
+
+def _eventos_xml(xml_content):
+    """Eventos start/end do XML, entregando ao parser fatias do próprio texto"""
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    for inicio in range(0, len(xml_content), TAMANHO_BLOCO_PARSE):
+        parser.feed(xml_content[inicio:inicio + TAMANHO_BLOCO_PARSE])
+        yield from parser.read_events()
+    parser.close()
+    yield from parser.read_events()
+
+
+def extrair_nfe_iterparse(xml_content):
+    """
+    Extrai os dados de uma NF-e em uma única passagem pelo XML
+
+    Args:
+        xml_content: Conteúdo do XML já decodificado
+
+    Returns:
+        dict: Dados da NF-e (antes da complementação por regex) ou None quando
+        o XML não pode ser tratado aqui e deve seguir pelo extrator legado
+    """
+    if not xml_content or not ('<' in xml_content and '>' in xml_content):
+        return None
+
+    xml_content = remover_caracteres_controle(xml_content)
+
+    # Primeira ocorrência de cada campo: [sem namespace, com namespace]
+    primeiros = {nome: [None, None] for nome in
+                 ('infNFe', 'emit', 'dest') + _CAMPOS_CABECALHO}
+    dets_sem_ns = []
+    dets_sufixo = []
+    raiz = None
+    # Elementos abertos (o último é o pai do elemento que acabou de fechar)
+    abertos = []
+
+    try:
+        for evento, elem in _eventos_xml(xml_content):
+            if evento == 'start':
+                if raiz is None:
+                    raiz = elem
+                abertos.append(elem)
+                continue
+
+            abertos.pop()
+            tag = elem.tag
+            if tag.endswith('det'):
+                campos = _campos_det(elem) + (numero_item_det(elem),)
+                dets_sufixo.append(campos)
+                if tag == 'det':
+                    dets_sem_ns.append(campos)
+                # Item já lido: liberar o conteúdo e retirar o elemento do pai
+                elem.clear()
+                if abertos:
+                    abertos[-1].remove(elem)
+                continue
+
+            chave = _TAGS_CABECALHO.get(tag)
+            if chave is not None:
+                nome, indice = chave
+                if primeiros[nome][indice] is None:
+                    primeiros[nome][indice] = elem
+    except ET.ParseError as e:
+        logger.debug(f"iterparse não conseguiu ler o XML: {str(e)}")
+        return None
+
+    # O legado busca apenas descendentes da raiz; se ela mesma casou com
+    # algum campo, o resultado pode divergir
+    if raiz.tag.endswith('det') or any(
+            elem is raiz for par in primeiros.values() for elem in par):
+        return None
+
+    def primeiro(nome):
+        sem_ns, com_ns = primeiros[nome]
+        return sem_ns if sem_ns is not None else com_ns
+
+    dest = primeiro('dest')
+    if dest is None:
+        # Sem destinatário o legado segue um caminho próprio
+        return None
+
+    nfe_data = nfe_vazia()
+    nfe_data['xml'] = xml_content
+
+    # Chave de acesso
+    inf_nfe = primeiro('infNFe')
+    if inf_nfe is not None and 'Id' in inf_nfe.attrib:
+        id_value = inf_nfe.attrib['Id']
+        if id_value.startswith('NFe'):
+            nfe_data['access_key'] = id_value[3:]
+
+    # Número da NF
+    num_nf = _texto(primeiro('nNF'))
+    if num_nf:
+        nfe_data['number'] = num_nf.strip()
+
+    # Data de emissão
+    sem_ns, com_ns = primeiros['dhEmi']
+    if sem_ns is None and com_ns is None:
+        sem_ns, com_ns = primeiros['dEmi']
+    date_str = _texto(sem_ns if sem_ns is not None else com_ns)
+    if date_str:
+        try:
+            nfe_data['emission_date'] = converter_data_emissao(
+                date_str.strip())
+        except Exception as e:
+            logger.warning(f"Erro ao converter data de emissão: {e}")
+            nfe_data['emission_date'] = datetime.now()
+    else:
+        nfe_data['emission_date'] = datetime.now()
+
+    # Valor total
+    v_nf = _texto(primeiro('vNF'))
+    if v_nf:
+        try:
+            nfe_data['value'] = float(v_nf.replace(',', '.'))
+        except Exception as e:
+            logger.warning(f"Erro ao converter valor total: {e}")
+
+    # Emitente
+    emit = primeiro('emit')
+    if emit is not None:
+        cnpj_emit = _texto(_buscar(emit, 'CNPJ'))
+        if cnpj_emit:
+            nfe_data['cnpj_sender'] = cnpj_emit.strip()
+        nome_emit = _texto(_buscar(emit, 'xNome'))
+        if nome_emit:
+            nfe_data['sender_name'] = nome_emit.strip()
+
+    # Destinatário (o legado não preenche o nome quando há dest)
+    cnpj_dest = _texto(_buscar(dest, 'CNPJ'))
+    if cnpj_dest:
+        nfe_data['cnpj_receiver'] = cnpj_dest.strip()
+
+    # Itens
+    dets = dets_sem_ns or dets_sufixo
+    nfe_data['items'] = [_montar_item(i, tem_prod, campos, numero_item)
+                         for i, (tem_prod, campos, numero_item) in enumerate(dets, 1)]
+
+    return nfe_data
+
+
+def completar_nfe_por_regex(nfe_data, xml_content):
+    """
+    Complementa com expressões regulares os campos que o parser não encontrou
+    (chave de acesso, número, data de emissão e valor) e adiciona um item
+    genérico quando a nota não tem itens
+
+    Args:
+        nfe_data: Dicionário da NF-e (alterado no local)
+        xml_content: Conteúdo do XML
+
+    Returns:
+        bool: False se nem a chave de acesso foi encontrada
+    """
+    # Se não conseguimos extrair a chave de acesso, tentar com regex de forma mais agressiva
+    if nfe_data['access_key'] is None and xml_content:
+        logger.info(
+            "Chave de acesso não encontrada com ElementTree, tentando com regex")
+
+        # Extrair chave de acesso com regex - padrões ampliados
+        chave_patterns = [
+            r'Id="NFe([0-9]{44})"',
+            r'Id=["\']NFe([0-9]{44})["\']',
+            r'chNFe>([0-9]{44})<',
+            r'<chNFe>([0-9]{44})</chNFe>',
+            r'chave="([0-9]{44})"',
+            r'chave=["\']([0-9]{44})["\']',
+            r'Chave de acesso: ([0-9]{44})',
+            r'chave>([0-9]{44})<',
+            r'chnfe>([0-9]{44})<',
+            r'chave.{0,20}([0-9]{44})',
+            r'<infNFe.*?Id="NFe([0-9]{44})"',
+            r'<NFe.*?Id="NFe([0-9]{44})"',
+            r'["\']NFe([0-9]{44})["\']',
+            # Último recurso: qualquer sequência de 44 dígitos
+            r'([0-9]{44})'
+        ]
+
+        for pattern in chave_patterns:
+            chave_match = re.search(pattern, xml_content, re.IGNORECASE)
+            if chave_match:
+                chave_candidata = chave_match.group(1)
+                # Verificar se é realmente uma chave de acesso (44 dígitos)
+                if len(chave_candidata) == 44 and chave_candidata.isdigit():
+                    nfe_data['access_key'] = chave_candidata
+                    logger.info(
+                        f"Chave de acesso encontrada com regex: {nfe_data['access_key']}")
+                    break
+
+        # Se ainda não encontrou, buscar 44 dígitos em sequência como último recurso
+        if nfe_data['access_key'] is None:
+            all_numbers = re.findall(r'\d+', xml_content)
+            for num in all_numbers:
+                if len(num) == 44:
+                    nfe_data['access_key'] = num
+                    logger.info(
+                        f"Chave de acesso encontrada como sequência de 44 dígitos: {num}")
+                    break
+
+        if nfe_data['access_key'] is None:
+            return False
+
+    # Se não temos número da NF, tentar com regex
+    if not nfe_data['number']:
+        num_patterns = [
+            r'<nNF>(\d+)</nNF>',
+            r'nNF>(\d+)<',
+            r'Número: (\d+)',
+            r'numero>(\d+)<',
+            r'num>(\d+)<'
+        ]
+
+        for pattern in num_patterns:
+            num_match = re.search(pattern, xml_content, re.IGNORECASE)
+            if num_match:
+                nfe_data['number'] = num_match.group(1)
+                break
+
+    # Se não temos data de emissão, tentar com regex
+    if not nfe_data['emission_date']:
+        date_patterns = [
+            r'<dhEmi>(.*?)</dhEmi>',
+            r'<dEmi>(.*?)</dEmi>',
+            r'dhEmi>(.*?)<',
+            r'dEmi>(.*?)<',
+            r'Data de emissão: (\d{2}/\d{2}/\d{4})',
+            r'data>(\d{2}/\d{2}/\d{4})<'
+        ]
+
+        for pattern in date_patterns:
+            date_match = re.search(pattern, xml_content, re.IGNORECASE)
+            if date_match:
+                date_str = date_match.group(1)
+                try:
+                    if '/' in date_str and 'T' not in date_str:
+                        # Formato DD/MM/YYYY
+                        nfe_data['emission_date'] = datetime.strptime(
+                            date_str, '%d/%m/%Y')
+                    else:
+                        nfe_data['emission_date'] = converter_data_emissao(
+                            date_str)
+                    break
+                except Exception as e:
+                    logger.warning(
+                        f"Regex: Erro ao converter data de emissão: {e}")
+                    continue
+
+    # Se ainda não temos data de emissão, usar data atual
+    if not nfe_data['emission_date']:
+        nfe_data['emission_date'] = datetime.now()
+        logger.warning(
+            "Data de emissão não encontrada, usando data atual")
+
+    # Se não temos valor total, tentar com regex
+    if nfe_data['value'] == 0:
+        value_patterns = [
+            r'<vNF>(.*?)</vNF>',
+            r'vNF>(.*?)<',
+            r'Valor Total: ([\d.,]+)',
+            r'total>([\d.,]+)<'
+        ]
+
+        for pattern in value_patterns:
+            value_match = re.search(pattern, xml_content, re.IGNORECASE)
+            if value_match:
+                try:
+                    nfe_data['value'] = float(value_match.group(
+                        1).replace('.', '').replace(',', '.'))
+                    break
+                except:
+                    continue
+
+    # Se não encontrou itens, adicionar item genérico
+    if not nfe_data['items'] and nfe_data['access_key']:
+        logger.warning(
+            f"Nenhum item encontrado, adicionando item genérico para a NFe {nfe_data['access_key']}")
+        nfe_data['items'] = [{
+            'code': 'GENERICO',
+            'description': f"Nota Fiscal {nfe_data['access_key']}",
+            'quantity': 1,
+            'unit_value': nfe_data['value'],
+            'total_value': nfe_data['value']
+        }]
+
+    return True
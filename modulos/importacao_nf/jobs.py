@@ -0,0 +1,248 @@
+"""
+Fila de importação de XML/ZIP em segundo plano para o módulo de importação NF
+
+Os uploads são gravados em um diretório próprio do job e registrados na tabela
+nf_importacao_jobs. Os workers (scripts/worker_importacao_nf.py) reservam os
+jobs pendentes, processam os arquivos e atualizam o progresso na mesma tabela.
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+import socket
+import logging
+
+from utils.db import execute_query, get_single_result
+from modulos.importacao_nf.metricas import MetricasImportacao
+
+logger = logging.getLogger('importacao_xml')
+
+# Diretório onde os arquivos enviados aguardam o processamento
+JOBS_DIR = os.environ.get('NF_IMPORTACAO_JOBS_DIR', os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    'uploads', 'importacao_nf'))
+
+# Intervalo mínimo (segundos) entre gravações de progresso no banco
+INTERVALO_PROGRESSO = float(os.environ.get(
+    'NF_IMPORTACAO_INTERVALO_PROGRESSO', 1.0))
+
+CAMPOS_CONTADORES = ('processados', 'novos',
+                     'atualizados', 'inalterados', 'erros')
+
+
+def resumo_resultados(resultados):
+    """Mensagem de conclusão com os contadores de uma importação (e dos itens, se contados)"""
+    mensagem = (f'Processamento concluído: {resultados["processados"]} arquivos processados '
+                f'({resultados["novos"]} novos, {resultados["atualizados"]} atualizados, '
+                f'{resultados["inalterados"]} sem alteração, {resultados["erros"]} erros)')
+    if 'itens_inseridos' in resultados:
+        mensagem += (f'; itens: {resultados["itens_inseridos"]} inseridos, '
+                     f'{resultados["itens_alterados"]} alterados, '
+                     f'{resultados["itens_removidos"]} removidos')
+    return mensagem
+
+
+def criar_diretorio_job():
+    """Cria um diretório exclusivo para os arquivos de um novo job"""
+    diretorio = os.path.join(JOBS_DIR, uuid.uuid4().hex)
+    os.makedirs(diretorio, exist_ok=True)
+    return diretorio
+
+
+def criar_job(usuario_id, diretorio, arquivos):
+    """
+    Registra um novo job de importação como pendente
+
+    Args:
+        usuario_id: ID do usuário que enviou os arquivos
+        diretorio: Diretório onde os arquivos foram gravados
+        arquivos: Lista de nomes de arquivos dentro do diretório
+
+    Returns:
+        int: ID do job ou None em caso de erro
+    """
+    resultado = execute_query("""
+        INSERT INTO nf_importacao_jobs (usuario_id, status, diretorio, arquivos, total_arquivos)
+        VALUES (%s, 'pendente', %s, %s, %s)
+    """, (usuario_id, diretorio, json.dumps(arquivos), len(arquivos)))
+
+    if not resultado:
+        return None
+
+    logger.info(
+        f"Job de importação {resultado['lastrowid']} criado com {len(arquivos)} arquivo(s)")
+    return resultado['lastrowid']
+
+
+def obter_job(job_id):
+    """Retorna os dados de um job de importação ou None se não existir"""
+    return get_single_result("""
+        SELECT id, usuario_id, status, total_arquivos, arquivo_atual,
+               processados, novos, atualizados, inalterados, erros, mensagem, metricas,
+               criado_em, iniciado_em, atualizado_em, finalizado_em
+        FROM nf_importacao_jobs
+        WHERE id = %s
+    """, (job_id,))
+
+
+def reservar_proximo_job():
+    """
+    Reserva atomicamente o job pendente mais antigo para este worker
+
+    Returns:
+        dict: Dados do job reservado ou None se a fila estiver vazia
+    """
+    worker = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:12]}"
+
+    resultado = execute_query("""
+        UPDATE nf_importacao_jobs
+        SET status = 'processando', worker = %s,
+            iniciado_em = NOW(), atualizado_em = NOW()
+        WHERE status = 'pendente'
+        ORDER BY id
+        LIMIT 1
+    """, (worker,))
+
+    if not resultado or not resultado['rowcount']:
+        return None
+
+    return get_single_result("""
+        SELECT * FROM nf_importacao_jobs
+        WHERE worker = %s AND status = 'processando'
+    """, (worker,))
+
+
+def liberar_jobs_travados(minutos=30):
+    """
+    Devolve para a fila os jobs em processamento sem progresso há muito tempo
+    (por exemplo, quando o worker foi encerrado no meio da importação)
+    """
+    resultado = execute_query("""
+        UPDATE nf_importacao_jobs
+        SET status = 'pendente', worker = NULL,
+            processados = 0, novos = 0, atualizados = 0, inalterados = 0, erros = 0
+        WHERE status = 'processando'
+          AND atualizado_em < DATE_SUB(NOW(), INTERVAL %s MINUTE)
+    """, (minutos,))
+
+    if resultado and resultado['rowcount']:
+        logger.warning(
+            f"{resultado['rowcount']} job(s) travado(s) devolvido(s) para a fila")
+
+
+def _json_metricas(metricas):
+    """Resumo das métricas em JSON para a coluna metricas (None mantém o valor gravado)"""
+    return json.dumps(metricas.resumo()) if metricas is not None else None
+
+
+def atualizar_progresso(job_id, resultados, arquivo_atual=None, metricas=None):
+    """Grava os contadores parciais (e os tempos, se informados) de um job em andamento"""
+    execute_query("""
+        UPDATE nf_importacao_jobs
+        SET processados = %s, novos = %s, atualizados = %s, inalterados = %s, erros = %s,
+            arquivo_atual = %s, metricas = COALESCE(%s, metricas), atualizado_em = NOW()
+        WHERE id = %s
+    """, tuple(resultados[campo] for campo in CAMPOS_CONTADORES)
+        + (arquivo_atual, _json_metricas(metricas), job_id))
+
+
+def finalizar_job(job_id, status, resultados, mensagem, metricas=None):
+    """Marca o job como concluído (ou com erro) com os contadores e tempos finais"""
+    execute_query("""
+        UPDATE nf_importacao_jobs
+        SET status = %s, processados = %s, novos = %s, atualizados = %s, inalterados = %s, erros = %s,
+            mensagem = %s, metricas = COALESCE(%s, metricas), arquivo_atual = NULL,
+            atualizado_em = NOW(), finalizado_em = NOW()
+        WHERE id = %s
+    """, (status,) + tuple(resultados[campo] for campo in CAMPOS_CONTADORES)
+        + (mensagem, _json_metricas(metricas), job_id))
+
+
+class ProgressoJob:
+    """
+    Callback de progresso que grava no banco no máximo uma vez por intervalo
+    """
+
+    def __init__(self, job_id, intervalo=None, metricas=None):
+        self.job_id = job_id
+        self.intervalo = INTERVALO_PROGRESSO if intervalo is None else intervalo
+        self.metricas = metricas
+        self._ultima_gravacao = 0.0
+
+    def __call__(self, resultados, arquivo_atual=None):
+        agora = time.monotonic()
+        if agora - self._ultima_gravacao < self.intervalo:
+            return
+        self._ultima_gravacao = agora
+        atualizar_progresso(self.job_id, resultados, arquivo_atual, self.metricas)
+
+
+def executar_job(job):
+    """
+    Processa todos os arquivos de um job reservado
+
+    Args:
+        job: Registro do job retornado por reservar_proximo_job
+
+    Returns:
+        dict: Contadores finais do processamento
+    """
+    # Import tardio para evitar import circular com o blueprint
+    from modulos.importacao_nf.app import processar_arquivos_importacao
+
+    job_id = job['id']
+    diretorio = job['diretorio']
+    resultados = dict.fromkeys(CAMPOS_CONTADORES, 0)
+    metricas = MetricasImportacao()
+
+    logger.info(f"Iniciando job de importação {job_id}")
+    try:
+        nomes = json.loads(job['arquivos'])
+        arquivos = [(nome, os.path.join(diretorio, nome)) for nome in nomes]
+
+        resultados, avisos = processar_arquivos_importacao(
+            arquivos, diretorio, progresso=ProgressoJob(job_id, metricas=metricas),
+            metricas=metricas)
+
+        mensagem = resumo_resultados(resultados)
+        if avisos:
+            mensagem += '\n' + '\n'.join(texto for _, texto in avisos)
+
+        finalizar_job(job_id, 'concluido', resultados, mensagem, metricas)
+        logger.info(f"Job {job_id}: {mensagem}")
+    except Exception as e:
+        logger.error(
+            f"Erro ao executar job de importação {job_id}: {str(e)}", exc_info=True)
+        finalizar_job(job_id, 'erro', resultados, str(e), metricas)
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+        metricas.registrar_log(job_id=job_id, origem='fila', **resultados)
+
+    return resultados
+
+
+def loop_worker(intervalo=2.0, parar=None):
+    """
+    Laço principal de um worker: reserva e executa jobs até ser interrompido
+
+    Args:
+        intervalo: Segundos de espera quando a fila está vazia
+        parar: threading/multiprocessing Event opcional para encerrar o laço
+    """
+    logger.info(f"Worker de importação iniciado (pid {os.getpid()})")
+    while parar is None or not parar.is_set():
+        try:
+            job = reservar_proximo_job()
+        except Exception as e:
+            logger.error(f"Erro ao consultar fila de importação: {str(e)}")
+            job = None
+
+        if job:
+            executar_job(job)
+        elif parar is not None:
+            parar.wait(intervalo)
+        else:
+            time.sleep(intervalo)
+
+    logger.info(f"Worker de importação encerrado (pid {os.getpid()})")
@@ -0,0 +1,164 @@
+"""
+Tempos por etapa e por arquivo de uma importação de NF-e
+
+Cada importação (job da fila, upload síncrono ou sincronização Arquivei) ativa
+um MetricasImportacao; as funções do pipeline marcam suas etapas com
+`etapa('parse')`, `etapa('gravacao_banco')` etc. Sem métricas ativas a marcação
+não mede nada. Os tempos são exclusivos: uma etapa aninhada (ex.: consulta ao
+banco dentro da gravação) é descontada da etapa externa, então a soma das
+etapas corresponde ao tempo medido. No parse em paralelo os tempos dos
+processos são somados e podem passar da duração da importação. As diferenças
+aplicadas aos itens das notas (inseridos, alterados, removidos e mantidos)
+também são contadas, com `contar_itens`.
+
+Ao final, o resumo é gravado no job (nf_importacao_jobs.metricas, exposto em
+/importacao_nf/importar_xml/status/<job_id>) e registrado em uma linha JSON
+no log.
+"""
+import os
+import json
+import heapq
+import logging
+from time import perf_counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger('importacao_xml.metricas')
+
+# Quantidade de arquivos mais lentos guardados no resumo
+ARQUIVOS_MAIS_LENTOS = int(os.environ.get('NF_IMPORTACAO_METRICAS_ARQUIVOS', 10))
+
+# Contadores dos itens gravados (ver persistencia.atualizar_itens_lote)
+CAMPOS_ITENS = ('inseridos', 'alterados', 'removidos', 'mantidos')
+
+_metricas_atuais = ContextVar('metricas_importacao', default=None)
+
+
+class MetricasImportacao:
+    """
+    Acumula os tempos das etapas e dos arquivos de uma importação
+    """
+
+    def __init__(self):
+        self.inicio = perf_counter()
+        # {etapa: [segundos, chamadas, maior duração]}
+        self.etapas = {}
+        self.arquivos = 0
+        self.bytes = 0
+        self.itens = dict.fromkeys(CAMPOS_ITENS, 0)
+        self._mais_lentos = []
+        # Etapas em andamento: [nome, início, tempo das etapas aninhadas]
+        self._pilha = []
+
+    @contextmanager
+    def medir(self, nome):
+        """Mede o tempo exclusivo de uma etapa"""
+        marca = [nome, perf_counter(), 0.0]
+        self._pilha.append(marca)
+        try:
+            yield
+        finally:
+            self._pilha.pop()
+            decorrido = perf_counter() - marca[1]
+            if self._pilha:
+                self._pilha[-1][2] += decorrido
+            self.somar(nome, decorrido - marca[2])
+
+    def somar(self, nome, segundos, chamadas=1, maior=None):
+        """Soma um tempo (em segundos) a uma etapa"""
+        totais = self.etapas.setdefault(nome, [0.0, 0, 0.0])
+        totais[0] += segundos
+        totais[1] += chamadas
+        totais[2] = max(totais[2], segundos if maior is None else maior)
+
+    def mesclar(self, etapas):
+        """Soma os tempos de outro MetricasImportacao (ex.: de um processo de parse)"""
+        for nome, (segundos, chamadas, maior) in etapas.items():
+            self.somar(nome, segundos, chamadas, maior)
+
+    def contar_itens(self, contagem):
+        """Soma as quantidades de itens gravados ({'inseridos': n, ...})"""
+        for campo in CAMPOS_ITENS:
+            self.itens[campo] += contagem.get(campo, 0)
+
+    def resultados_itens(self):
+        """Contadores de itens com o prefixo itens_, para os resultados da importação"""
+        return {f'itens_{campo}': quantidade for campo, quantidade in self.itens.items()}
+
+    def registrar_arquivo(self, nome, tamanho, segundos, notas):
+        """Registra a duração total do processamento de um arquivo enviado"""
+        self.arquivos += 1
+        self.bytes += tamanho or 0
+        item = (segundos, self.arquivos, nome, tamanho, notas)
+        if len(self._mais_lentos) < ARQUIVOS_MAIS_LENTOS:
+            heapq.heappush(self._mais_lentos, item)
+        elif ARQUIVOS_MAIS_LENTOS:
+            heapq.heappushpop(self._mais_lentos, item)
+
+    def resumo(self):
+        """
+        Resumo serializável em JSON
+
+        Returns:
+            dict: Duração, arquivos, bytes, itens gravados, tempos por etapa e
+                arquivos mais lentos
+        """
+        return {
+            'duracao_s': round(perf_counter() - self.inicio, 3),
+            'arquivos': self.arquivos,
+            'bytes': self.bytes,
+            'itens': dict(self.itens),
+            'etapas': {
+                nome: {'total_s': round(segundos, 3), 'chamadas': chamadas,
+                       'media_ms': round(segundos * 1000 / chamadas, 2) if chamadas else 0,
+                       'max_ms': round(maior * 1000, 2)}
+                for nome, (segundos, chamadas, maior) in sorted(
+                    self.etapas.items(), key=lambda item: -item[1][0])
+            },
+            'arquivos_mais_lentos': [
+                {'arquivo': nome, 'tamanho': tamanho, 'segundos': round(segundos, 3),
+                 'notas': notas}
+                for segundos, _, nome, tamanho, notas in sorted(self._mais_lentos, reverse=True)
+            ],
+        }
+
+    def registrar_log(self, **contexto):
+        """Registra o resumo em uma única linha JSON no log"""
+        dados = {'evento': 'metricas_importacao', **contexto, **self.resumo()}
+        logger.info(json.dumps(dados, default=str, ensure_ascii=False))
+
+
+@contextmanager
+def ativar_metricas(metricas):
+    """Torna `metricas` o destino das etapas medidas neste contexto (thread)"""
+    token = _metricas_atuais.set(metricas)
+    try:
+        yield metricas
+    finally:
+        _metricas_atuais.reset(token)
+
+
+def metricas_atuais():
+    """MetricasImportacao ativo no contexto atual ou None"""
+    return _metricas_atuais.get()
+
+
+def contar_itens(contagem):
+    """Soma contagens de itens às métricas ativas (sem métricas ativas, não faz nada)"""
+    metricas = _metricas_atuais.get()
+    if metricas is not None:
+        metricas.contar_itens(contagem)
+
+
+@contextmanager
+def etapa(nome):
+    """
+    Mede uma etapa nas métricas ativas (sem métricas ativas, não faz nada).
+    Pode ser usado como `with etapa('parse'):` ou como decorador.
+    """
+    metricas = _metricas_atuais.get()
+    if metricas is None:
+        yield
+        return
+    with metricas.medir(nome):
+        yield
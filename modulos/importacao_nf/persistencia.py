@@ -0,0 +1,693 @@
+"""
+Rotinas de persistência em lote para o módulo de importação NF
+"""
+import os
+import logging
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+
+from utils.db import execute_query, get_pooled_connection
+from modulos.importacao_nf.xml_utils import hash_conteudo_xml, comprimir_xml
+from modulos.importacao_nf.resumo import ResumoDiario
+from modulos.importacao_nf.metricas import etapa, contar_itens
+
+logger = logging.getLogger('importacao_xml')
+
+# Limites de cada INSERT multi-linha em nf_itens. O limite em bytes deve ficar
+# abaixo do max_allowed_packet do servidor MySQL.
+ITENS_LOTE_MAX_LINHAS = int(os.environ.get('NF_ITENS_LOTE_MAX_LINHAS', 500))
+ITENS_LOTE_MAX_BYTES = int(os.environ.get(
+    'NF_ITENS_LOTE_MAX_BYTES', 1024 * 1024))
+
+# Quantidade máxima de chaves por consulta IN (...) no pré-carregamento
+LOTE_CONSULTA_CHAVES = int(os.environ.get('NF_LOTE_CONSULTA_CHAVES', 1000))
+
+SQL_INSERT_ITENS = """
+    INSERT INTO nf_itens (
+        nf_id, numero_item, codigo, descricao, quantidade,
+        valor_unitario, valor_total
+    ) VALUES """
+PLACEHOLDER_ITEM = "(%s, %s, %s, %s, %s, %s, %s)"
+# Itens novos ou alterados de notas existentes, pela chave única (nf_id, numero_item)
+SQL_UPSERT_ITENS = SQL_INSERT_ITENS + """{valores}
+    ON DUPLICATE KEY UPDATE
+        codigo = VALUES(codigo),
+        descricao = VALUES(descricao),
+        quantidade = VALUES(quantidade),
+        valor_unitario = VALUES(valor_unitario),
+        valor_total = VALUES(valor_total)"""
+
+SQL_UPSERT_NOTAS = """
+    INSERT INTO nf_notas (
+        chave_acesso, numero_nf, data_emissao, valor_total, cnpj_emitente,
+        nome_emitente, cnpj_destinatario, nome_destinatario,
+        hash_conteudo, total_itens, soma_itens, status_processamento,
+        data_importacao, observacoes
+    ) VALUES {valores}
+    ON DUPLICATE KEY UPDATE
+        numero_nf = VALUES(numero_nf),
+        data_emissao = VALUES(data_emissao),
+        valor_total = VALUES(valor_total),
+        cnpj_emitente = VALUES(cnpj_emitente),
+        nome_emitente = VALUES(nome_emitente),
+        cnpj_destinatario = VALUES(cnpj_destinatario),
+        nome_destinatario = VALUES(nome_destinatario),
+        xml_data = NULL,
+        hash_conteudo = VALUES(hash_conteudo),
+        total_itens = VALUES(total_itens),
+        soma_itens = VALUES(soma_itens),
+        status_processamento = 'atualizado',
+        data_atualizacao = NOW(),
+        observacoes = %s"""
+PLACEHOLDER_NOTA = "(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW(), %s)"
+# Posição de hash_conteudo na tupla gerada por linha_nota
+COLUNA_HASH_NOTA = 8
+
+# XML original (comprimido) fica fora da linha de nf_notas, em nf_xml
+SQL_UPSERT_XML = """
+    INSERT INTO nf_xml (nf_id, xml_comprimido) VALUES {valores}
+    ON DUPLICATE KEY UPDATE xml_comprimido = VALUES(xml_comprimido)"""
+PLACEHOLDER_XML = "(%s, %s)"
+
+
+def linha_item(nf_id, numero_item, item):
+    """
+    Converte um item extraído do XML na tupla de colunas de nf_itens
+
+    Args:
+        nf_id: ID da nota fiscal
+        numero_item: Número do item na nota (nItem do det)
+        item: Dicionário do item (code, description, quantity, unit_value, total_value)
+
+    Returns:
+        tuple: Valores na ordem das colunas do INSERT
+    """
+    return (
+        nf_id,
+        numero_item,
+        item.get('code', ''),
+        item.get('description', ''),
+        item.get('quantity', 0),
+        item.get('unit_value', 0),
+        item.get('total_value', 0)
+    )
+
+
+def numeros_itens(itens):
+    """
+    Número de cada item: o nItem lido do det (item['numero_item']) ou, se algum
+    faltar ou se repetir, a posição no XML (1, 2, ...)
+    """
+    numeros = [item.get('numero_item') for item in itens]
+    if (all(isinstance(numero, int) and numero > 0 for numero in numeros)
+            and len(set(numeros)) == len(numeros)):
+        return numeros
+    return range(1, len(itens) + 1)
+
+
+def linhas_itens(nf_id, itens):
+    """Tuplas de nf_itens dos itens de uma nota, numerados por numeros_itens"""
+    itens = itens or []
+    return (linha_item(nf_id, numero_item, item)
+            for numero_item, item in zip(numeros_itens(itens), itens))
+
+
+def _tamanho_linha(linha):
+    # Estimativa do tamanho da linha no pacote SQL (valores + aspas e vírgulas)
+    return sum(len(str(valor)) + 4 for valor in linha)
+
+
+def dividir_em_lotes(linhas, max_linhas=None, max_bytes=None):
+    """
+    Agrupa as linhas em lotes limitados por quantidade e tamanho estimado
+
+    Args:
+        linhas: Iterável de tuplas de valores
+        max_linhas: Máximo de linhas por lote
+        max_bytes: Tamanho máximo estimado do lote em bytes
+
+    Yields:
+        list: Lote de linhas
+    """
+    max_linhas = max_linhas or ITENS_LOTE_MAX_LINHAS
+    max_bytes = max_bytes or ITENS_LOTE_MAX_BYTES
+
+    lote = []
+    tamanho_lote = 0
+    for linha in linhas:
+        tamanho = _tamanho_linha(linha)
+        if lote and (len(lote) >= max_linhas or tamanho_lote + tamanho > max_bytes):
+            yield lote
+            lote = []
+            tamanho_lote = 0
+        lote.append(linha)
+        tamanho_lote += tamanho
+
+    if lote:
+        yield lote
+
+
+def inserir_linhas_itens(cursor, linhas, max_linhas=None, max_bytes=None):
+    """
+    Insere linhas em nf_itens usando INSERT multi-linha (VALUES (...),(...))
+
+    Args:
+        cursor: Cursor da conexão em uso (a transação fica a cargo do chamador)
+        linhas: Iterável de tuplas geradas por linha_item
+        max_linhas: Máximo de linhas por comando
+        max_bytes: Tamanho máximo estimado por comando
+
+    Returns:
+        int: Número de itens inseridos
+    """
+    total = 0
+    for lote in dividir_em_lotes(linhas, max_linhas, max_bytes):
+        sql = SQL_INSERT_ITENS + ", ".join([PLACEHOLDER_ITEM] * len(lote))
+        params = [valor for linha in lote for valor in linha]
+        cursor.execute(sql, params)
+        total += len(lote)
+
+    logger.debug(f"{total} itens inseridos em lote")
+    return total
+
+
+def inserir_itens_nfe(cursor, nf_id, itens, max_linhas=None, max_bytes=None):
+    """
+    Insere todos os itens de uma NF-e em lote
+
+    Args:
+        cursor: Cursor da conexão em uso
+        nf_id: ID da nota fiscal
+        itens: Lista de itens extraídos do XML
+
+    Returns:
+        int: Número de itens inseridos
+    """
+    return inserir_linhas_itens(
+        cursor, linhas_itens(nf_id, itens), max_linhas, max_bytes)
+
+
+_ESCALAS_ITEM = (None, None, None, None,
+                 Decimal('0.0001'), Decimal('0.0001'), Decimal('0.01'))
+
+
+def somar_itens(itens):
+    """
+    Soma do valor_total dos itens arredondados como na coluna DECIMAL(15,2) de
+    nf_itens, para que nf_notas.soma_itens confira com SUM(nf_itens.valor_total)
+
+    Returns:
+        Decimal: Soma dos itens
+    """
+    escala = _ESCALAS_ITEM[-1]
+    return sum((Decimal(str(item.get('total_value') or 0)).quantize(escala, rounding=ROUND_HALF_UP)
+                for item in itens or []), Decimal('0.00'))
+
+
+def _normalizar_linha_item(linha):
+    """
+    Normaliza os valores de uma linha de nf_itens (sem nf_id e numero_item)
+    para comparação, aplicando as mesmas escalas das colunas DECIMAL do banco
+    """
+    normalizada = []
+    for valor, escala in zip(linha, _ESCALAS_ITEM):
+        if escala is None:
+            normalizada.append('' if valor is None else str(valor))
+        else:
+            normalizada.append(Decimal(str(valor or 0)).quantize(
+                escala, rounding=ROUND_HALF_UP))
+    return tuple(normalizada[2:])
+
+
+def atualizar_itens_lote(cursor, itens_por_nota):
+    """
+    Atualiza os itens de notas existentes aplicando apenas as diferenças pela
+    chave (nf_id, numero_item): itens iguais são mantidos, os novos e os
+    alterados são gravados com upsert multi-linha e os que deixaram de existir
+    são removidos com DELETE multi-linha. As linhas mantidas conservam o id.
+
+    Args:
+        cursor: Cursor (dictionary=True) da conexão em uso
+        itens_por_nota: {nf_id: lista de itens extraídos do XML}
+
+    Returns:
+        dict: Quantidade de itens mantidos, alterados, removidos e inseridos
+    """
+    contagem = {'mantidos': 0, 'alterados': 0, 'removidos': 0, 'inseridos': 0}
+    gravar = []
+    remover = []
+    ids_notas = list(itens_por_nota)
+    for inicio in range(0, len(ids_notas), LOTE_CONSULTA_CHAVES):
+        lote = ids_notas[inicio:inicio + LOTE_CONSULTA_CHAVES]
+        cursor.execute(f"""
+            SELECT nf_id, numero_item, codigo, descricao, quantidade,
+                   valor_unitario, valor_total
+            FROM nf_itens WHERE nf_id IN ({', '.join(['%s'] * len(lote))})
+        """, tuple(lote))
+        existentes = {
+            (linha['nf_id'], linha['numero_item']): _normalizar_linha_item((
+                None, None, linha['codigo'], linha['descricao'], linha['quantidade'],
+                linha['valor_unitario'], linha['valor_total']))
+            for linha in cursor.fetchall()}
+
+        for nf_id in lote:
+            for nova in linhas_itens(nf_id, itens_por_nota[nf_id]):
+                atual = existentes.pop(nova[:2], None)
+                if atual is None:
+                    contagem['inseridos'] += 1
+                elif atual == _normalizar_linha_item(nova):
+                    contagem['mantidos'] += 1
+                    continue
+                else:
+                    contagem['alterados'] += 1
+                gravar.append(nova)
+        # Sobram os itens que não existem mais no XML
+        remover.extend(existentes)
+
+    for lote in dividir_em_lotes(gravar):
+        cursor.execute(
+            SQL_UPSERT_ITENS.format(valores=", ".join([PLACEHOLDER_ITEM] * len(lote))),
+            [valor for linha in lote for valor in linha])
+
+    for inicio in range(0, len(remover), ITENS_LOTE_MAX_LINHAS):
+        chaves = remover[inicio:inicio + ITENS_LOTE_MAX_LINHAS]
+        cursor.execute(f"""
+            DELETE FROM nf_itens WHERE (nf_id, numero_item) IN ({', '.join(['(%s, %s)'] * len(chaves))})
+        """, [valor for chave in chaves for valor in chave])
+    contagem['removidos'] = len(remover)
+
+    logger.debug(f"Itens de {len(itens_por_nota)} NF atualizados: {contagem}")
+    return contagem
+
+
+def atualizar_itens_nfe(cursor, nf_id, itens):
+    """
+    Atualiza os itens de uma NF-e existente aplicando apenas as diferenças
+    (ver atualizar_itens_lote)
+
+    Returns:
+        dict: Quantidade de itens mantidos, alterados, removidos e inseridos
+    """
+    return atualizar_itens_lote(cursor, {nf_id: itens})
+
+
+class CacheHashNfe:
+    """
+    Hash do conteúdo já gravado por chave de acesso, pré-carregado em lote.
+    Permite descartar reimportações sem alteração antes do parse do XML.
+    """
+
+    def __init__(self):
+        self._hashes = {}
+
+    @etapa('consulta_banco')
+    def carregar(self, chaves):
+        """Pré-carrega em lote (consultas IN fatiadas) os hashes das chaves ainda desconhecidas"""
+        faltantes = list({chave for chave in chaves
+                          if chave and chave not in self._hashes})
+        for inicio in range(0, len(faltantes), LOTE_CONSULTA_CHAVES):
+            lote = faltantes[inicio:inicio + LOTE_CONSULTA_CHAVES]
+            linhas = execute_query(f"""
+                SELECT chave_acesso, hash_conteudo FROM nf_notas
+                WHERE chave_acesso IN ({', '.join(['%s'] * len(lote))})
+            """, tuple(lote), commit=False)
+            if linhas is None:
+                # Falha na consulta: sem cache, as notas seguem o fluxo normal
+                continue
+            for chave in lote:
+                self._hashes[chave] = None
+            for linha in linhas:
+                self._hashes[linha['chave_acesso']] = linha['hash_conteudo']
+
+    def inalterada(self, chave, hash_conteudo):
+        """Indica se a nota com esta chave já foi gravada com o mesmo conteúdo"""
+        if not chave or not hash_conteudo:
+            return False
+        if chave not in self._hashes:
+            self.carregar([chave])
+        return self._hashes.get(chave) == hash_conteudo
+
+    def registrar(self, chave, hash_conteudo):
+        """Registra o hash de uma nota recém-gravada"""
+        if chave and hash_conteudo:
+            self._hashes[chave] = hash_conteudo
+
+
+@etapa('consulta_banco')
+def consultar_notas_existentes(cursor, chaves):
+    """
+    Busca em lote (consultas IN fatiadas) as notas já gravadas
+
+    Args:
+        cursor: Cursor (dictionary=True) da conexão em uso
+        chaves: Iterável de chaves de acesso
+
+    Returns:
+        dict: {chave_acesso: linha} das chaves encontradas, com id, hash_conteudo
+            e as colunas do resumo diário (usadas para retirar a versão anterior)
+    """
+    chaves = list(dict.fromkeys(chave for chave in chaves if chave))
+    existentes = {}
+    for inicio in range(0, len(chaves), LOTE_CONSULTA_CHAVES):
+        lote = chaves[inicio:inicio + LOTE_CONSULTA_CHAVES]
+        cursor.execute(f"""
+            SELECT id, chave_acesso, hash_conteudo, data_importacao, data_emissao,
+                   status_processamento, cnpj_emitente, nome_emitente, valor_total
+            FROM nf_notas
+            WHERE chave_acesso IN ({', '.join(['%s'] * len(lote))})
+        """, tuple(lote))
+        for linha in cursor.fetchall():
+            existentes[linha['chave_acesso']] = linha
+    return existentes
+
+
+def _observacao_atualizacao():
+    return 'Atualizado em ' + datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+
+
+def linha_nota(nfe_data):
+    """
+    Converte os dados extraídos do XML na tupla de colunas do INSERT em nf_notas
+
+    Args:
+        nfe_data: Dicionário com os dados extraídos do XML (com access_key)
+
+    Returns:
+        tuple: Valores na ordem de PLACEHOLDER_NOTA
+    """
+    chave_acesso = nfe_data.get('access_key')
+    data_emissao = nfe_data.get('emission_date')
+
+    # Verificar se data_emissao está presente
+    if data_emissao is None:
+        # Usar a data atual como fallback
+        data_emissao = datetime.now()
+        logger.warning(
+            f"Data de emissão ausente para NFe {chave_acesso}, usando data atual como fallback")
+
+    return (
+        chave_acesso,
+        nfe_data.get('number', ''),
+        data_emissao,
+        nfe_data.get('value', 0),
+        nfe_data.get('cnpj_sender', ''),
+        nfe_data.get('sender_name', ''),
+        nfe_data.get('cnpj_receiver', ''),
+        nfe_data.get('receiver_name', ''),
+        nfe_data.get('hash_conteudo') or hash_conteudo_xml(nfe_data.get('xml', '')),
+        # Os itens são gravados na mesma transação, então os totais conferem com nf_itens
+        len(nfe_data.get('items') or []),
+        somar_itens(nfe_data.get('items')),
+        'importado',
+        'Importado em ' + datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+    )
+
+
+def linha_xml(nf_id, nfe_data):
+    """
+    Tupla (nf_id, xml comprimido) para nf_xml. Usa o XML já comprimido na
+    etapa de parse (xml_comprimido) quando disponível.
+    """
+    xml_comprimido = nfe_data.get('xml_comprimido')
+    if xml_comprimido is None:
+        xml_comprimido = comprimir_xml(nfe_data.get('xml', ''))
+    return (nf_id, xml_comprimido)
+
+
+def gravar_xml_lote(cursor, linhas):
+    """
+    Grava (ou substitui) o XML comprimido das notas em nf_xml com INSERT multi-linha
+
+    Args:
+        cursor: Cursor da conexão em uso (a transação fica a cargo do chamador)
+        linhas: Lista de tuplas geradas por linha_xml
+    """
+    for lote in dividir_em_lotes(linhas):
+        sql = SQL_UPSERT_XML.format(
+            valores=", ".join([PLACEHOLDER_XML] * len(lote)))
+        cursor.execute(sql, [valor for linha in lote for valor in linha])
+
+
+def acumular_resumo(resumo, linha, existente=None):
+    """
+    Registra no ResumoDiario a gravação de uma nota
+
+    Args:
+        resumo: ResumoDiario do lote
+        linha: Tupla gerada por linha_nota (versão gravada agora)
+        existente: Linha de nf_notas antes da gravação (None para nota nova)
+    """
+    _, _, data_emissao, valor, cnpj, nome = linha[:6]
+    if existente:
+        resumo.substituir(existente, data_emissao, cnpj, nome, valor)
+    else:
+        resumo.adicionar_nova(data_emissao, cnpj, nome, valor)
+
+
+def salvar_nfe(cursor, nfe_data):
+    """
+    Grava (insere ou atualiza) uma NF-e e seus itens usando o cursor informado.
+    O commit fica a cargo do chamador.
+
+    Args:
+        cursor: Cursor (dictionary=True) da conexão em uso
+        nfe_data: Dicionário com os dados extraídos do XML
+
+    Returns:
+        str: 'novo', 'atualizado', 'inalterado' ou 'erro'
+    """
+    # 1. Verificar se temos os dados mínimos necessários
+    if not isinstance(nfe_data, dict):
+        logger.error(
+            "Dados NFe inválidos após processamento, não é um dicionário")
+        return 'erro'
+
+    chave_acesso = nfe_data.get('access_key')
+    if not chave_acesso:
+        logger.error("Chave de acesso não encontrada nos dados")
+        return 'erro'
+
+    # 2. Extração de dados para persistência
+    linha = linha_nota(nfe_data)
+    hash_conteudo = linha[COLUNA_HASH_NOTA]
+
+    # 3. Verificar se a NFe já existe no banco
+    existente = consultar_notas_existentes(cursor, [chave_acesso]).get(chave_acesso)
+
+    if existente and existente['hash_conteudo'] == hash_conteudo:
+        # Mesmo conteúdo já importado: nada a gravar
+        logger.debug(f"NFe {chave_acesso} sem alterações, ignorada")
+        return 'inalterado'
+
+    cursor.execute(SQL_UPSERT_NOTAS.format(valores=PLACEHOLDER_NOTA),
+                   linha + (_observacao_atualizacao(),))
+
+    nf_id = existente['id'] if existente else cursor.lastrowid
+    if not nf_id:
+        # Gravada por outra importação depois da consulta: o upsert atualizou a
+        # linha e lastrowid vem 0, então o id é buscado pela chave (como no lote)
+        existente = consultar_notas_existentes(cursor, [chave_acesso]).get(chave_acesso)
+        if not existente:
+            logger.error(f"ID da NFe {chave_acesso} não encontrado após a gravação")
+            return 'erro'
+        nf_id = existente['id']
+    gravar_xml_lote(cursor, [linha_xml(nf_id, nfe_data)])
+
+    resumo = ResumoDiario()
+    acumular_resumo(resumo, linha, existente)
+    resumo.gravar(cursor)
+
+    if existente:
+        # Aplicar apenas as diferenças nos itens
+        contar_itens(atualizar_itens_nfe(cursor, nf_id, nfe_data.get('items', [])))
+        logger.debug(f"NFe {chave_acesso} atualizada com sucesso")
+        return 'atualizado'
+
+    # 4. Processamento de itens da NFe inserida
+    contar_itens({'inseridos': inserir_itens_nfe(cursor, nf_id, nfe_data.get('items', []))})
+    logger.debug(f"NFe {chave_acesso} inserida com sucesso")
+
+    return 'novo'
+
+
+def gravar_cabecalhos_lote(cursor, linhas):
+    """
+    Insere ou atualiza cabeçalhos em nf_notas com INSERT multi-linha
+    ... ON DUPLICATE KEY UPDATE (chave_acesso é UNIQUE)
+
+    Args:
+        cursor: Cursor da conexão em uso (a transação fica a cargo do chamador)
+        linhas: Lista de tuplas geradas por linha_nota
+
+    Returns:
+        int: Número de notas enviadas
+    """
+    observacao = _observacao_atualizacao()
+    total = 0
+    for lote in dividir_em_lotes(linhas):
+        sql = SQL_UPSERT_NOTAS.format(
+            valores=", ".join([PLACEHOLDER_NOTA] * len(lote)))
+        params = [valor for linha in lote for valor in linha]
+        params.append(observacao)
+        cursor.execute(sql, params)
+        total += len(lote)
+    return total
+
+
+def _salvar_lote_agrupado(cursor, notas):
+    """
+    Grava um lote com poucas consultas: uma busca IN das chaves existentes,
+    upsert multi-linha dos cabeçalhos, uma busca IN dos IDs das notas novas,
+    upsert multi-linha dos XMLs, INSERT multi-linha dos itens das notas novas,
+    as diferenças nos itens das notas atualizadas (uma busca IN, um upsert e
+    um DELETE multi-linha) e um upsert multi-linha no resumo diário.
+    Qualquer exceção deve ser tratada pelo chamador (ROLLBACK do lote).
+
+    Returns:
+        list: Status de cada nota, na mesma ordem
+    """
+    status_notas = ['erro'] * len(notas)
+    validas = []
+    for indice, nfe_data in enumerate(notas):
+        if not nfe_data:
+            continue
+        if not isinstance(nfe_data, dict) or not nfe_data.get('access_key'):
+            logger.error("Chave de acesso não encontrada nos dados")
+            continue
+        linha = linha_nota(nfe_data)
+        nfe_data['hash_conteudo'] = linha[COLUNA_HASH_NOTA]
+        validas.append((indice, nfe_data, linha))
+
+    existentes = consultar_notas_existentes(
+        cursor, (nfe_data['access_key'] for _, nfe_data, _ in validas))
+
+    # Última versão de cada chave no lote; repetições se comportam como na
+    # gravação nota a nota (a segunda ocorrência atualiza ou fica inalterada)
+    gravar = {}
+    for indice, nfe_data, linha in validas:
+        chave = nfe_data['access_key']
+        if chave in gravar:
+            hash_atual = gravar[chave][0]['hash_conteudo']
+        elif chave in existentes:
+            hash_atual = existentes[chave]['hash_conteudo']
+        else:
+            status_notas[indice] = 'novo'
+            gravar[chave] = (nfe_data, linha)
+            continue
+
+        if hash_atual == nfe_data['hash_conteudo']:
+            status_notas[indice] = 'inalterado'
+        else:
+            status_notas[indice] = 'atualizado'
+            gravar[chave] = (nfe_data, linha)
+
+    if not gravar:
+        return status_notas
+
+    gravar_cabecalhos_lote(cursor, [linha for _, linha in gravar.values()])
+
+    novas = [chave for chave in gravar if chave not in existentes]
+    ids_novas = consultar_notas_existentes(cursor, novas)
+    gravar_xml_lote(cursor, [
+        linha_xml((existentes.get(chave) or ids_novas[chave])['id'], nfe_data)
+        for chave, (nfe_data, _) in gravar.items()])
+    inseridos = inserir_linhas_itens(cursor, (
+        linha
+        for chave in novas
+        for linha in linhas_itens(ids_novas[chave]['id'], gravar[chave][0].get('items'))))
+
+    itens = atualizar_itens_lote(cursor, {
+        existentes[chave]['id']: nfe_data.get('items', [])
+        for chave, (nfe_data, _) in gravar.items() if chave in existentes})
+
+    resumo = ResumoDiario()
+    for chave, (_, linha) in gravar.items():
+        acumular_resumo(resumo, linha, existentes.get(chave))
+    resumo.gravar(cursor)
+
+    # Contados só depois da última gravação: se o lote falhar, ele é refeito nota a nota
+    itens['inseridos'] += inseridos
+    contar_itens(itens)
+    logger.debug(f"Lote de {len(notas)} NFe gravado: {len(novas)} novas, "
+                 f"{len(gravar) - len(novas)} atualizadas (itens: {itens})")
+    return status_notas
+
+
+def _salvar_lote_por_nota(cursor, notas):
+    """
+    Grava um lote nota a nota, com um SAVEPOINT por nota para que uma falha
+    descarte apenas a própria nota
+
+    Returns:
+        list: Status de cada nota, na mesma ordem
+    """
+    status_notas = []
+    for nfe_data in notas:
+        if not nfe_data:
+            status_notas.append('erro')
+            continue
+
+        cursor.execute("SAVEPOINT nfe_lote")
+        try:
+            status = salvar_nfe(cursor, nfe_data)
+        except Exception as e:
+            logger.error(
+                f"Erro ao salvar NFe {nfe_data.get('access_key')}: {str(e)}", exc_info=True)
+            status = 'erro'
+
+        if status == 'erro':
+            cursor.execute("ROLLBACK TO SAVEPOINT nfe_lote")
+        status_notas.append(status)
+    return status_notas
+
+
+@etapa('gravacao_banco')
+def salvar_lote_nfe(notas, cache=None):
+    """
+    Grava um lote de NF-e em uma única conexão e transação.
+    As chaves existentes são buscadas em lote e os cabeçalhos gravados com
+    upsert multi-linha; se o lote falhar, ele é refeito nota a nota (com um
+    SAVEPOINT por nota), então uma falha descarta apenas a própria nota.
+
+    Args:
+        notas: Lista de dicionários de NF-e (None indica falha no parse)
+        cache: CacheHashNfe opcional, atualizado com as notas gravadas
+
+    Returns:
+        list: Status de cada nota ('novo', 'atualizado', 'inalterado' ou 'erro'), na mesma ordem
+    """
+    if not notas:
+        return []
+
+    connection = get_pooled_connection()
+    if not connection:
+        logger.error("Não foi possível conectar ao banco de dados")
+        return ['erro'] * len(notas)
+
+    cursor = None
+    try:
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("SAVEPOINT nfe_lote_agrupado")
+        try:
+            status_notas = _salvar_lote_agrupado(cursor, notas)
+        except Exception as e:
+            logger.warning(
+                f"Falha na gravação agrupada do lote, gravando nota a nota: {str(e)}")
+            cursor.execute("ROLLBACK TO SAVEPOINT nfe_lote_agrupado")
+            status_notas = _salvar_lote_por_nota(cursor, notas)
+
+        connection.commit()
+        if cache is not None:
+            for nfe_data, status in zip(notas, status_notas):
+                if status != 'erro':
+                    cache.registrar(nfe_data.get('access_key'),
+                                    nfe_data.get('hash_conteudo'))
+        return status_notas
+    except Exception as e:
+        logger.error(f"Erro ao salvar lote de NFe: {str(e)}", exc_info=True)
+        connection.rollback()
+        return ['erro'] * len(notas)
+    finally:
+        if cursor:
+            cursor.close()
+        connection.close()
@@ -0,0 +1,131 @@
+"""
+Resumo diário das notas fiscais (nf_resumo_diario) para o painel e relatórios
+
+Cada linha acumula a quantidade e o valor das notas de um dia de importação,
+dia de emissão, status e emitente. A importação soma (e, nas atualizações,
+subtrai a versão anterior da nota) na mesma transação em que grava nf_notas,
+então o painel e os relatórios leem o resumo sem varrer nf_notas.
+Para recalcular o histórico: scripts/reconstruir_resumo_nf.py
+"""
+import logging
+from datetime import date, datetime
+from decimal import Decimal, ROUND_HALF_UP
+
+logger = logging.getLogger('importacao_xml')
+
+# Soma (ou subtrai) as contribuições; o nome do emitente acompanha a versão mais recente
+SQL_ACUMULAR_RESUMO = """
+    INSERT INTO nf_resumo_diario (
+        dia_importacao, dia_emissao, status_processamento, cnpj_emitente,
+        nome_emitente, total_notas, valor_total
+    ) VALUES {valores}
+    ON DUPLICATE KEY UPDATE
+        nome_emitente = IF(VALUES(total_notas) > 0, VALUES(nome_emitente), nome_emitente),
+        total_notas = total_notas + VALUES(total_notas),
+        valor_total = valor_total + VALUES(valor_total)"""
+# Notas novas são importadas hoje segundo o relógio do banco (data_importacao = NOW())
+PLACEHOLDER_RESUMO_HOJE = "(CURDATE(), %s, %s, %s, %s, %s, %s)"
+PLACEHOLDER_RESUMO = "(%s, %s, %s, %s, %s, %s, %s)"
+
+SQL_RECONSTRUIR_RESUMO = """
+    INSERT INTO nf_resumo_diario (
+        dia_importacao, dia_emissao, status_processamento, cnpj_emitente,
+        nome_emitente, total_notas, valor_total
+    )
+    SELECT DATE(data_importacao), DATE(data_emissao), status_processamento,
+           cnpj_emitente, MAX(nome_emitente), COUNT(*), SUM(valor_total)
+    FROM nf_notas
+    WHERE data_importacao >= %s AND data_importacao < %s + INTERVAL 1 DAY
+    GROUP BY DATE(data_importacao), DATE(data_emissao), status_processamento, cnpj_emitente"""
+
+_CENTAVOS = Decimal('0.01')
+
+
+def _dia(valor):
+    """Data (sem hora) de um datetime/date ou texto 'AAAA-MM-DD...'"""
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    return datetime.strptime(str(valor)[:10], '%Y-%m-%d').date()
+
+
+class ResumoDiario:
+    """
+    Acumula as variações do resumo diário de um lote de gravações e as aplica
+    com um único INSERT multi-linha ... ON DUPLICATE KEY UPDATE
+    """
+
+    def __init__(self):
+        self._variacoes = {}
+
+    def _acumular(self, dia_importacao, data_emissao, status, cnpj, nome, valor, sinal):
+        chave = (dia_importacao and _dia(dia_importacao), _dia(data_emissao),
+                 status, cnpj or '')
+        quantidade, total, nome_atual = self._variacoes.get(chave, (0, Decimal('0'), ''))
+        valor = Decimal(str(valor or 0)).quantize(_CENTAVOS, rounding=ROUND_HALF_UP)
+        self._variacoes[chave] = (quantidade + sinal, total + sinal * valor,
+                                  (nome or '') if sinal > 0 else nome_atual)
+
+    def adicionar_nova(self, data_emissao, cnpj, nome, valor):
+        """Nota inserida agora (status 'importado', importada hoje)"""
+        self._acumular(None, data_emissao, 'importado', cnpj, nome, valor, 1)
+
+    def substituir(self, anterior, data_emissao, cnpj, nome, valor):
+        """
+        Nota existente atualizada: retira a versão gravada e soma a nova
+        (status 'atualizado', mesmo dia de importação)
+
+        Args:
+            anterior: Linha de nf_notas antes da atualização (data_importacao,
+                data_emissao, status_processamento, cnpj_emitente, nome_emitente, valor_total)
+        """
+        self.remover(anterior)
+        self._acumular(anterior['data_importacao'], data_emissao, 'atualizado',
+                       cnpj, nome, valor, 1)
+
+    def remover(self, nota):
+        """Retira a contribuição de uma nota gravada (linha de nf_notas)"""
+        self._acumular(nota['data_importacao'], nota['data_emissao'],
+                       nota['status_processamento'], nota['cnpj_emitente'],
+                       nota['nome_emitente'], nota['valor_total'], -1)
+
+    def gravar(self, cursor):
+        """
+        Aplica as variações acumuladas usando o cursor informado (na transação
+        das notas) e limpa o acumulador
+
+        Returns:
+            int: Linhas do resumo afetadas
+        """
+        variacoes = [(chave, variacao) for chave, variacao in self._variacoes.items()
+                     if variacao[0] or variacao[1]]
+        self._variacoes = {}
+        if not variacoes:
+            return 0
+
+        placeholders = []
+        params = []
+        for (dia_importacao, dia_emissao, status, cnpj), (quantidade, total, nome) in variacoes:
+            if dia_importacao is None:
+                placeholders.append(PLACEHOLDER_RESUMO_HOJE)
+            else:
+                placeholders.append(PLACEHOLDER_RESUMO)
+                params.append(dia_importacao)
+            params.extend([dia_emissao, status, cnpj, nome, quantidade, total])
+
+        cursor.execute(SQL_ACUMULAR_RESUMO.format(valores=", ".join(placeholders)), params)
+        return len(variacoes)
+
+
+def reconstruir_resumo_dia(cursor, dia):
+    """
+    Recalcula a partir de nf_notas o resumo de um dia de importação.
+    O commit fica a cargo do chamador.
+
+    Returns:
+        int: Linhas do resumo gravadas
+    """
+    cursor.execute("DELETE FROM nf_resumo_diario WHERE dia_importacao = %s", (dia,))
+    cursor.execute(SQL_RECONSTRUIR_RESUMO, (dia, dia))
+    return cursor.rowcount
@@ -0,0 +1,207 @@
+"""
+Recepção em streaming dos uploads multipart da importação de XML/ZIP
+
+O corpo da requisição é lido em blocos direto do WSGI, sem o parse de
+formulário do Werkzeug (que só devolve o controle depois de receber todo o
+upload). Cada arquivo é gravado em disco à medida que os bytes chegam e
+entregue ao chamador assim que termina, enquanto os próximos ainda estão sendo
+recebidos. Os limites por arquivo e do upload inteiro são verificados a cada
+bloco.
+"""
+import os
+import logging
+
+from werkzeug.exceptions import ClientDisconnected, RequestEntityTooLarge
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import MultipartDecoder, Field, File, Data, Epilogue, NeedData
+from werkzeug.utils import secure_filename
+from werkzeug.wsgi import get_input_stream
+
+logger = logging.getLogger('importacao_xml')
+
+MB = 1024 * 1024
+
+# Tamanho máximo de cada arquivo e do upload inteiro
+LIMITE_ARQUIVO = int(os.environ.get('NF_UPLOAD_LIMITE_ARQUIVO_MB', 500)) * MB
+LIMITE_UPLOAD = int(os.environ.get('NF_UPLOAD_LIMITE_TOTAL_MB', 2048)) * MB
+# Bytes lidos da requisição por vez
+TAMANHO_BLOCO = 256 * 1024
+# Limite dos campos de formulário (csrf_token etc.), mantidos em memória
+LIMITE_CAMPOS = 64 * 1024
+# Campo que, se for o primeiro do formulário, é recebido antes da validação
+CAMPO_CSRF = 'csrf_token'
+
+
+class ErroUpload(Exception):
+    """Upload inválido (formato, campos ou tamanho)"""
+
+
+class ReceptorUpload:
+    """
+    Lê um upload multipart/form-data em streaming, gravando os arquivos do
+    campo `campo_arquivos` no diretório de destino
+
+    Arquivos acima do limite são descartados (com aviso) sem interromper os
+    demais; um upload acima do limite total é interrompido com ErroUpload.
+    """
+
+    def __init__(self, environ, destino, campo_arquivos='files[]',
+                 limite_arquivo=None, limite_upload=None, validar_campos=None):
+        """
+        Args:
+            environ: Ambiente WSGI da requisição (request.environ)
+            destino: Diretório onde os arquivos são gravados
+            campo_arquivos: Nome do campo de arquivos do formulário
+            limite_arquivo: Tamanho máximo de cada arquivo em bytes
+            limite_upload: Tamanho máximo da requisição em bytes
+            validar_campos: Função chamada uma única vez com os campos de
+                texto recebidos (ex.: validação do token CSRF); deve levantar
+                uma exceção para recusar o upload. É chamada ao fim do campo
+                csrf_token, se ele for a primeira parte do formulário; senão,
+                no início da primeira parte (sem campos, restando o cabeçalho
+                X-CSRFToken) ou, sem nenhuma parte, no fim do envio
+        """
+        self.environ = environ
+        self.destino = destino
+        self.campo_arquivos = campo_arquivos
+        self.limite_arquivo = limite_arquivo or LIMITE_ARQUIVO
+        self.limite_upload = limite_upload or LIMITE_UPLOAD
+        self.validar_campos = validar_campos
+        self.campos = {}
+        self.avisos = []
+        self.recebidos = []
+        self.bytes_recebidos = 0
+
+    def _validar(self):
+        if self.validar_campos:
+            self.validar_campos(self.campos)
+
+    def _caminho_destino(self, nome):
+        # Nomes repetidos no mesmo upload não sobrescrevem o arquivo anterior
+        base, extensao = os.path.splitext(nome)
+        caminho = os.path.join(self.destino, nome)
+        sequencia = 1
+        while os.path.exists(caminho):
+            caminho = os.path.join(self.destino, f"{base}_{sequencia}{extensao}")
+            sequencia += 1
+        return caminho
+
+    def _abrir_stream(self):
+        tipo, opcoes = parse_options_header(self.environ.get('CONTENT_TYPE', ''))
+        boundary = opcoes.get('boundary')
+        if tipo != 'multipart/form-data' or not boundary:
+            raise ErroUpload('O envio deve ser multipart/form-data')
+
+        try:
+            stream = get_input_stream(
+                self.environ, max_content_length=self.limite_upload)
+        except RequestEntityTooLarge:
+            raise ErroUpload(
+                f'O envio excede o limite de {self.limite_upload // MB} MB')
+        return stream, boundary.encode('latin-1')
+
+    def arquivos(self):
+        """
+        Recebe o upload e entrega cada arquivo assim que ele termina de chegar
+
+        Yields:
+            tuple: (nome_arquivo, caminho) de cada arquivo gravado
+        """
+        stream, boundary = self._abrir_stream()
+        decoder = MultipartDecoder(boundary)
+        campos_validados = False
+        primeira_parte = True
+
+        parte = None
+        arquivo = None
+        caminho = None
+        nome = None
+        tamanho = 0
+        valor_campo = []
+
+        try:
+            while True:
+                bloco = stream.read(TAMANHO_BLOCO)
+                self.bytes_recebidos += len(bloco)
+                decoder.receive_data(bloco or None)
+
+                evento = decoder.next_event()
+                while not isinstance(evento, (Epilogue, NeedData)):
+                    if isinstance(evento, (Field, File)):
+                        # Só o csrf_token como primeira parte é aguardado; a
+                        # validação não depende de campos enviados depois
+                        if not campos_validados and not (
+                                primeira_parte and isinstance(evento, Field)
+                                and evento.name == CAMPO_CSRF):
+                            self._validar()
+                            campos_validados = True
+                        primeira_parte = False
+
+                    if isinstance(evento, Field):
+                        parte = evento
+                        valor_campo = []
+
+                    elif isinstance(evento, File):
+                        parte = evento
+
+                        nome = secure_filename(evento.filename or '')
+                        tamanho = 0
+                        if evento.name == self.campo_arquivos and nome:
+                            caminho = self._caminho_destino(nome)
+                            arquivo = open(caminho, 'wb')
+
+                    elif isinstance(evento, Data):
+                        if isinstance(parte, Field):
+                            valor_campo.append(evento.data)
+                            if sum(map(len, valor_campo)) > LIMITE_CAMPOS:
+                                raise ErroUpload(
+                                    f'Campo {parte.name} excede o tamanho permitido')
+                            if not evento.more_data:
+                                self.campos[parte.name] = b''.join(
+                                    valor_campo).decode('utf-8', 'replace')
+                                if not campos_validados and parte.name == CAMPO_CSRF:
+                                    self._validar()
+                                    campos_validados = True
+
+                        elif arquivo is not None:
+                            tamanho += len(evento.data)
+                            if tamanho > self.limite_arquivo:
+                                # Descarta o restante deste arquivo e segue para o próximo
+                                arquivo.close()
+                                os.remove(caminho)
+                                arquivo = None
+                                self.avisos.append((
+                                    'danger',
+                                    f'{nome} excede o limite de {self.limite_arquivo // MB} MB por arquivo e foi ignorado'))
+                                logger.warning(f"Upload de {nome} interrompido: acima do limite por arquivo")
+                            else:
+                                arquivo.write(evento.data)
+                                if not evento.more_data:
+                                    arquivo.close()
+                                    arquivo = None
+                                    logger.info(
+                                        f"Arquivo recebido: {caminho} ({tamanho/1024:.2f} KB)")
+                                    self.recebidos.append(nome)
+                                    yield nome, caminho
+
+                    evento = decoder.next_event()
+
+                if isinstance(evento, Epilogue) or not bloco:
+                    break
+
+            # Envio sem nenhuma parte (ou terminado no meio do csrf_token)
+            if not campos_validados:
+                self._validar()
+        except RequestEntityTooLarge:
+            raise ErroUpload(
+                f'O envio excede o limite de {self.limite_upload // MB} MB')
+        except ClientDisconnected:
+            raise ErroUpload('O envio foi interrompido antes de terminar')
+        except ValueError as e:
+            # Erros de formato levantados pelo MultipartDecoder
+            raise ErroUpload(f'Envio multipart inválido: {str(e)}')
+        finally:
+            if arquivo is not None:
+                # Upload interrompido no meio de um arquivo
+                arquivo.close()
+                os.remove(caminho)
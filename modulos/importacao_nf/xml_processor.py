@@ -152,7 +152,6 @@ def process_xml_file(file_path):
 
         # Adicionar itens ao dicionário de retorno
         nfe_data['items'] = itens
-        print(nfe_data)
         return nfe_data
 
     except Exception as e:
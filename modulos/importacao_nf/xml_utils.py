@@ -2,64 +2,230 @@
 Utilitários para processamento de XML e Base64 para o módulo de importação NF
 """
 import base64
+import binascii
+import codecs
+import hashlib
 import os
-import tempfile
+import re
+import zlib
 import logging
 from datetime import datetime
 
 logger = logging.getLogger('importacao_xml')
 
+# Nível de compressão zlib do XML armazenado em nf_xml (1 = rápido, 9 = menor)
+NIVEL_COMPRESSAO_XML = int(os.environ.get('NF_XML_NIVEL_COMPRESSAO', 6))
+
+# Codificações tentadas, em ordem, quando o XML não declara a sua
+CODIFICACOES_XML = ['utf-8', 'latin1', 'iso-8859-1', 'cp1252']
+
+_BOMS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+_RE_ENCODING_PROLOGO = re.compile(
+    rb'^\s*<\?xml[^>]*?encoding\s*=\s*["\']([A-Za-z0-9._-]+)["\']')
+
+
+def detectar_codificacao_xml(dados):
+    """
+    Identifica a codificação de um XML pelo BOM ou pela declaração do prólogo
+
+    Args:
+        dados: Conteúdo do XML em bytes
+
+    Returns:
+        str: Nome da codificação ou None se não for possível identificar
+    """
+    for bom, encoding in _BOMS:
+        if dados.startswith(bom):
+            return encoding
+
+    match = _RE_ENCODING_PROLOGO.match(dados[:200])
+    if match:
+        encoding = match.group(1).decode('ascii').lower()
+        try:
+            return codecs.lookup(encoding).name
+        except LookupError:
+            logger.warning(f"Codificação desconhecida no prólogo do XML: {encoding}")
+    return None
+
+
+def codificacoes_candidatas(dados):
+    """Lista as codificações a tentar: a detectada no XML seguida das padrão"""
+    detectada = detectar_codificacao_xml(dados)
+    if not detectada:
+        return list(CODIFICACOES_XML)
+    return [detectada] + [enc for enc in CODIFICACOES_XML
+                          if codecs.lookup(enc).name != detectada]
+
+
+_RE_CHAVE_ACESSO = re.compile(rb'Id\s*=\s*["\']NFe([0-9]{44})["\']')
+
+
+def chave_acesso_rapida(dados):
+    """
+    Localiza a chave de acesso (atributo Id do infNFe) nos bytes do XML,
+    sem decodificar nem fazer o parse do documento
+
+    Args:
+        dados: Conteúdo do XML em bytes
+
+    Returns:
+        str: Chave de acesso com 44 dígitos ou None se não encontrada
+    """
+    # O infNFe fica no início do documento; só varre o restante se preciso
+    match = _RE_CHAVE_ACESSO.search(dados, 0, 4096) or _RE_CHAVE_ACESSO.search(dados)
+    return match.group(1).decode('ascii') if match else None
+
+
+def hash_conteudo_xml(dados):
+    """
+    Calcula o hash SHA-256 (hex) do conteúdo de um XML, usado para
+    identificar reimportações sem alteração
+
+    Args:
+        dados: Conteúdo em bytes ou str (codificado em UTF-8)
+
+    Returns:
+        str: Hash com 64 caracteres hexadecimais
+    """
+    if isinstance(dados, str):
+        dados = dados.encode('utf-8')
+    return hashlib.sha256(dados).hexdigest()
+
+
+def comprimir_xml(xml_content):
+    """
+    Comprime o texto de um XML para armazenamento em nf_xml
+
+    Args:
+        xml_content: Conteúdo do XML em str (gravado como UTF-8) ou bytes
+
+    Returns:
+        bytes: Conteúdo comprimido com zlib
+    """
+    if isinstance(xml_content, str):
+        xml_content = xml_content.encode('utf-8')
+    return zlib.compress(xml_content or b'', NIVEL_COMPRESSAO_XML)
+
+
+def descomprimir_xml(dados):
+    """
+    Restaura o texto de um XML gravado por comprimir_xml
+
+    Args:
+        dados: Conteúdo comprimido (bytes)
+
+    Returns:
+        str: Conteúdo do XML
+    """
+    return zlib.decompress(bytes(dados)).decode('utf-8')
+
+
+def decodificar_bytes_xml(dados, encoding):
+    """
+    Decodifica o XML como a leitura em modo texto faria: ignora bytes
+    inválidos e normaliza as quebras de linha para \\n
+
+    Args:
+        dados: Conteúdo do XML em bytes
+        encoding: Codificação a usar
+
+    Returns:
+        str: Conteúdo decodificado
+    """
+    texto = dados.decode(encoding, errors='ignore')
+    if '\r' in texto:
+        texto = texto.replace('\r\n', '\n').replace('\r', '\n')
+    return texto
+
+
+# Caracteres do início de um texto usados para reconhecer Base64 (a string
+# inteira, às vezes com vários MB, não é percorrida)
+PREFIXO_BASE64 = 512
+_RE_BASE64 = re.compile(r'[A-Za-z0-9+/=\s]+')
+_RE_ESPACOS = re.compile(r'\s+')
+
+
+def parece_xml_base64(texto):
+    """
+    Indica se um texto parece um XML codificado em Base64, examinando apenas
+    os primeiros PREFIXO_BASE64 caracteres: devem pertencer ao alfabeto Base64
+    e sua decodificação deve começar como um XML (BOM, espaços e '<')
+
+    Args:
+        texto: String potencialmente em Base64
+
+    Returns:
+        bool: True se o início do texto é Base64 de um XML
+    """
+    prefixo = texto[:PREFIXO_BASE64].lstrip()
+    if not prefixo or not _RE_BASE64.fullmatch(prefixo):
+        return False
+
+    amostra = _RE_ESPACOS.sub('', prefixo)
+    amostra = amostra[:len(amostra) // 4 * 4]
+    try:
+        inicio = base64.b64decode(amostra)
+    except (binascii.Error, ValueError):
+        return False
+
+    for bom, _ in _BOMS:
+        if inicio.startswith(bom):
+            return True
+    return inicio.lstrip()[:1] == b'<'
+
+
+def decodificar_base64_bytes(base64_str):
+    """
+    Decodifica Base64 em uma única passada, sem cópias intermediárias:
+    quebras de linha e espaços são descartados pelo próprio decodificador
+
+    Args:
+        base64_str: String (ou bytes) em Base64
+
+    Returns:
+        bytes: Conteúdo decodificado ou None se não for Base64 válido
+    """
+    try:
+        return base64.b64decode(base64_str, validate=False)
+    except (binascii.Error, ValueError) as e:
+        logger.error(f"Erro ao decodificar Base64: {str(e)}")
+        return None
+
 
 def decodificar_base64_xml(base64_str):
     """
-    Decodifica um XML em Base64
+    Decodifica um XML em Base64. O texto é decodificado com a codificação
+    declarada no próprio XML (BOM ou prólogo), tentando as padrão só se ela falhar.
 
     Args:
         base64_str: String em formato Base64
 
     Returns:
-        dict: Dados processados ou None se falhar
+        dict: {'xml_bytes', 'xml_content', 'encoding'} ou None se falhar
     """
-    try:
-        # Remover espaços e quebras de linha
-        base64_str = base64_str.replace(
-            " ", "").replace("\n", "").replace("\r", "")
-
-        # Decodificar Base64
-        xml_bytes = base64.b64decode(base64_str)
-
-        # Tentar diferentes codificações
-        xml_content = None
-        for encoding in ['utf-8', 'latin1', 'iso-8859-1', 'cp1252']:
-            try:
-                xml_content = xml_bytes.decode(encoding)
-                logger.info(f"XML decodificado com sucesso usando {encoding}")
-                break
-            except UnicodeDecodeError:
-                continue
-
-        if not xml_content:
-            logger.error(
-                "Falha ao decodificar XML Base64 com todas as codificações tentadas")
-            return None
-
-        # Salvar em arquivo temporário
-        temp_file = tempfile.NamedTemporaryFile(
-            mode='w', suffix='.xml', delete=False, encoding='utf-8')
-        temp_file.write(xml_content)
-        temp_file_path = temp_file.name
-        temp_file.close()
-
-        logger.info(
-            f"XML Base64 salvo em arquivo temporário: {temp_file_path}")
+    xml_bytes = decodificar_base64_bytes(base64_str)
+    if xml_bytes is None:
+        return None
 
+    for encoding in codificacoes_candidatas(xml_bytes):
+        try:
+            xml_content = xml_bytes.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+        logger.debug(f"XML Base64 decodificado usando {encoding}")
         return {
+            'xml_bytes': xml_bytes,
             'xml_content': xml_content,
-            'temp_file_path': temp_file_path
+            'encoding': encoding
         }
-    except Exception as e:
-        logger.error(f"Erro ao decodificar XML Base64: {str(e)}")
-        return None
+
+    logger.error(
+        "Falha ao decodificar XML Base64 com todas as codificações tentadas")
+    return None
 
 
 def identificar_xml_base64(nfe_data):
@@ -71,14 +237,11 @@ def identificar_xml_base64(nfe_data):
     Returns:
         str: String Base64 ou None
     """
-    # Se nfe_data for uma string, retornar diretamente para verificação
+    # Se nfe_data for uma string, verificar diretamente
     if isinstance(nfe_data, str):
         # Verificar se a string é grande o suficiente para ser Base64 de um XML
-        if len(nfe_data) > 100:
-            # Verificação adicional para confirmar que parece Base64
-            import re
-            if re.match(r'^[A-Za-z0-9+/=]+$', nfe_data.strip()):
-                return nfe_data
+        if len(nfe_data) > 100 and parece_xml_base64(nfe_data):
+            return nfe_data
         return None
 
     # Se não for string nem dicionário, não pode conter Base64
@@ -86,21 +249,10 @@ def identificar_xml_base64(nfe_data):
         return None
 
     # Verificar campos comuns onde APIs podem enviar XML em Base64
-    possivel_base64 = None
-
-    if 'xml' in nfe_data and isinstance(nfe_data['xml'], str) and len(nfe_data['xml']) > 100:
-        possivel_base64 = nfe_data['xml']
-    elif 'xml_content' in nfe_data and isinstance(nfe_data['xml_content'], str) and len(nfe_data['xml_content']) > 100:
-        possivel_base64 = nfe_data['xml_content']
-    elif 'content' in nfe_data and isinstance(nfe_data['content'], str) and len(nfe_data['content']) > 100:
-        possivel_base64 = nfe_data['content']
-    elif 'data' in nfe_data and isinstance(nfe_data['data'], str) and len(nfe_data['data']) > 100:
-        possivel_base64 = nfe_data['data']
-
-    # Verificação adicional para confirmar que parece Base64
-    if possivel_base64:
-        import re
-        if re.match(r'^[A-Za-z0-9+/=]+$', possivel_base64.strip()):
-            return possivel_base64
+    for campo in ('xml', 'xml_content', 'content', 'data'):
+        valor = nfe_data.get(campo)
+        if isinstance(valor, str) and len(valor) > 100:
+            # Só o primeiro campo candidato é considerado, como antes
+            return valor if parece_xml_base64(valor) else None
 
     return None
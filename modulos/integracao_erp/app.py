@@ -5,8 +5,6 @@ import tempfile
 import shutil
 import logging
 from datetime import datetime
-import re
-from bs4 import BeautifulSoup
 from playwright.async_api import Playwright, async_playwright, expect
 import asyncio
 import mysql.connector
@@ -16,6 +14,8 @@ from mysql.connector import Error
 from utils.db import get_db_connection, execute_query, get_single_result, insert_data, update_data
 from utils.auth import login_obrigatorio, admin_obrigatorio, verificar_login_api, get_user_id
 from utils.crypto import decrypt_password
+from modulos.integracao_erp.processor import processar_arquivo_batch
+from modulos.integracao_erp.persistencia import CargaTransacoes, criar_tabela_transacoes, SUBSTITUIR_PERIODO
 
 # Configuração de logging centralizada
 log_dir = os.path.join(os.path.dirname(os.path.dirname(
@@ -115,209 +115,75 @@ async def download_erp_report(credentials):
         logger.error(f"Erro na automação do ERP: {str(e)}", exc_info=True)
         return None
 
-# Função para extrair dados do arquivo XLS (formato HTML)
 
-
-def extrair_dados_xls(arquivo_path):
+def importar_arquivo_erp(arquivo_path, substituir_periodo=None, periodo=None):
     """
-    Extrai dados do arquivo XLS em formato HTML
-
-    Args:
-        arquivo_path (str): Caminho para o arquivo XLS
-
-    Returns:
-        list: Lista de dicionários com os dados extraídos
-    """
-    dados = []
-
-    try:
-        logger.info(f"Processando arquivo: {arquivo_path}")
+    Lê um relatório do ERP e grava os registros no banco em lotes
 
-        # Ler o conteúdo do arquivo HTML
-        with open(arquivo_path, 'r', encoding='utf-8', errors='ignore') as file:
-            html_content = file.read()
-
-        # Substituir entidades HTML comuns
-        html_content = html_content.replace('&nbsp;', ' ')
-
-        # Parsear o HTML usando BeautifulSoup
-        soup = BeautifulSoup(html_content, 'html.parser')
-
-        # Data de processamento
-        data_processamento = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-        # Encontrar tabelas no HTML
-        tabelas = soup.find_all('table')
-
-        if not tabelas:
-            logger.warning("Nenhuma tabela encontrada no arquivo")
-            return dados
-
-        # Encontrar a tabela principal (geralmente a maior)
-        tabela_principal = max(tabelas, key=lambda t: len(t.find_all('tr')))
-
-        # Variáveis para rastrear
-        centro_custo_atual = None
-        categoria_atual = None
-
-        # Índices das colunas
-        indices = {
-            'data_pagamento': 2,
-            'documento': 3,
-            'emitente': 4,
-            'historico': 6,
-            'valor': 10
-        }
-
-        # Processar linhas
-        rows = tabela_principal.find_all('tr')
-        registros = 0
-
-        for row in rows:
-            cells = row.find_all('td')
-            if not cells:
-                continue
-
-            cell_texts = [c.text.strip() for c in cells]
-
-            # Centro de custo (formato: XXXX-XX)
-            if len(cell_texts) > 0 and "C.Custo:" in cell_texts[0]:
-                codigo_match = re.search(r'(\d{4}-\d{2})', cell_texts[0])
-                if codigo_match:
-                    centro_custo_atual = codigo_match.group(1)
-                continue
-
-            # Categoria (extrair apenas o número)
-            if len(cell_texts) > 1 and cell_texts[1] and not cell_texts[1].isspace():
-                categoria_match = re.search(r'^(\d+)', cell_texts[1].strip())
-                if categoria_match:
-                    categoria_atual = categoria_match.group(1)
-                continue
-
-            # Processar linhas com valores
-            try:
-                if len(cell_texts) > indices['valor']:
-                    valor_text = cell_texts[indices['valor']]
-                    # Limpar texto de valor
-                    valor_text = re.sub(r'[^\d.,]', '', valor_text).replace(
-                        '.', '').replace(',', '.')
-
-                    if valor_text.strip() and float(valor_text) > 0:
-                        registros += 1
-
-                        # Coletar dados
-                        data = cell_texts[indices['data_pagamento']] if indices['data_pagamento'] < len(
-                            cell_texts) else ""
-                        documento = cell_texts[indices['documento']] if indices['documento'] < len(
-                            cell_texts) else ""
-                        emitente = cell_texts[indices['emitente']] if indices['emitente'] < len(
-                            cell_texts) else ""
-                        historico = cell_texts[indices['historico']] if indices['historico'] < len(
-                            cell_texts) else ""
-                        valor = float(valor_text)
-
-                        # Adicionar registro à lista
-                        registro = {
-                            'centro_custo': centro_custo_atual,
-                            'categoria': categoria_atual,
-                            'data_pagamento': data,
-                            'documento': documento,
-                            'emitente': emitente,
-                            'historico': historico,
-                            'valor': valor,
-                            'data_processamento': data_processamento
-                        }
-                        dados.append(registro)
-
-                        # Mostrar progresso
-                        if registros % 100 == 0:
-                            logger.info(f"{registros} registros processados")
-            except Exception as e:
-                logger.error(f"Erro ao processar linha: {str(e)}")
-                continue
-
-        logger.info(
-            f"Processamento concluído: {registros} registros extraídos")
-        return dados
-
-    except Exception as e:
-        logger.error(f"Erro ao extrair dados do arquivo: {str(e)}")
-        return dados
-
-# Função para salvar os dados no banco de dados
-
-
-def salvar_dados_no_banco(dados):
-    """
-    Salva os dados extraídos no banco de dados
+    A leitura do arquivo continua em paralelo enquanto cada lote é gravado
+    (processar_arquivo_batch) pela carga em massa (CargaTransacoes); todos os
+    lotes ficam na mesma transação, confirmada só no final. Lançamentos já
+    importados (mesma chave natural) são atualizados, não duplicados.
 
     Args:
-        dados (list): Lista de dicionários com os dados a serem salvos
+        arquivo_path (str): Caminho para o arquivo XLS
+        substituir_periodo (bool): Remove os lançamentos do período do relatório
+            que não vieram nele (padrão: ERP_IMPORTACAO_SUBSTITUIR_PERIODO)
+        periodo (tuple): (data inicial, data final) a substituir; sem ele vale o
+            período do cabeçalho do relatório
 
     Returns:
-        tuple: (sucesso, mensagem, contador)
+        dict: Resultado de processar_arquivo_batch (sucesso, registros_processados,
+            registros_com_erro, valor_total, lotes, mensagem), os primeiros
+            erros por linha (erros) e as contagens novos, existentes e removidos
     """
-    if not dados:
-        return False, "Nenhum dado para importar", 0
+    if substituir_periodo is None:
+        substituir_periodo = SUBSTITUIR_PERIODO
 
     connection = get_db_connection()
     if not connection:
-        return False, "Erro de conexão com o banco de dados", 0
+        return {'sucesso': False, 'registros_processados': 0, 'registros_com_erro': 0,
+                'valor_total': 0, 'lotes': 0,
+                'mensagem': "Erro de conexão com o banco de dados"}
 
+    cursor = connection.cursor()
     try:
-        cursor = connection.cursor()
-
         # Criar tabela se não existir
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS erp_transacoes (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                centro_custo VARCHAR(20) NOT NULL,
-                categoria VARCHAR(20),
-                data_pagamento VARCHAR(50),
-                documento VARCHAR(100),
-                emitente VARCHAR(255),
-                historico TEXT,
-                valor DECIMAL(15,2) NOT NULL,
-                data_processamento DATETIME NOT NULL,
-                importado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        # Inserir os dados
-        records_insert = 0
-        for registro in dados:
-            try:
-                cursor.execute("""
-                    INSERT INTO erp_transacoes (
-                        centro_custo, categoria, data_pagamento, documento, 
-                        emitente, historico, valor, data_processamento
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    registro['centro_custo'],
-                    registro['categoria'],
-                    registro['data_pagamento'],
-                    registro['documento'],
-                    registro['emitente'],
-                    registro['historico'],
-                    registro['valor'],
-                    registro['data_processamento']
-                ))
-                records_insert += 1
-            except Exception as e:
-                logger.error(f"Erro ao inserir registro: {str(e)}")
-
-        connection.commit()
-        cursor.close()
-        connection.close()
-
-        return True, f"{records_insert} registros importados com sucesso", records_insert
+        criar_tabela_transacoes(cursor)
+
+        with CargaTransacoes(cursor) as carga:
+            def gravar_lote(lote):
+                inseridos, erros = carga.gravar_lote(lote)
+                return True, inseridos, erros, ''
+
+            resultado = processar_arquivo_batch(arquivo_path, gravar_lote)
+            removidos = 0
+            if resultado['sucesso'] and substituir_periodo:
+                data_inicial, data_final = periodo or resultado['periodo'] or (None, None)
+                removidos = carga.substituir_periodo(data_inicial, data_final)
+
+        resultado.update({'erros': carga.erros, 'novos': carga.novos,
+                          'existentes': carga.existentes, 'removidos': removidos})
+        if resultado['sucesso']:
+            connection.commit()
+            resultado['mensagem'] = (f"{resultado['registros_processados']} registros importados com sucesso "
+                                     f"({carga.novos} novos, {carga.existentes} já importados)")
+            if removidos:
+                resultado['mensagem'] += f", {removidos} removidos do período"
+            if resultado['registros_com_erro']:
+                resultado['mensagem'] += f", {resultado['registros_com_erro']} com erro"
+        else:
+            connection.rollback()
+        return resultado
 
     except Exception as e:
         connection.rollback()
+        logger.error(f"Erro ao salvar dados no banco: {str(e)}")
+        return {'sucesso': False, 'registros_processados': 0, 'registros_com_erro': 0,
+                'valor_total': 0, 'lotes': 0, 'mensagem': f"Erro ao salvar dados: {str(e)}"}
+    finally:
         cursor.close()
         connection.close()
-        logger.error(f"Erro ao salvar dados no banco: {str(e)}")
-        return False, f"Erro ao salvar dados: {str(e)}", 0
 
 # Funções auxiliares para gerenciar importação
 
@@ -446,6 +312,14 @@ def importar_manual():
             flash('Apenas arquivos .xls são permitidos', 'warning')
             return redirect(request.url)
 
+        # Período a substituir (vazio: o do cabeçalho do relatório)
+        try:
+            periodo = ler_periodo_informado(request.form.get('periodoInicio', ''),
+                                            request.form.get('periodoFim', ''))
+        except ValueError as e:
+            flash(f'Período inválido: {str(e)}', 'warning')
+            return redirect(request.url)
+
         try:
             # Registrar início da importação
             importacao_id = registrar_importacao_iniciada(get_user_id())
@@ -457,17 +331,18 @@ def importar_manual():
             # Salvar o arquivo
             arquivo.save(file_path)
 
-            # Processar o arquivo
-            dados = extrair_dados_xls(file_path)
-
-            # Salvar os dados no banco
-            sucesso, mensagem, records_insert = salvar_dados_no_banco(dados)
+            # Processar o arquivo e salvar os dados no banco
+            resultado = importar_arquivo_erp(
+                file_path, substituir_periodo=request.form.get('substituirPeriodo') == 'on',
+                periodo=periodo)
+            sucesso, mensagem = resultado['sucesso'], resultado['mensagem']
 
             # Atualizar registro de importação
             status = 'SUCESSO' if sucesso else 'ERRO'
-            valor_total = sum(d['valor'] for d in dados) if dados else 0
             registrar_importacao_finalizada(
-                importacao_id, status, mensagem, len(dados), valor_total)
+                importacao_id, status, mensagem,
+                resultado['registros_processados'] + resultado['registros_com_erro'],
+                resultado['valor_total'])
 
             # Limpar arquivos temporários
             limpar_arquivos_temporarios(file_path)
@@ -513,17 +388,16 @@ async def importar_automatico():
                     importacao_id, 'ERRO', 'Falha no download do arquivo')
                 return redirect(request.url)
 
-            # Processar o arquivo
-            dados = extrair_dados_xls(arquivo_path)
-
-            # Salvar os dados no banco
-            sucesso, mensagem, records_insert = salvar_dados_no_banco(dados)
+            # Processar o arquivo e salvar os dados no banco
+            resultado = importar_arquivo_erp(arquivo_path)
+            sucesso, mensagem = resultado['sucesso'], resultado['mensagem']
 
             # Atualizar registro de importação
             status = 'SUCESSO' if sucesso else 'ERRO'
-            valor_total = sum(d['valor'] for d in dados) if dados else 0
             registrar_importacao_finalizada(
-                importacao_id, status, mensagem, len(dados), valor_total)
+                importacao_id, status, mensagem,
+                resultado['registros_processados'] + resultado['registros_com_erro'],
+                resultado['valor_total'])
 
             # Limpar arquivos temporários
             limpar_arquivos_temporarios(arquivo_path)
@@ -541,6 +415,46 @@ async def importar_automatico():
 
     return render_template('integracao_erp/importar_automatico.html')
 
+
+def ler_periodo_informado(data_inicio, data_fim):
+    """
+    Período informado no formulário (datas aaaa-mm-dd)
+
+    Returns:
+        tuple: (data inicial, data final) ou None se nenhuma data foi informada
+
+    Raises:
+        ValueError: Se só uma data foi informada, alguma é inválida ou o início é depois do fim
+    """
+    if not data_inicio and not data_fim:
+        return None
+    if not (data_inicio and data_fim):
+        raise ValueError("Informe o início e o fim do período")
+    data_inicial = datetime.strptime(data_inicio, '%Y-%m-%d').date()
+    data_final = datetime.strptime(data_fim, '%Y-%m-%d').date()
+    if data_inicial > data_final:
+        raise ValueError("O início do período é posterior ao fim")
+    return data_inicial, data_final
+
+
+def filtro_periodo_pagamento(data_inicio=None, data_fim=None):
+    """
+    Condições de período (datas inclusivas, aaaa-mm-dd) sobre dt_pagamento,
+    que usam o índice e, com a tabela particionada, só abrem as partições do período
+
+    Returns:
+        tuple: (trecho SQL iniciado por AND, parâmetros)
+    """
+    condicoes = ''
+    params = []
+    if data_inicio:
+        condicoes += " AND dt_pagamento >= %s"
+        params.append(data_inicio)
+    if data_fim:
+        condicoes += " AND dt_pagamento <= %s"
+        params.append(data_fim)
+    return condicoes, params
+
 # Rota para listar as transações
 
 
@@ -591,15 +505,12 @@ def listar_transacoes():
             query += " AND emitente LIKE %s"
             params.append(f'%{filtro_emitente}%')
 
-        if filtro_data_inicio:
-            query += " AND data_pagamento >= %s"
-            params.append(filtro_data_inicio)
+        condicoes_periodo, params_periodo = filtro_periodo_pagamento(
+            filtro_data_inicio, filtro_data_fim)
+        query += condicoes_periodo
+        params.extend(params_periodo)
 
-        if filtro_data_fim:
-            query += " AND data_pagamento <= %s"
-            params.append(filtro_data_fim)
-
-        query += " ORDER BY data_pagamento DESC LIMIT 1000"
+        query += " ORDER BY dt_pagamento DESC, id DESC LIMIT 1000"
 
         # Executar a consulta
         transacoes = execute_query(query, params)
@@ -655,16 +566,19 @@ def api_dados_centro_custo():
 
     try:
         # Dados por centro de custo
-        dados = execute_query("""
+        condicoes_periodo, params = filtro_periodo_pagamento(
+            request.args.get('data_inicio'), request.args.get('data_fim'))
+        dados = execute_query(f"""
             SELECT 
                 centro_custo as rotulo,
                 COUNT(*) as total_transacoes,
                 SUM(valor) as valor_total
             FROM erp_transacoes
+            WHERE 1=1{condicoes_periodo}
             GROUP BY centro_custo
             ORDER BY valor_total DESC
             LIMIT 10
-        """)
+        """, params)
 
         # Converter valores para float para serialização JSON
         if dados:
@@ -688,16 +602,19 @@ def api_dados_categoria():
 
     try:
         # Dados por categoria
-        dados = execute_query("""
+        condicoes_periodo, params = filtro_periodo_pagamento(
+            request.args.get('data_inicio'), request.args.get('data_fim'))
+        dados = execute_query(f"""
             SELECT 
                 IFNULL(categoria, 'Sem categoria') as rotulo,
                 COUNT(*) as total_transacoes,
                 SUM(valor) as valor_total
             FROM erp_transacoes
+            WHERE 1=1{condicoes_periodo}
             GROUP BY categoria
             ORDER BY valor_total DESC
             LIMIT 10
-        """)
+        """, params)
 
         # Converter valores para float para serialização JSON
         if dados:
@@ -829,18 +746,16 @@ def executar_importacao_programada():
             logger.error("Falha ao baixar relatório do ERP")
             return redirect(url_for('integracao_erp.importar_programado'))
 
-        # Processar o arquivo
-        dados = extrair_dados_xls(output_path)
+        # Processar o arquivo e salvar os dados no banco
+        resultado = importar_arquivo_erp(output_path)
 
-        if not dados:
-            flash('Nenhum dado encontrado no relatório', 'warning')
+        if not resultado['sucesso']:
+            flash(resultado['mensagem'], 'warning')
             return redirect(url_for('integracao_erp.importar_programado'))
 
         # Contagem de registros processados
-        registros_processados = len(dados)
-        resultado = salvar_dados_no_banco(dados)
-        registros_inseridos = resultado[2] if isinstance(
-            resultado, tuple) and len(resultado) > 2 else 0
+        registros_inseridos = resultado['registros_processados']
+        registros_processados = registros_inseridos + resultado['registros_com_erro']
 
         # Registrar a importação
         importacao_id = insert_data('erp_importacoes', {
@@ -925,25 +840,22 @@ def init_app(app):
 
                     logger.info(f"Arquivo baixado: {arquivo_path}")
 
-                    # Processar o arquivo
-                    dados = extrair_dados_xls(arquivo_path)
+                    # Processar o arquivo e salvar no banco
+                    resultado = importar_arquivo_erp(arquivo_path)
+                    sucesso, mensagem = resultado['sucesso'], resultado['mensagem']
 
-                    if not dados:
-                        logger.warning("Nenhum dado encontrado no arquivo")
+                    if not sucesso and not resultado['lotes']:
+                        logger.warning(mensagem)
                         registrar_importacao_finalizada(
-                            importacao_id, 'ERRO', 'Nenhum dado encontrado no arquivo')
+                            importacao_id, 'ERRO', mensagem)
                         return
 
-                    # Salvar no banco
-                    sucesso, mensagem, records_insert = salvar_dados_no_banco(
-                        dados)
-
                     # Atualizar registro
                     status = 'SUCESSO' if sucesso else 'ERRO'
-                    valor_total = sum(d['valor']
-                                      for d in dados) if dados else 0
                     registrar_importacao_finalizada(
-                        importacao_id, status, mensagem, len(dados), valor_total)
+                        importacao_id, status, mensagem,
+                        resultado['registros_processados'] + resultado['registros_com_erro'],
+                        resultado['valor_total'])
 
                     # Limpar arquivos
                     limpar_arquivos_temporarios(arquivo_path)
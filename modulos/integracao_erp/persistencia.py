@@ -0,0 +1,393 @@
+# modulo_integracao_erp/persistencia.py
+"""
+Carga em massa dos lançamentos do ERP em erp_transacoes
+
+Cada lote de registros vai primeiro para uma tabela temporária da conexão
+(erp_transacoes_carga), por INSERT multi-linha limitado pelo tamanho do
+pacote ou, com ERP_CARGA_LOAD_DATA=1, por LOAD DATA LOCAL INFILE de um TSV.
+A validação (centro de custo, tamanhos das colunas, faixa do valor) é feita em
+SQL na tabela temporária; as linhas válidas passam para erp_transacoes com um
+único INSERT ... SELECT e as inválidas são registradas com o número da linha,
+como fazia a inserção registro a registro.
+
+Cada lançamento é identificado pela chave natural (centro de custo, categoria,
+documento, data de pagamento, valor e histórico), gravada como SHA-256 em
+erp_transacoes.chave_natural com índice único: reimportar um relatório (ou
+períodos sobrepostos) atualiza as linhas existentes em vez de duplicá-las.
+No modo de substituição do período, os lançamentos do período declarado no
+cabeçalho do relatório (ou informado na importação) que não vieram nele
+(removidos no ERP) são apagados ao final.
+
+A data de pagamento é gravada também como DATE (dt_pagamento, convertida na
+leitura do relatório); os filtros por período usam essa coluna, que pode
+particionar a tabela por mês (scripts/particionar_erp_transacoes.py).
+Para comparar com a inserção anterior: scripts/benchmark_carga_erp.py
+"""
+
+import os
+import logging
+import tempfile
+
+from mysql.connector import Error
+
+logger = logging.getLogger('integracao_erp.persistencia')
+
+# Limites de cada INSERT multi-linha na tabela temporária. O limite em bytes
+# deve ficar abaixo do max_allowed_packet do servidor MySQL.
+CARGA_LOTE_MAX_LINHAS = int(os.environ.get('ERP_CARGA_LOTE_MAX_LINHAS', 1000))
+CARGA_LOTE_MAX_BYTES = int(os.environ.get('ERP_CARGA_LOTE_MAX_BYTES', 1024 * 1024))
+
+# Usa LOAD DATA LOCAL INFILE (exige local_infile=ON no servidor)
+CARGA_LOAD_DATA = os.environ.get('ERP_CARGA_LOAD_DATA', '0').lower() in ('1', 'true', 'sim', 'yes', 'on')
+
+# Erros guardados com detalhes no resultado da carga (os demais só são contados)
+CARGA_MAX_ERROS_DETALHADOS = 100
+
+# Padrão do modo de substituição do período nas importações
+SUBSTITUIR_PERIODO = os.environ.get('ERP_IMPORTACAO_SUBSTITUIR_PERIODO', '0').lower() in (
+    '1', 'true', 'sim', 'yes', 'on')
+
+SQL_CRIAR_TRANSACOES = """
+    CREATE TABLE IF NOT EXISTS erp_transacoes (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        centro_custo VARCHAR(20) NOT NULL,
+        categoria VARCHAR(20),
+        data_pagamento VARCHAR(50),
+        dt_pagamento DATE NOT NULL,
+        documento VARCHAR(100),
+        emitente VARCHAR(255),
+        historico TEXT,
+        valor DECIMAL(15,2) NOT NULL,
+        data_processamento DATETIME NOT NULL,
+        chave_natural CHAR(64) CHARACTER SET ascii NOT NULL,
+        importado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE KEY uk_erp_transacoes_chave (chave_natural),
+        INDEX idx_dt_pagamento (dt_pagamento)
+    )
+"""
+
+CAMPOS_TRANSACAO = ('centro_custo', 'categoria', 'data_pagamento', 'dt_pagamento', 'documento',
+                    'emitente', 'historico', 'valor', 'data_processamento')
+
+# SHA-256 da chave natural de um lançamento (a mesma expressão preenche as linhas
+# antigas em database/db-update-erp-transacoes-chave.sql). Os textos são
+# convertidos para utf8mb4 para que o hash não dependa do charset da coluna.
+EXPRESSAO_CHAVE_NATURAL = """SHA2(CONCAT_WS(CHAR(31 USING utf8mb4),
+            COALESCE(CONVERT(centro_custo USING utf8mb4), ''),
+            COALESCE(CONVERT(categoria USING utf8mb4), ''),
+            COALESCE(CONVERT(documento USING utf8mb4), ''),
+            COALESCE(CONVERT(data_pagamento USING utf8mb4), ''),
+            CAST(CAST(valor AS DECIMAL(15,2)) AS CHAR),
+            COALESCE(CONVERT(historico USING utf8mb4), '')), 256)"""
+
+# Tamanho máximo (caracteres) das colunas texto de erp_transacoes
+LIMITES_TRANSACAO = {
+    'centro_custo': 20,
+    'categoria': 20,
+    'data_pagamento': 50,
+    'documento': 100,
+    'emitente': 255,
+}
+
+# Colunas largas: nada é truncado antes da validação
+SQL_CRIAR_CARGA = """
+    CREATE TEMPORARY TABLE erp_transacoes_carga (
+        linha INT NOT NULL PRIMARY KEY,
+        centro_custo TEXT,
+        categoria TEXT,
+        data_pagamento TEXT,
+        dt_pagamento DATE,
+        documento TEXT,
+        emitente TEXT,
+        historico MEDIUMTEXT,
+        valor DOUBLE,
+        data_processamento DATETIME,
+        erro VARCHAR(100),
+        chave_natural CHAR(64) CHARACTER SET ascii,
+        existente TINYINT NOT NULL DEFAULT 0,
+        INDEX idx_carga_chave (chave_natural)
+    )
+"""
+SQL_REMOVER_CARGA = "DROP TEMPORARY TABLE IF EXISTS erp_transacoes_carga"
+
+COLUNAS_CARGA = ('linha',) + CAMPOS_TRANSACAO
+SQL_INSERIR_CARGA = f"INSERT INTO erp_transacoes_carga ({', '.join(COLUNAS_CARGA)}) VALUES "
+PLACEHOLDER_CARGA = "(" + ", ".join(["%s"] * len(COLUNAS_CARGA)) + ")"
+
+SQL_LOAD_DATA_CARGA = f"""
+    LOAD DATA LOCAL INFILE %s INTO TABLE erp_transacoes_carga
+    CHARACTER SET utf8mb4
+    FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\'
+    LINES TERMINATED BY '\\n'
+    ({', '.join(COLUNAS_CARGA)})"""
+
+# A primeira regra violada vira a mensagem de erro da linha
+SQL_VALIDAR_CARGA = """
+    UPDATE erp_transacoes_carga SET erro = CASE
+        WHEN centro_custo IS NULL OR centro_custo = '' THEN 'centro de custo não identificado'
+        {limites}
+        WHEN dt_pagamento IS NULL THEN 'data de pagamento inválida'
+        WHEN LENGTH(historico) > 65535 THEN 'historico com mais de 64 KB'
+        WHEN valor IS NULL THEN 'valor ausente'
+        WHEN ABS(valor) >= 10000000000000 THEN 'valor acima do limite de DECIMAL(15,2)'
+        WHEN data_processamento IS NULL THEN 'data de processamento ausente'
+    END""".format(limites="\n        ".join(
+    f"WHEN CHAR_LENGTH({campo}) > {limite} THEN '{campo} com mais de {limite} caracteres'"
+    for campo, limite in LIMITES_TRANSACAO.items()))
+
+SQL_CHAVE_CARGA = f"""
+    UPDATE erp_transacoes_carga
+    SET chave_natural = {EXPRESSAO_CHAVE_NATURAL}
+    WHERE erro IS NULL"""
+
+SQL_MARCAR_EXISTENTES_CARGA = """
+    UPDATE erp_transacoes_carga c
+    JOIN erp_transacoes t ON t.chave_natural = c.chave_natural
+    SET c.existente = 1"""
+
+# Novos, já existentes e o intervalo de datas do lote
+SQL_RESUMO_CARGA = """
+    SELECT COUNT(DISTINCT CASE WHEN existente = 0 THEN chave_natural END),
+           COALESCE(SUM(existente), 0),
+           MIN(dt_pagamento),
+           MAX(dt_pagamento)
+    FROM erp_transacoes_carga
+    WHERE erro IS NULL"""
+
+# Upsert pela chave natural; data_processamento marca as linhas vistas nesta importação
+SQL_TRANSFERIR_CARGA = f"""
+    INSERT INTO erp_transacoes ({', '.join(CAMPOS_TRANSACAO)}, chave_natural)
+    SELECT {', '.join(CAMPOS_TRANSACAO)}, chave_natural
+    FROM erp_transacoes_carga
+    WHERE erro IS NULL
+    ORDER BY linha
+    ON DUPLICATE KEY UPDATE
+        dt_pagamento = VALUES(dt_pagamento),
+        emitente = VALUES(emitente),
+        data_processamento = VALUES(data_processamento)"""
+
+# Lançamentos do período que não vieram na importação atual (com a tabela
+# particionada, o DELETE só abre as partições do período)
+SQL_SUBSTITUIR_PERIODO = """
+    DELETE FROM erp_transacoes
+    WHERE dt_pagamento BETWEEN %s AND %s
+      AND data_processamento <> %s"""
+
+SQL_ERROS_CARGA = """
+    SELECT linha, LEFT(documento, 100), erro
+    FROM erp_transacoes_carga
+    WHERE erro IS NOT NULL
+    ORDER BY linha"""
+
+SQL_LIMPAR_CARGA = "DELETE FROM erp_transacoes_carga"
+
+# Servidor recusou LOAD DATA LOCAL neste processo: não tenta de novo
+_load_data_recusado = False
+
+
+def criar_tabela_transacoes(cursor):
+    """Cria erp_transacoes se ainda não existir"""
+    cursor.execute(SQL_CRIAR_TRANSACOES)
+
+
+def _tamanho_linha(linha):
+    # Estimativa do tamanho da linha no pacote SQL (valores + aspas e vírgulas)
+    return sum(len(str(valor)) + 4 for valor in linha)
+
+
+def dividir_em_lotes(linhas, max_linhas=None, max_bytes=None):
+    """
+    Agrupa as linhas em lotes limitados por quantidade e tamanho estimado
+
+    Args:
+        linhas: Iterável de tuplas de valores
+        max_linhas: Máximo de linhas por lote
+        max_bytes: Tamanho máximo estimado do lote em bytes
+
+    Yields:
+        list: Lote de linhas
+    """
+    max_linhas = max_linhas or CARGA_LOTE_MAX_LINHAS
+    max_bytes = max_bytes or CARGA_LOTE_MAX_BYTES
+
+    lote = []
+    tamanho_lote = 0
+    for linha in linhas:
+        tamanho = _tamanho_linha(linha)
+        if lote and (len(lote) >= max_linhas or tamanho_lote + tamanho > max_bytes):
+            yield lote
+            lote = []
+            tamanho_lote = 0
+        lote.append(linha)
+        tamanho_lote += tamanho
+
+    if lote:
+        yield lote
+
+
+def _campo_tsv(valor):
+    """Valor no formato de LOAD DATA (NULL como \\N, separadores escapados)"""
+    if valor is None:
+        return '\\N'
+    return (str(valor).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r').replace('\0', '\\0'))
+
+
+class CargaTransacoes:
+    """
+    Grava lotes de registros em erp_transacoes pela tabela temporária de carga
+
+    Uso (a transação fica a cargo do chamador):
+        with CargaTransacoes(cursor) as carga:
+            for lote in lotes:
+                inseridos, erros = carga.gravar_lote(lote)
+    """
+
+    def __init__(self, cursor, load_data=None, max_linhas=None, max_bytes=None):
+        self.cursor = cursor
+        self.load_data = CARGA_LOAD_DATA if load_data is None else load_data
+        self.max_linhas = max_linhas
+        self.max_bytes = max_bytes
+        self.linhas = 0
+        # Chaves novas e lançamentos que já estavam gravados (atualizados)
+        self.novos = 0
+        self.existentes = 0
+        self.total_erros = 0
+        # Período (datas de pagamento) e data_processamento dos registros carregados
+        self.data_inicial = None
+        self.data_final = None
+        self.data_processamento = None
+        # Primeiros erros: {'linha', 'documento', 'erro'}
+        self.erros = []
+
+    def __enter__(self):
+        self.preparar()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finalizar()
+
+    def preparar(self):
+        """Cria a tabela temporária (CREATE/DROP TEMPORARY não encerram a transação)"""
+        self.cursor.execute(SQL_REMOVER_CARGA)
+        self.cursor.execute(SQL_CRIAR_CARGA)
+
+    def finalizar(self):
+        """Remove a tabela temporária (a conexão volta ao pool sem ela)"""
+        try:
+            self.cursor.execute(SQL_REMOVER_CARGA)
+        except Exception as e:
+            logger.warning(f"Erro ao remover tabela temporária de carga: {str(e)}")
+
+    def gravar_lote(self, registros):
+        """
+        Carrega, valida e transfere um lote de registros
+
+        Args:
+            registros (list): Dicionários com os campos de CAMPOS_TRANSACAO
+
+        Returns:
+            tuple: (gravados, erros); gravados inclui os lançamentos já existentes,
+                que são atualizados em vez de duplicados
+        """
+        linhas = []
+        for registro in registros:
+            self.linhas += 1
+            linhas.append((self.linhas,) + tuple(registro.get(campo) for campo in CAMPOS_TRANSACAO))
+        if not linhas:
+            return 0, 0
+        if self.data_processamento is None:
+            self.data_processamento = registros[0].get('data_processamento')
+
+        self._carregar(linhas)
+        self.cursor.execute(SQL_VALIDAR_CARGA)
+        self.cursor.execute(SQL_CHAVE_CARGA)
+        self.cursor.execute(SQL_MARCAR_EXISTENTES_CARGA)
+        self.cursor.execute(SQL_RESUMO_CARGA)
+        novos, existentes, data_inicial, data_final = self.cursor.fetchone()
+        self.cursor.execute(SQL_TRANSFERIR_CARGA)
+
+        self.cursor.execute(SQL_ERROS_CARGA)
+        erros = self.cursor.fetchall()
+        for linha, documento, erro in erros:
+            logger.error(f"Erro ao inserir registro da linha {linha} (documento {documento}): {erro}")
+            if len(self.erros) < CARGA_MAX_ERROS_DETALHADOS:
+                self.erros.append({'linha': linha, 'documento': documento, 'erro': erro})
+        self.cursor.execute(SQL_LIMPAR_CARGA)
+
+        novos, existentes = int(novos or 0), int(existentes or 0)
+        self.novos += novos
+        self.existentes += existentes
+        self.total_erros += len(erros)
+        if data_inicial and (self.data_inicial is None or data_inicial < self.data_inicial):
+            self.data_inicial = data_inicial
+        if data_final and (self.data_final is None or data_final > self.data_final):
+            self.data_final = data_final
+        return len(linhas) - len(erros), len(erros)
+
+    def substituir_periodo(self, data_inicial, data_final):
+        """
+        Remove os lançamentos do período que não vieram nesta carga
+
+        Chamar depois do último lote, com o período do relatório (cabeçalho ou
+        datas informadas na importação): os lançamentos do começo ou do fim do
+        período que foram removidos no ERP não aparecem nas datas carregadas.
+        As datas carregadas só conferem o período: não remove nada se alguma
+        estiver fora dele ou se algum registro foi rejeitado (a versão gravada
+        dele seria perdida).
+
+        Args:
+            data_inicial (date): Primeiro dia do período do relatório
+            data_final (date): Último dia do período do relatório
+
+        Returns:
+            int: Lançamentos removidos
+        """
+        if self.total_erros:
+            logger.warning(f"Período não substituído: {self.total_erros} registro(s) rejeitado(s)")
+            return 0
+        if not (data_inicial and data_final):
+            logger.warning("Período não substituído: período do relatório não informado")
+            return 0
+        if not self.data_processamento:
+            return 0
+        if ((self.data_inicial and self.data_inicial < data_inicial)
+                or (self.data_final and self.data_final > data_final)):
+            logger.warning(f"Período não substituído: pagamentos de {self.data_inicial} a {self.data_final} "
+                           f"fora do período {data_inicial} a {data_final}")
+            return 0
+
+        self.cursor.execute(SQL_SUBSTITUIR_PERIODO,
+                            (data_inicial, data_final, self.data_processamento))
+        removidos = self.cursor.rowcount
+        logger.info(f"Período {data_inicial} a {data_final} substituído: "
+                    f"{removidos} lançamento(s) ausente(s) no relatório removido(s)")
+        return removidos
+
+    def _carregar(self, linhas):
+        """Grava as linhas na tabela temporária"""
+        global _load_data_recusado
+        if self.load_data and not _load_data_recusado:
+            try:
+                self._carregar_load_data(linhas)
+                return
+            except Error as e:
+                _load_data_recusado = True
+                logger.warning(f"LOAD DATA LOCAL INFILE indisponível, usando INSERT multi-linha: {str(e)}")
+                self.cursor.execute(SQL_LIMPAR_CARGA)
+
+        for lote in dividir_em_lotes(linhas, self.max_linhas, self.max_bytes):
+            sql = SQL_INSERIR_CARGA + ", ".join([PLACEHOLDER_CARGA] * len(lote))
+            self.cursor.execute(sql, [valor for linha in lote for valor in linha])
+
+    def _carregar_load_data(self, linhas):
+        """Grava as linhas em um TSV temporário e o carrega com LOAD DATA LOCAL INFILE"""
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', newline='\n', suffix='.tsv',
+                                         delete=False) as arquivo:
+            for linha in linhas:
+                arquivo.write('\t'.join(_campo_tsv(valor) for valor in linha))
+                arquivo.write('\n')
+        try:
+            self.cursor.execute(SQL_LOAD_DATA_CARGA, (arquivo.name,))
+        finally:
+            os.remove(arquivo.name)
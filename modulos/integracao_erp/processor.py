@@ -1,203 +1,461 @@
 # modulo_integracao_erp/processor.py
 """
 Processador de arquivos XLS em formato HTML do ERP
+
+O relatório Custo Analítico é exportado como uma página HTML com extensão
+.xls. O arquivo é lido em blocos por um tokenizador (html.parser) que monta
+apenas as linhas das tabelas, sem construir a árvore do documento, então a
+memória não cresce com o tamanho do relatório.
+Para conferir com o parser anterior (BeautifulSoup): scripts/comparar_extrator_erp.py
+
+Na importação, processar_arquivo_batch lê os registros em uma thread e os
+entrega em lotes ao callback de gravação por uma fila limitada, de modo que a
+leitura do arquivo e a gravação no banco acontecem ao mesmo tempo.
 """
 
 import os
 import re
+import queue
 import logging
+import threading
 from datetime import datetime
-from bs4 import BeautifulSoup
+from itertools import islice
+from html.parser import HTMLParser
 
 # Configuração de logging
 logger = logging.getLogger('integracao_erp.processor')
 
-def extrair_dados_xls(arquivo_path):
+# Caracteres lidos do arquivo por vez
+TAMANHO_BLOCO_LEITURA = 1024 * 1024
+
+# Registros por lote entregue ao callback de processar_arquivo_batch
+TAMANHO_LOTE = int(os.environ.get('ERP_IMPORTACAO_LOTE', 1000))
+
+# Lotes lidos que podem aguardar o callback (a leitura pausa quando a fila enche)
+LOTES_EM_ESPERA = int(os.environ.get('ERP_IMPORTACAO_LOTES_EM_ESPERA', 2))
+
+# Marca o fim dos lotes na fila entre a leitura e o callback
+_FIM_LOTES = object()
+
+# Índices das colunas nas linhas de lançamento do relatório
+INDICES_COLUNAS = {
+    'data_pagamento': 2,
+    'documento': 3,
+    'emitente': 4,
+    'historico': 6,
+    'valor': 10
+}
+
+# Formato das datas no relatório
+FORMATO_DATA_PAGAMENTO = '%d/%m/%Y'
+
+# Período declarado no cabeçalho do relatório ("dd/mm/aaaa a dd/mm/aaaa")
+PADRAO_PERIODO_RELATORIO = re.compile(r'(\d{2}/\d{2}/\d{4})\s+a\s+(\d{2}/\d{2}/\d{4})')
+
+# Elementos sem conteúdo: fechados na abertura, como no BeautifulSoup
+ELEMENTOS_VAZIOS = frozenset((
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link',
+    'menuitem', 'meta', 'param', 'source', 'track', 'wbr', 'basefont', 'bgsound',
+    'command', 'frame', 'image', 'isindex', 'nextid', 'spacer'))
+
+
+class LeitorLinhasHTML(HTMLParser):
     """
-    Extrai dados de um arquivo XLS em formato HTML
-    
-    Args:
-        arquivo_path (str): Caminho para o arquivo XLS
-    
+    Tokenizador incremental que produz as linhas (tr) das tabelas de um HTML.
+
+    Reproduz o que o BeautifulSoup com html.parser devolveria para
+    tabela.find_all('tr') e linha.find_all('td'): uma linha pertence a todas
+    as tabelas abertas, o texto de uma célula inclui o das células aninhadas e
+    uma tag de fechamento fecha também as tags abertas depois dela. As linhas
+    saem na ordem de abertura, assim que a linha mais externa é fechada.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        # Quantidade de linhas (incluindo as aninhadas) de cada tabela, na ordem de abertura
+        self.linhas_por_tabela = []
+        # Tags abertas: [tag, linha ou célula]
+        self._pilha = []
+        self._tabelas_abertas = []
+        self._linhas_abertas = []
+        self._celulas_abertas = []
+        self._ignorar_texto = 0
+        self._pendentes = []
+        self._prontas = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ELEMENTOS_VAZIOS:
+            return
+
+        objeto = None
+        if tag == 'table':
+            objeto = len(self.linhas_por_tabela)
+            self.linhas_por_tabela.append(0)
+            self._tabelas_abertas.append(objeto)
+        elif tag == 'tr' and self._tabelas_abertas:
+            for tabela in self._tabelas_abertas:
+                self.linhas_por_tabela[tabela] += 1
+            objeto = (tuple(self._tabelas_abertas), [])
+            self._linhas_abertas.append(objeto)
+            self._pendentes.append(objeto)
+        elif tag == 'td' and self._linhas_abertas:
+            objeto = []
+            for _, celulas in self._linhas_abertas:
+                celulas.append(objeto)
+            self._celulas_abertas.append(objeto)
+        elif tag in ('script', 'style'):
+            self._ignorar_texto += 1
+        self._pilha.append((tag, objeto))
+
+    def handle_endtag(self, tag):
+        for posicao in range(len(self._pilha) - 1, -1, -1):
+            if self._pilha[posicao][0] == tag:
+                break
+        else:
+            return
+
+        while len(self._pilha) > posicao:
+            aberta, objeto = self._pilha.pop()
+            if objeto is None:
+                if aberta in ('script', 'style'):
+                    self._ignorar_texto -= 1
+            elif aberta == 'table':
+                self._tabelas_abertas.pop()
+            elif aberta == 'tr':
+                self._linhas_abertas.pop()
+            elif aberta == 'td':
+                self._celulas_abertas.pop()
+
+        if not self._linhas_abertas and self._pendentes:
+            self._prontas.extend(self._pendentes)
+            self._pendentes = []
+
+    def handle_data(self, data):
+        if self._celulas_abertas and not self._ignorar_texto:
+            for celula in self._celulas_abertas:
+                celula.append(data)
+
+    def ler(self, arquivo, tamanho_bloco=None):
+        """
+        Lê um arquivo de texto em blocos
+
+        Yields:
+            tuple: (índices das tabelas da linha, textos das células sem espaços nas pontas)
+        """
+        for bloco in _blocos_sem_nbsp(arquivo, tamanho_bloco or TAMANHO_BLOCO_LEITURA):
+            self.feed(bloco)
+            yield from self._entregar()
+        self.close()
+        # Linhas não fechadas até o fim do documento
+        self._prontas.extend(self._pendentes)
+        self._pendentes = []
+        yield from self._entregar()
+
+    def _entregar(self):
+        prontas, self._prontas = self._prontas, []
+        for tabelas, celulas in prontas:
+            yield tabelas, [''.join(celula).strip() for celula in celulas]
+
+
+def _blocos_sem_nbsp(arquivo, tamanho_bloco):
+    """
+    Blocos do arquivo com &nbsp; trocado por espaço (como o parser anterior
+    fazia no conteúdo inteiro), sem quebrar a entidade entre dois blocos
+    """
+    resto = ''
+    while True:
+        bloco = arquivo.read(tamanho_bloco)
+        if not bloco:
+            break
+        texto = resto + bloco
+        corte = texto.find('&', max(0, len(texto) - 5))
+        if corte >= 0:
+            texto, resto = texto[:corte], texto[corte:]
+        else:
+            resto = ''
+        yield texto.replace('&nbsp;', ' ')
+    if resto:
+        yield resto.replace('&nbsp;', ' ')
+
+
+def converter_data_pagamento(texto):
+    """
+    Converte a data de pagamento do relatório (dd/mm/aaaa) em date
+
     Returns:
-        list: Lista de dicionários com os dados extraídos
+        date: Data convertida ou None se o texto não for uma data válida
     """
-    dados = []
-    
     try:
-        logger.info(f"Processando arquivo: {arquivo_path}")
-        
-        # Ler o conteúdo do arquivo HTML
-        with open(arquivo_path, 'r', encoding='utf-8', errors='ignore') as file:
-            html_content = file.read()
-        
-        # Substituir entidades HTML comuns
-        html_content = html_content.replace('&nbsp;', ' ')
-        
-        # Parsear o HTML usando BeautifulSoup
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # Data de processamento
-        data_processamento = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        # Encontrar tabelas no HTML
-        tabelas = soup.find_all('table')
-        
-        if not tabelas:
-            logger.warning("Nenhuma tabela encontrada no arquivo")
-            return dados
-        
-        # Encontrar a tabela principal (geralmente a maior)
-        tabela_principal = max(tabelas, key=lambda t: len(t.find_all('tr')))
-        
-        # Variáveis para rastrear
-        centro_custo_atual = None
-        categoria_atual = None
-        
-        # Índices das colunas
-        indices = {
-            'data_pagamento': 2,
-            'documento': 3,
-            'emitente': 4,
-            'historico': 6,
-            'valor': 10
-        }
-        
-        # Processar linhas
-        rows = tabela_principal.find_all('tr')
-        registros = 0
-        
-        for row in rows:
-            cells = row.find_all('td')
-            if not cells:
-                continue
-            
-            cell_texts = [c.text.strip() for c in cells]
-            
-            # Centro de custo (formato: XXXX-XX)
-            if len(cell_texts) > 0 and "C.Custo:" in cell_texts[0]:
-                codigo_match = re.search(r'(\d{4}-\d{2})', cell_texts[0])
-                if codigo_match:
-                    centro_custo_atual = codigo_match.group(1)
+        return datetime.strptime(texto.strip(), FORMATO_DATA_PAGAMENTO).date()
+    except (ValueError, AttributeError):
+        return None
+
+
+def extrair_periodo_relatorio(cell_texts):
+    """
+    Procura o período do relatório ("dd/mm/aaaa a dd/mm/aaaa") nas células de uma linha
+
+    Returns:
+        tuple: (data inicial, data final) ou None se a linha não tiver um período válido
+    """
+    for texto in cell_texts:
+        periodo_match = PADRAO_PERIODO_RELATORIO.search(texto)
+        if not periodo_match:
+            continue
+        data_inicial = converter_data_pagamento(periodo_match.group(1))
+        data_final = converter_data_pagamento(periodo_match.group(2))
+        if data_inicial and data_final and data_inicial <= data_final:
+            return data_inicial, data_final
+    return None
+
+
+class ProcessadorCustoAnalitico:
+    """
+    Converte as linhas de uma tabela do relatório Custo Analítico em
+    registros, acompanhando o centro de custo e a categoria correntes
+    """
+
+    def __init__(self, data_processamento):
+        self.data_processamento = data_processamento
+        self.centro_custo_atual = None
+        self.categoria_atual = None
+        self.erros = 0
+
+    def processar(self, cell_texts):
+        """
+        Processa os textos das células de uma linha
+
+        Returns:
+            dict: Registro do lançamento ou None (cabeçalho, centro de custo, categoria)
+        """
+        if not cell_texts:
+            return None
+
+        # Centro de custo (formato: XXXX-XX)
+        if "C.Custo:" in cell_texts[0]:
+            codigo_match = re.search(r'(\d{4}-\d{2})', cell_texts[0])
+            if codigo_match:
+                self.centro_custo_atual = codigo_match.group(1)
+            return None
+
+        # Categoria (extrair apenas o número)
+        if len(cell_texts) > 1 and cell_texts[1] and not cell_texts[1].isspace():
+            categoria_match = re.search(r'^(\d+)', cell_texts[1].strip())
+            if categoria_match:
+                self.categoria_atual = categoria_match.group(1)
+            return None
+
+        # Processar linhas com valores
+        if len(cell_texts) <= INDICES_COLUNAS['valor']:
+            return None
+        try:
+            # Limpar texto de valor
+            valor_text = re.sub(r'[^\d.,]', '', cell_texts[INDICES_COLUNAS['valor']]).replace(
+                '.', '').replace(',', '.')
+            if not valor_text.strip() or float(valor_text) <= 0:
+                return None
+
+            return {
+                'centro_custo': self.centro_custo_atual,
+                'categoria': self.categoria_atual,
+                'data_pagamento': cell_texts[INDICES_COLUNAS['data_pagamento']],
+                'dt_pagamento': converter_data_pagamento(cell_texts[INDICES_COLUNAS['data_pagamento']]),
+                'documento': cell_texts[INDICES_COLUNAS['documento']],
+                'emitente': cell_texts[INDICES_COLUNAS['emitente']],
+                'historico': cell_texts[INDICES_COLUNAS['historico']],
+                'valor': float(valor_text),
+                'data_processamento': self.data_processamento
+            }
+        except Exception as e:
+            self.erros += 1
+            logger.debug(f"Erro ao processar linha: {str(e)}")
+            return None
+
+
+def iterar_registros_xls(arquivo_path, tamanho_bloco=None, cabecalho=None):
+    """
+    Gera os registros de um arquivo XLS em formato HTML à medida que é lido
+
+    Cada tabela de primeiro nível (com as aninhadas) tem seu próprio centro de
+    custo e categoria. Só são gerados os lançamentos que vêm depois de uma
+    linha "C.Custo:" da mesma tabela: linhas com o formato de lançamento fora
+    da tabela principal do relatório (ex.: a linha de total do rodapé) são
+    ignoradas sem esperar o fim do arquivo, com memória constante.
+
+    O período do relatório é lido das linhas de cabeçalho (antes do primeiro
+    centro de custo) e guardado em cabecalho['periodo'], quando informado.
+
+    Args:
+        arquivo_path (str): Caminho para o arquivo XLS
+        tamanho_bloco (int): Caracteres lidos por vez (padrão: TAMANHO_BLOCO_LEITURA)
+        cabecalho (dict): Recebe 'periodo': (data inicial, data final) ou None
+
+    Yields:
+        dict: Registro de cada lançamento
+    """
+    logger.info(f"Processando arquivo: {arquivo_path}")
+    data_processamento = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    leitor = LeitorLinhasHTML()
+    tabela_atual = None
+    processador = None
+    erros = 0
+    sem_centro_custo = 0
+    periodo = None
+    with open(arquivo_path, 'r', encoding='utf-8', errors='ignore') as file:
+        for tabelas, cell_texts in leitor.ler(file, tamanho_bloco):
+            if tabelas[0] != tabela_atual:
+                erros += processador.erros if processador else 0
+                tabela_atual = tabelas[0]
+                processador = ProcessadorCustoAnalitico(data_processamento)
+            if periodo is None and processador.centro_custo_atual is None:
+                periodo = extrair_periodo_relatorio(cell_texts)
+                if periodo and cabecalho is not None:
+                    cabecalho['periodo'] = periodo
+            registro = processador.processar(cell_texts)
+            if registro is None:
                 continue
-            
-            # Categoria (extrair apenas o número)
-            if len(cell_texts) > 1 and cell_texts[1] and not cell_texts[1].isspace():
-                categoria_match = re.search(r'^(\d+)', cell_texts[1].strip())
-                if categoria_match:
-                    categoria_atual = categoria_match.group(1)
+            if registro['centro_custo'] is None:
+                sem_centro_custo += 1
                 continue
-            
-            # Processar linhas com valores
+            yield registro
+
+    erros += processador.erros if processador else 0
+    if not leitor.linhas_por_tabela:
+        logger.warning("Nenhuma tabela encontrada no arquivo")
+    if erros:
+        logger.warning(f"{erros} linha(s) com valor inválido ignorada(s)")
+    if sem_centro_custo:
+        logger.warning(f"{sem_centro_custo} linha(s) fora de um centro de custo ignorada(s)")
+    if periodo is None:
+        logger.warning("Período do relatório não encontrado no cabeçalho")
+
+
+def gerar_lotes(registros, tamanho_lote):
+    """
+    Agrupa um iterável de registros em listas de até tamanho_lote itens
+
+    Yields:
+        list: Lote de registros
+    """
+    registros = iter(registros)
+    while True:
+        lote = list(islice(registros, tamanho_lote))
+        if not lote:
+            return
+        yield lote
+
+
+def _produzir_lotes(arquivo_path, tamanho_lote, fila, cancelado, cabecalho):
+    """Lê o arquivo e coloca os lotes na fila (executado na thread produtora)"""
+    def entregar(item):
+        # Espera espaço na fila sem travar caso o consumidor tenha desistido
+        while not cancelado.is_set():
             try:
-                if len(cell_texts) > indices['valor']:
-                    valor_text = cell_texts[indices['valor']]
-                    # Limpar texto de valor
-                    valor_text = re.sub(r'[^\d.,]', '', valor_text).replace('.', '').replace(',', '.')
-                    
-                    if valor_text.strip() and float(valor_text) > 0:
-                        registros += 1
-                        
-                        # Coletar dados
-                        data = cell_texts[indices['data_pagamento']] if indices['data_pagamento'] < len(cell_texts) else ""
-                        documento = cell_texts[indices['documento']] if indices['documento'] < len(cell_texts) else ""
-                        emitente = cell_texts[indices['emitente']] if indices['emitente'] < len(cell_texts) else ""
-                        historico = cell_texts[indices['historico']] if indices['historico'] < len(cell_texts) else ""
-                        valor = float(valor_text)
-                        
-                        # Adicionar registro à lista
-                        registro = {
-                            'centro_custo': centro_custo_atual,
-                            'categoria': categoria_atual,
-                            'data_pagamento': data,
-                            'documento': documento,
-                            'emitente': emitente,
-                            'historico': historico,
-                            'valor': valor,
-                            'data_processamento': data_processamento
-                        }
-                        dados.append(registro)
-                        
-                        # Mostrar progresso
-                        if registros % 100 == 0:
-                            logger.info(f"{registros} registros processados")
-            except Exception as e:
-                logger.error(f"Erro ao processar linha: {str(e)}")
+                fila.put(item, timeout=0.5)
+                return True
+            except queue.Full:
                 continue
-        
-        logger.info(f"Processamento concluído: {registros} registros extraídos")
-        return dados
-    
+        return False
+
+    try:
+        for lote in gerar_lotes(iterar_registros_xls(arquivo_path, cabecalho=cabecalho), tamanho_lote):
+            if not entregar(lote):
+                return
+        entregar(_FIM_LOTES)
     except Exception as e:
         logger.error(f"Erro ao extrair dados do arquivo: {str(e)}", exc_info=True)
-        return dados
+        entregar(e)
 
-def processar_arquivo_batch(arquivo_path, callback=None):
+
+def processar_arquivo_batch(arquivo_path, callback=None, tamanho_lote=None, lotes_em_espera=None):
     """
     Processa um arquivo em lotes para evitar sobrecarga de memória
-    
+
+    Uma thread lê o arquivo e monta os lotes enquanto o callback processa os
+    anteriores (ex.: grava no banco). A fila entre as duas guarda no máximo
+    lotes_em_espera lotes: se o callback for mais lento, a leitura espera,
+    então a memória não depende do tamanho do relatório.
+
     Args:
         arquivo_path (str): Caminho para o arquivo
-        callback (function): Função de callback para processar cada lote
-        
+        callback (function): Função de callback para processar cada lote;
+            recebe a lista de registros e retorna (sucesso, processados, erros, mensagem)
+        tamanho_lote (int): Registros por lote (padrão: ERP_IMPORTACAO_LOTE)
+        lotes_em_espera (int): Lotes lidos aguardando o callback (padrão: ERP_IMPORTACAO_LOTES_EM_ESPERA)
+
     Returns:
-        dict: Resultado do processamento com estatísticas
+        dict: Resultado do processamento com estatísticas e o período declarado
+            no cabeçalho do relatório (periodo: (data inicial, data final) ou None)
     """
     resultado = {
         'sucesso': False,
         'registros_processados': 0,
         'registros_com_erro': 0,
         'valor_total': 0,
+        'lotes': 0,
+        'periodo': None,
         'mensagem': ''
     }
-    
+    cabecalho = {}
+
+    fila = queue.Queue(maxsize=max(1, lotes_em_espera or LOTES_EM_ESPERA))
+    cancelado = threading.Event()
+    produtor = threading.Thread(
+        target=_produzir_lotes, name='erp-leitura-lotes', daemon=True,
+        args=(arquivo_path, max(1, tamanho_lote or TAMANHO_LOTE), fila, cancelado, cabecalho))
+    produtor.start()
+
     try:
-        # Extrair todos os dados (poderia ser em lotes para arquivos muito grandes)
-        dados = extrair_dados_xls(arquivo_path)
-        
-        if not dados:
+        registros = 0
+        while True:
+            lote = fila.get()
+            if lote is _FIM_LOTES:
+                break
+            if isinstance(lote, Exception):
+                resultado['mensagem'] = f"Erro durante o processamento: {str(lote)}"
+                return resultado
+
+            resultado['lotes'] += 1
+            registros += len(lote)
+            # Calcular valor total
+            resultado['valor_total'] += sum(registro['valor'] for registro in lote)
+
+            if not callback:
+                # Se não houver callback, apenas contar os registros
+                resultado['registros_processados'] += len(lote)
+                continue
+
+            # Chamar o callback para cada lote
+            sucesso, processados, erros, mensagem = callback(lote)
+
+            # Atualizar estatísticas
+            resultado['registros_processados'] += processados
+            resultado['registros_com_erro'] += erros
+
+            # Se houver erro crítico, interromper
+            if not sucesso:
+                resultado['mensagem'] = mensagem
+                return resultado
+
+        # A thread produtora já terminou a leitura
+        resultado['periodo'] = cabecalho.get('periodo')
+        if not registros:
             resultado['mensagem'] = "Nenhum dado encontrado no arquivo"
             return resultado
-        
-        # Processar os dados
+
+        resultado['sucesso'] = True
         if callback:
-            # Tamanho do lote
-            tamanho_lote = 1000
-            
-            # Dividir em lotes
-            for i in range(0, len(dados), tamanho_lote):
-                lote = dados[i:i + tamanho_lote]
-                
-                # Chamar o callback para cada lote
-                sucesso, processados, erros, mensagem = callback(lote)
-                
-                # Atualizar estatísticas
-                resultado['registros_processados'] += processados
-                resultado['registros_com_erro'] += erros
-                
-                # Calcular valor total
-                for registro in lote:
-                    resultado['valor_total'] += registro['valor']
-                
-                # Se houver erro crítico, interromper
-                if not sucesso:
-                    resultado['mensagem'] = mensagem
-                    return resultado
-            
-            resultado['sucesso'] = True
             resultado['mensagem'] = f"Processamento concluído: {resultado['registros_processados']} registros processados, {resultado['registros_com_erro']} com erro"
         else:
-            # Se não houver callback, apenas contar os registros
-            resultado['registros_processados'] = len(dados)
-            for registro in dados:
-                resultado['valor_total'] += registro['valor']
-            
-            resultado['sucesso'] = True
             resultado['mensagem'] = f"Dados extraídos: {resultado['registros_processados']} registros encontrados"
-        
         return resultado
-    
+
     except Exception as e:
         logger.error(f"Erro ao processar arquivo em lotes: {str(e)}", exc_info=True)
         resultado['mensagem'] = f"Erro durante o processamento: {str(e)}"
         return resultado
+
+    finally:
+        cancelado.set()
+        produtor.join()
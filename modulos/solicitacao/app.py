@@ -1,9 +1,7 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
-import os
 import logging
 from datetime import datetime
-import mysql.connector
-from mysql.connector import Error
+from utils.db import get_pooled_connection
 
 # Configuração de logging
 logging.basicConfig(
@@ -23,17 +21,8 @@ mod_solicitacao = Blueprint('solicitacao', __name__,
 
 
 def get_db_connection():
-    try:
-        connection = mysql.connector.connect(
-            host=os.environ.get('DB_HOST', 'localhost'),
-            database=os.environ.get('DB_NAME', 'sistema_solicitacoes'),
-            user=os.environ.get('DB_USER', 'root'),
-            password=os.environ.get('DB_PASSWORD', 'sua_senha')
-        )
-        return connection
-    except Error as e:
-        logger.error(f"Erro ao conectar ao MySQL: {e}")
-        return None
+    # Conexão emprestada do pool central; close() devolve ao pool
+    return get_pooled_connection()
 
 # Rota principal - dashboard de solicitações
 
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark da identificação e decodificação de XML em Base64.
+
+Compara as funções atuais de modulos/importacao_nf/xml_utils.py com cópias
+das versões anteriores (regex sobre a string inteira, três .replace, até
+quatro decodificações e gravação em arquivo temporário), para XMLs sintéticos
+de tamanhos diferentes.
+
+Exemplos:
+    python scripts/benchmark_base64.py
+    python scripts/benchmark_base64.py --tamanhos 10,500,5000 --repeticoes 20
+"""
+
+import os
+import re
+import sys
+import json
+import base64
+import timeit
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+
+# Adicionar o diretório raiz ao PATH para importar os módulos do sistema
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from modulos.importacao_nf.xml_utils import (  # noqa: E402
+    decodificar_base64_bytes, decodificar_base64_xml, identificar_xml_base64)
+
+# Configuração de logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+logging.getLogger('importacao_xml').setLevel(logging.WARNING)
+
+
+def identificar_legado(texto):
+    """Versão anterior de identificar_xml_base64 para strings"""
+    if len(texto) > 100:
+        if re.match(r'^[A-Za-z0-9+/=]+$', texto.strip()):
+            return texto
+    return None
+
+
+def decodificar_legado(base64_str):
+    """Versão anterior de decodificar_base64_xml (inclui o arquivo temporário)"""
+    base64_str = base64_str.replace(
+        " ", "").replace("\n", "").replace("\r", "")
+    xml_bytes = base64.b64decode(base64_str)
+
+    xml_content = None
+    for encoding in ['utf-8', 'latin1', 'iso-8859-1', 'cp1252']:
+        try:
+            xml_content = xml_bytes.decode(encoding)
+            break
+        except UnicodeDecodeError:
+            continue
+
+    temp_file = tempfile.NamedTemporaryFile(
+        mode='w', suffix='.xml', delete=False, encoding='utf-8')
+    temp_file.write(xml_content)
+    temp_file_path = temp_file.name
+    temp_file.close()
+
+    return {'xml_content': xml_content, 'temp_file_path': temp_file_path}
+
+
+def gerar_xml(tamanho_kb, encoding='utf-8'):
+    """XML de NF-e sintético com aproximadamente `tamanho_kb` KB"""
+    item = ('<det nItem="{0}"><prod><cProd>P{0}</cProd><xProd>Produto de teste '
+            'com descrição {0}</xProd><qCom>1.0000</qCom><vUnCom>10.00</vUnCom>'
+            '<vProd>10.00</vProd></prod></det>')
+    itens = []
+    total = 0
+    while total < tamanho_kb * 1024:
+        det = item.format(len(itens) + 1)
+        itens.append(det)
+        total += len(det)
+    xml = (f'<?xml version="1.0" encoding="{encoding}"?>'
+           '<nfeProc xmlns="http://www.portalfiscal.inf.br/nfe"><NFe><infNFe>'
+           + ''.join(itens) + '</infNFe></NFe></nfeProc>')
+    return xml.encode(encoding)
+
+
+def medir(funcao, repeticoes):
+    """Melhor tempo (ms) de uma chamada entre `repeticoes` execuções"""
+    return min(timeit.repeat(funcao, number=1, repeat=repeticoes)) * 1000
+
+
+def executar(tamanhos, repeticoes):
+    """Executa as medições para cada tamanho de XML"""
+    linhas = []
+    for tamanho in tamanhos:
+        texto = base64.b64encode(gerar_xml(tamanho)).decode('ascii')
+
+        def legado():
+            resultado = decodificar_legado(identificar_legado(texto))
+            os.unlink(resultado['temp_file_path'])
+
+        resultados = {
+            'identificar (legado)': medir(lambda: identificar_legado(texto), repeticoes),
+            'identificar (atual)': medir(lambda: identificar_xml_base64(texto), repeticoes),
+            'identificar + decodificar (legado)': medir(legado, repeticoes),
+            'identificar + decodificar_base64_xml': medir(
+                lambda: decodificar_base64_xml(identificar_xml_base64(texto)), repeticoes),
+            'identificar + decodificar_base64_bytes': medir(
+                lambda: decodificar_base64_bytes(identificar_xml_base64(texto)), repeticoes),
+        }
+        for nome, ms in resultados.items():
+            linhas.append({'tamanho_kb': tamanho, 'etapa': nome, 'ms': round(ms, 3)})
+    return linhas
+
+
+def main():
+    """Função principal do script"""
+    parser = argparse.ArgumentParser(
+        description="Micro-benchmark da identificação/decodificação de XML em Base64")
+    parser.add_argument('--tamanhos', default='10,200,2000',
+                        help="Tamanhos dos XMLs em KB, separados por vírgula (padrão: 10,200,2000)")
+    parser.add_argument('--repeticoes', type=int, default=10,
+                        help="Execuções por medição; vale a melhor (padrão: 10)")
+    parser.add_argument('--json', action='store_true',
+                        help="Imprime os resultados em JSON")
+
+    args = parser.parse_args()
+    tamanhos = [int(valor) for valor in args.tamanhos.split(',') if valor.strip()]
+
+    linhas = executar(tamanhos, args.repeticoes)
+
+    if args.json:
+        print(json.dumps(linhas, indent=2, ensure_ascii=False))
+        return 0
+
+    print(f"{'KB':>6}  {'etapa':<42} {'ms':>10}")
+    for linha in linhas:
+        print(f"{linha['tamanho_kb']:>6}  {linha['etapa']:<42} {linha['ms']:>10.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Benchmark da gravação dos lançamentos do ERP em erp_transacoes.
+
+Compara a inserção anterior (um INSERT por registro, com try/except por
+linha) com a carga em massa de modulos/integracao_erp/persistencia.py por
+INSERT multi-linha e por LOAD DATA LOCAL INFILE. Os registros sintéticos
+incluem uma fração de linhas inválidas (sem centro de custo, documento longo,
+valor fora do DECIMAL(15,2)) para conferir que os erros por linha continuam
+os mesmos.
+
+Roda contra o MySQL do .env (DB_*). Cada método grava dentro de uma transação
+desfeita ao final, então erp_transacoes não é alterada. A comparação das
+linhas rejeitadas supõe o sql_mode estrito (padrão do MySQL 5.7+); sem ele a
+inserção anterior truncava os textos longos em vez de rejeitá-los.
+
+Exemplos:
+    python scripts/benchmark_carga_erp.py
+    python scripts/benchmark_carga_erp.py --registros 100000 --lote 2000
+    python scripts/benchmark_carga_erp.py --metodos insert,load_data
+"""
+
+import sys
+import time
+import random
+import logging
+import argparse
+from datetime import date, datetime
+from pathlib import Path
+
+# Adicionar o diretório raiz ao PATH para importar os módulos do sistema
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dotenv import load_dotenv  # noqa: E402
+
+load_dotenv(dotenv_path=Path(__file__).resolve().parent.parent / '.env')
+
+from utils.db import get_pooled_connection  # noqa: E402
+from modulos.integracao_erp import persistencia  # noqa: E402
+from modulos.integracao_erp.persistencia import (  # noqa: E402
+    CAMPOS_TRANSACAO, EXPRESSAO_CHAVE_NATURAL, CargaTransacoes, criar_tabela_transacoes)
+
+# Configuração de logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+METODOS = ('legado', 'insert', 'load_data')
+
+
+def gerar_registros(quantidade, invalidos, semente=42):
+    """
+    Gera registros como os de iterar_registros_xls
+
+    Args:
+        quantidade: Número de registros
+        invalidos: Fração de registros que o banco deve rejeitar
+        semente: Semente do gerador aleatório
+
+    Returns:
+        list: Dicionários com os campos de erp_transacoes
+    """
+    aleatorio = random.Random(semente)
+    data_processamento = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    registros = []
+    for indice in range(quantidade):
+        pagamento = date(2024, aleatorio.randint(1, 12), aleatorio.randint(1, 28))
+        registro = {
+            'centro_custo': f"{1000 + indice // 500:04d}-{indice % 100:02d}",
+            'categoria': str(aleatorio.randint(1, 40)),
+            'data_pagamento': pagamento.strftime('%d/%m/%Y'),
+            'dt_pagamento': pagamento,
+            'documento': str(100000 + indice),
+            'emitente': f"Fornecedor {aleatorio.randint(1, 500)} & Cia\tLtda",
+            'historico': f"Pagamento ref. NF {indice}\nparcela {aleatorio.randint(1, 12)} \\ única",
+            'valor': round(aleatorio.uniform(0.01, 100000), 2),
+            'data_processamento': data_processamento,
+        }
+        if aleatorio.random() < invalidos:
+            defeito = aleatorio.randint(0, 2)
+            if defeito == 0:
+                registro['centro_custo'] = None
+            elif defeito == 1:
+                registro['documento'] = 'X' * 150
+            else:
+                registro['valor'] = 1e14
+        registros.append(registro)
+    return registros
+
+
+def inserir_legado(cursor, registros):
+    """
+    Gravação anterior (salvar_dados_no_banco, já removida): um INSERT por registro
+    (com chave_natural, obrigatória desde db-update-erp-transacoes-chave.sql, e dt_pagamento)
+    """
+    records_insert = 0
+    for registro in registros:
+        try:
+            cursor.execute(f"""
+                INSERT INTO erp_transacoes (
+                    centro_custo, categoria, data_pagamento, dt_pagamento, documento,
+                    emitente, historico, valor, data_processamento, chave_natural
+                )
+                SELECT r.*, {EXPRESSAO_CHAVE_NATURAL}
+                FROM (SELECT %s AS centro_custo, %s AS categoria, %s AS data_pagamento,
+                             %s AS dt_pagamento, %s AS documento, %s AS emitente,
+                             %s AS historico, %s AS valor, %s AS data_processamento) r
+            """, (
+                registro['centro_custo'],
+                registro['categoria'],
+                registro['data_pagamento'],
+                registro['dt_pagamento'],
+                registro['documento'],
+                registro['emitente'],
+                registro['historico'],
+                registro['valor'],
+                registro['data_processamento']
+            ))
+            records_insert += 1
+        except Exception as e:
+            logger.debug(f"Erro ao inserir registro: {str(e)}")
+    return records_insert, len(registros) - records_insert
+
+
+def executar(metodo, registros, tamanho_lote):
+    """
+    Grava os registros com um método e desfaz a transação
+
+    Returns:
+        dict: Tempo, inseridos, erros e as linhas gravadas (para comparação)
+    """
+    connection = get_pooled_connection()
+    if not connection:
+        raise RuntimeError("Não foi possível conectar ao banco de dados")
+
+    cursor = connection.cursor()
+    try:
+        # DDL fora da medição (CREATE TABLE confirma a transação implicitamente)
+        criar_tabela_transacoes(cursor)
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM erp_transacoes")
+        id_inicial = cursor.fetchone()[0]
+
+        lotes = [registros[i:i + tamanho_lote] for i in range(0, len(registros), tamanho_lote)]
+        inicio = time.perf_counter()
+        inseridos = erros = 0
+        observacao = ''
+        if metodo == 'legado':
+            for lote in lotes:
+                parcial = inserir_legado(cursor, lote)
+                inseridos += parcial[0]
+                erros += parcial[1]
+        else:
+            with CargaTransacoes(cursor, load_data=metodo == 'load_data') as carga:
+                for lote in lotes:
+                    parcial = carga.gravar_lote(lote)
+                    inseridos += parcial[0]
+                    erros += parcial[1]
+            if metodo == 'load_data' and persistencia._load_data_recusado:
+                observacao = 'recusado pelo servidor, usou INSERT multi-linha'
+        segundos = time.perf_counter() - inicio
+
+        cursor.execute(f"""
+            SELECT {', '.join(CAMPOS_TRANSACAO)}
+            FROM erp_transacoes WHERE id > %s ORDER BY id
+        """, (id_inicial,))
+        linhas = cursor.fetchall()
+        return {'metodo': metodo, 'segundos': segundos, 'inseridos': inseridos,
+                'erros': erros, 'linhas': linhas, 'observacao': observacao}
+    finally:
+        connection.rollback()
+        cursor.close()
+        connection.close()
+
+
+def main():
+    """Função principal do script"""
+    parser = argparse.ArgumentParser(
+        description="Benchmark da gravação dos lançamentos do ERP em erp_transacoes")
+    parser.add_argument('--registros', type=int, default=20000,
+                        help="Quantidade de registros sintéticos (padrão: 20000)")
+    parser.add_argument('--lote', type=int, default=1000,
+                        help="Registros por lote, como em processar_arquivo_batch (padrão: 1000)")
+    parser.add_argument('--invalidos', type=float, default=0.01, metavar='FRACAO',
+                        help="Fração de registros inválidos (padrão: 0.01)")
+    parser.add_argument('--metodos', default=','.join(METODOS),
+                        help=f"Métodos separados por vírgula (padrão: {','.join(METODOS)})")
+    parser.add_argument('--semente', type=int, default=42,
+                        help="Semente do gerador aleatório (padrão: 42)")
+
+    args = parser.parse_args()
+
+    metodos = [metodo.strip() for metodo in args.metodos.split(',') if metodo.strip()]
+    desconhecidos = set(metodos) - set(METODOS)
+    if desconhecidos:
+        parser.error(f"Métodos desconhecidos: {', '.join(sorted(desconhecidos))}")
+
+    # Os erros por linha distorcem as medições
+    logging.getLogger('integracao_erp.persistencia').setLevel(logging.CRITICAL)
+
+    logger.info(f"Gerando {args.registros} registros ({args.invalidos:.1%} inválidos)")
+    registros = gerar_registros(args.registros, args.invalidos, args.semente)
+
+    resultados = []
+    for metodo in metodos:
+        logger.info(f"Método: {metodo}")
+        resultados.append(executar(metodo, registros, args.lote))
+
+    referencia = resultados[0]
+    divergentes = 0
+    cabecalho = f"{'Método':<12}{'Segundos':>10}{'Registros/s':>13}{'Inseridos':>11}{'Erros':>8}{'Ganho':>8}  Observação"
+    print()
+    print(cabecalho)
+    print('-' * len(cabecalho))
+    for resultado in resultados:
+        segundos = resultado['segundos']
+        ganho = referencia['segundos'] / segundos if segundos else 0
+        print(f"{resultado['metodo']:<12}{segundos:>10.3f}{len(registros) / segundos if segundos else 0:>13.0f}"
+              f"{resultado['inseridos']:>11}{resultado['erros']:>8}{ganho:>7.1f}x  {resultado['observacao']}")
+        if resultado['linhas'] != referencia['linhas'] or resultado['erros'] != referencia['erros']:
+            divergentes += 1
+            logger.error(f"{resultado['metodo']}: linhas gravadas diferentes de {referencia['metodo']}")
+
+    return 1 if divergentes else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+Benchmark do pipeline de importação de NF-e (XML/ZIP).
+
+Gera um lote sintético de NF-e (quantidade de itens, namespace, codificação e
+variantes em Base64 configuráveis) e mede cada etapa da importação:
+
+- parse em memória (extrair_nfe_xml) e a partir de arquivos (process_xml_file)
+- decodificação Base64 (identificar_xml_base64 + decodificar_base64_bytes)
+- parse dos membros de um ZIP, sequencial e no pool de processos
+- com --db: processar_arquivo_xml, os caminhos de ZIP e a gravação em lote
+
+A persistência só roda contra MySQL (DB_* do .env): as consultas usam sintaxe
+específica do MySQL, então não há substituto em SQLite. Use um banco dedicado;
+as chaves geradas começam com o prefixo de --prefixo-chave. As notas sintéticas
+são removidas antes de cada etapa de inserção (para que ela de fato insira) e
+ao final com --limpar.
+
+Exemplos:
+    python scripts/benchmark_importacao.py --notas 500 --itens 1-40
+    python scripts/benchmark_importacao.py --namespace misto --base64 0.2 --json
+    python scripts/benchmark_importacao.py --db --limpar
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import base64
+import shutil
+import logging
+import zipfile
+import argparse
+import resource
+import tempfile
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+# Adicionar o diretório raiz ao PATH para importar os módulos do sistema
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dotenv import load_dotenv  # noqa: E402
+
+load_dotenv(dotenv_path=Path(__file__).resolve().parent.parent / '.env')
+
+from modulos.importacao_nf import app as importacao  # noqa: E402
+from modulos.importacao_nf.persistencia import salvar_lote_nfe  # noqa: E402
+from modulos.importacao_nf.resumo import ResumoDiario  # noqa: E402
+from modulos.importacao_nf.xml_utils import (  # noqa: E402
+    decodificar_base64_bytes, identificar_xml_base64)
+
+# Configuração de logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+NS_NFE = 'http://www.portalfiscal.inf.br/nfe'
+
+
+def gerar_nfe(indice, itens, namespace=True, encoding='utf-8', prefixo_chave='99'):
+    """
+    Gera o XML (bytes) de uma NF-e sintética
+
+    Args:
+        indice: Número sequencial da nota (compõe a chave de acesso)
+        itens: Quantidade de itens (det)
+        namespace: Se o XML usa o namespace da NF-e
+        encoding: Codificação declarada e usada no XML
+        prefixo_chave: Prefixo numérico da chave de acesso
+
+    Returns:
+        bytes: Conteúdo do XML
+    """
+    chave = f"{prefixo_chave}{indice:0{44 - len(prefixo_chave)}d}"
+    xmlns = f' xmlns="{NS_NFE}"' if namespace else ''
+
+    dets = []
+    total = 0.0
+    for i in range(1, itens + 1):
+        quantidade = (i % 7) + 1
+        unitario = round(3.5 + (i % 13) * 1.25, 2)
+        valor = round(quantidade * unitario, 2)
+        total += valor
+        dets.append(
+            f'<det nItem="{i}"><prod><cProd>PRD{i:05d}</cProd><cEAN>SEM GTIN</cEAN>'
+            f'<xProd>Produto de referência {i} - ação/promoção</xProd><NCM>84713012</NCM>'
+            f'<CFOP>5102</CFOP><uCom>UN</uCom><qCom>{quantidade:.4f}</qCom>'
+            f'<vUnCom>{unitario:.10f}</vUnCom><vProd>{valor:.2f}</vProd></prod>'
+            f'<imposto><ICMS><ICMS00><orig>0</orig><CST>00</CST><vBC>{valor:.2f}</vBC>'
+            f'<pICMS>18.00</pICMS><vICMS>{valor * 0.18:.2f}</vICMS></ICMS00></ICMS></imposto></det>')
+
+    xml = (
+        f'<?xml version="1.0" encoding="{encoding.upper()}"?>\n'
+        f'<nfeProc{xmlns} versao="4.00"><NFe{xmlns}><infNFe Id="NFe{chave}" versao="4.00">'
+        f'<ide><cUF>35</cUF><natOp>Venda de mercadoria</natOp><mod>55</mod><serie>1</serie>'
+        f'<nNF>{indice}</nNF><dhEmi>2024-03-15T10:30:00-03:00</dhEmi></ide>'
+        f'<emit><CNPJ>11222333000181</CNPJ><xNome>Emitente Benchmark Ltda</xNome>'
+        f'<enderEmit><xLgr>Rua São João</xLgr><nro>100</nro></enderEmit></emit>'
+        f'<dest><CNPJ>99888777000100</CNPJ><xNome>Destinatário Benchmark S.A.</xNome></dest>'
+        f'{"".join(dets)}'
+        f'<total><ICMSTot><vNF>{total:.2f}</vNF></ICMSTot></total>'
+        f'</infNFe></NFe><protNFe versao="4.00"><infProt><chNFe>{chave}</chNFe></infProt></protNFe>'
+        f'</nfeProc>')
+    return xml.encode(encoding)
+
+
+def _faixa(valor):
+    """Converte '20' ou '1-40' em (mínimo, máximo)"""
+    if '-' in valor:
+        minimo, maximo = valor.split('-', 1)
+        return int(minimo), int(maximo)
+    return int(valor), int(valor)
+
+
+def gerar_lote(args):
+    """
+    Gera o lote sintético conforme os argumentos
+
+    Returns:
+        list: Dicionários com nome, conteúdo (bytes), itens e se é Base64
+    """
+    rnd = random.Random(args.semente)
+    itens_min, itens_max = _faixa(args.itens)
+    encodings = args.encodings.split(',')
+
+    lote = []
+    for indice in range(1, args.notas + 1):
+        if args.namespace == 'misto':
+            namespace = rnd.random() < 0.5
+        else:
+            namespace = args.namespace == 'com'
+        itens = rnd.randint(itens_min, itens_max)
+        conteudo = gerar_nfe(indice, itens, namespace,
+                             rnd.choice(encodings), args.prefixo_chave)
+        lote.append({
+            'nome': f'nfe_{indice:06d}.xml',
+            'conteudo': conteudo,
+            'itens': itens,
+            'base64': rnd.random() < args.base64,
+        })
+    return lote
+
+
+def rss_pico_mb():
+    """Pico de memória residente (MB) deste processo e dos filhos já encerrados"""
+    proprio = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    filhos = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss é em KB no Linux e em bytes no macOS
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return proprio / divisor, filhos / divisor
+
+
+class Benchmark:
+    """Cronometra as etapas e acumula o relatório"""
+
+    def __init__(self):
+        self.etapas = []
+
+    def medir(self, nome, funcao, arquivos, itens):
+        """Executa funcao() e registra tempo, vazão e memória da etapa"""
+        logger.info(f"Etapa: {nome}")
+        inicio = time.perf_counter()
+        falhas = funcao()
+        segundos = time.perf_counter() - inicio
+        rss, rss_filhos = rss_pico_mb()
+
+        self.etapas.append({
+            'etapa': nome,
+            'arquivos': arquivos,
+            'itens': itens,
+            'falhas': falhas or 0,
+            'segundos': round(segundos, 4),
+            'arquivos_s': round(arquivos / segundos, 1) if segundos else None,
+            'itens_s': round(itens / segundos, 1) if segundos else None,
+            'rss_pico_mb': round(rss, 1),
+            'rss_pico_filhos_mb': round(rss_filhos, 1),
+        })
+
+    def imprimir(self):
+        cabecalho = f"{'Etapa':<40}{'Arquivos':>9}{'Falhas':>8}{'Segundos':>10}{'Arq/s':>10}{'Itens/s':>11}{'RSS MB':>9}{'Filhos MB':>11}"
+        print()
+        print(cabecalho)
+        print('-' * len(cabecalho))
+        for etapa in self.etapas:
+            print(f"{etapa['etapa']:<40}{etapa['arquivos']:>9}{etapa['falhas']:>8}"
+                  f"{etapa['segundos']:>10.3f}{etapa['arquivos_s'] or 0:>10.1f}"
+                  f"{etapa['itens_s'] or 0:>11.1f}{etapa['rss_pico_mb']:>9.1f}"
+                  f"{etapa['rss_pico_filhos_mb']:>11.1f}")
+
+
+def _contar_falhas(resultados):
+    return sum(1 for resultado in resultados if not resultado or resultado == 'erro')
+
+
+def etapas_parse(bench, lote, diretorio, workers):
+    """Etapas sem banco de dados: parse, Base64 e ZIP"""
+    simples = [nota for nota in lote if not nota['base64']]
+    em_base64 = [nota for nota in lote if nota['base64']]
+    itens_simples = sum(nota['itens'] for nota in simples)
+
+    bench.medir('parse em memória (extrair_nfe_xml)',
+                lambda: _contar_falhas([importacao.extrair_nfe_xml(nota['conteudo'], nota['nome'])
+                                        for nota in simples]),
+                len(simples), itens_simples)
+
+    caminhos = []
+    for nota in simples:
+        caminho = os.path.join(diretorio, nota['nome'])
+        with open(caminho, 'wb') as f:
+            f.write(nota['conteudo'])
+        caminhos.append(caminho)
+
+    bench.medir('parse de arquivo (process_xml_file)',
+                lambda: _contar_falhas([importacao.process_xml_file(caminho)
+                                        for caminho in caminhos]),
+                len(simples), itens_simples)
+
+    if em_base64:
+        textos = [base64.b64encode(nota['conteudo']).decode('ascii')
+                  for nota in em_base64]
+
+        def decodificar():
+            falhas = 0
+            for texto in textos:
+                decodificado = decodificar_base64_bytes(identificar_xml_base64(texto))
+                if not decodificado or not importacao.extrair_nfe_xml(decodificado):
+                    falhas += 1
+            return falhas
+
+        bench.medir('Base64 + parse', decodificar, len(em_base64),
+                    sum(nota['itens'] for nota in em_base64))
+
+    zip_path = os.path.join(diretorio, 'lote.zip')
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        for nota in simples:
+            zip_ref.writestr(nota['nome'], nota['conteudo'])
+
+    def parse_zip_sequencial():
+        with zipfile.ZipFile(zip_path) as zip_ref:
+            return _contar_falhas([importacao._preparar_nfe_membro(item.filename, zip_ref.read(item))
+                                   for item in zip_ref.infolist()])
+
+    def parse_zip_pool():
+        with zipfile.ZipFile(zip_path) as zip_ref, \
+                ProcessPoolExecutor(max_workers=workers) as executor:
+            futuros = [executor.submit(importacao._preparar_nfe_membro,
+                                       item.filename, zip_ref.read(item))
+                       for item in zip_ref.infolist()]
+            return _contar_falhas([futuro.result() for futuro in futuros])
+
+    bench.medir('ZIP: parse sequencial', parse_zip_sequencial,
+                len(simples), itens_simples)
+    bench.medir(f'ZIP: parse em {workers} processos', parse_zip_pool,
+                len(simples), itens_simples)
+
+    return caminhos, zip_path, itens_simples
+
+
+def etapas_banco(bench, lote, caminhos, zip_path, itens, workers, prefixo_chave):
+    """
+    Etapas com gravação no MySQL. Antes de cada etapa de inserção as notas
+    sintéticas são removidas (fora da medição); a reimportação roda sobre as
+    notas recém-inseridas.
+    """
+    total = len(caminhos)
+    notas = [importacao.extrair_nfe_xml(nota['conteudo'], nota['nome'])
+             for nota in lote if not nota['base64']]
+
+    limpar_banco(prefixo_chave)
+    bench.medir('banco: salvar_lote_nfe (inserção)',
+                lambda: _contar_falhas(salvar_lote_nfe(notas)), total, itens)
+    bench.medir('banco: salvar_lote_nfe (reimportação)',
+                lambda: _contar_falhas(salvar_lote_nfe(notas)), total, itens)
+
+    limpar_banco(prefixo_chave)
+    bench.medir('banco: processar_arquivo_xml (inserção)',
+                lambda: _contar_falhas([importacao.processar_arquivo_xml(caminho)
+                                        for caminho in caminhos]),
+                total, itens)
+
+    temp_dir = tempfile.mkdtemp(prefix='bench_zip_')
+    try:
+        # Fora dos workers da fila o parse dos ZIPs roda no próprio processo
+        limpar_banco(prefixo_chave)
+        bench.medir('banco: processar_arquivo_zip (inserção, 1 processo)',
+                    lambda: importacao.processar_arquivo_zip(zip_path, temp_dir)['erros'],
+                    total, itens)
+
+        limpar_banco(prefixo_chave)
+        bench.medir(f'banco: ZIP paralelo (inserção, {workers} processos)',
+                    lambda: importacao.processar_arquivo_zip_paralelo(zip_path, workers)['erros'],
+                    total, itens)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def limpar_banco(prefixo_chave):
+    """Remove as notas sintéticas (e seus itens) do banco"""
+    from utils.db import get_pooled_connection
+
+    connection = get_pooled_connection()
+    if not connection:
+        logger.error("Não foi possível conectar ao banco de dados para limpeza")
+        return
+    try:
+        # Retira as notas sintéticas do resumo diário antes de apagá-las
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("""
+            SELECT data_importacao, data_emissao, status_processamento,
+                   cnpj_emitente, nome_emitente, valor_total
+            FROM nf_notas WHERE chave_acesso LIKE %s
+        """, (prefixo_chave + '%',))
+        resumo = ResumoDiario()
+        for nota in cursor.fetchall():
+            resumo.remover(nota)
+        resumo.gravar(cursor)
+
+        cursor.execute("""
+            DELETE i FROM nf_itens i
+            JOIN nf_notas n ON n.id = i.nf_id
+            WHERE n.chave_acesso LIKE %s
+        """, (prefixo_chave + '%',))
+        cursor.execute("DELETE FROM nf_notas WHERE chave_acesso LIKE %s",
+                       (prefixo_chave + '%',))
+        logger.info(f"{cursor.rowcount} notas sintéticas removidas")
+        connection.commit()
+        cursor.close()
+    finally:
+        connection.close()
+
+
+def main():
+    """Função principal do script"""
+    parser = argparse.ArgumentParser(
+        description="Benchmark do pipeline de importação de NF-e")
+    parser.add_argument('--notas', type=int, default=200,
+                        help="Quantidade de NF-e sintéticas (padrão: 200)")
+    parser.add_argument('--itens', default='1-30',
+                        help="Itens por nota: N ou MIN-MAX (padrão: 1-30)")
+    parser.add_argument('--namespace', choices=['com', 'sem', 'misto'], default='com',
+                        help="Namespace da NF-e nos XMLs (padrão: com)")
+    parser.add_argument('--encodings', default='utf-8',
+                        help="Codificações separadas por vírgula, ex.: utf-8,iso-8859-1")
+    parser.add_argument('--base64', type=float, default=0.0, metavar='FRACAO',
+                        help="Fração das notas enviadas em Base64 (padrão: 0)")
+    parser.add_argument('--processos', type=int, default=os.cpu_count() or 1,
+                        help="Processos de parse no pool (padrão: número de CPUs)")
+    parser.add_argument('--semente', type=int, default=42,
+                        help="Semente do gerador aleatório (padrão: 42)")
+    parser.add_argument('--prefixo-chave', default='99',
+                        help="Prefixo das chaves de acesso sintéticas (padrão: 99)")
+    parser.add_argument('--db', action='store_true',
+                        help="Inclui as etapas de gravação no MySQL configurado no .env")
+    parser.add_argument('--limpar', action='store_true',
+                        help="Remove as notas sintéticas do banco ao final (com --db)")
+    parser.add_argument('--json', action='store_true',
+                        help="Imprime o relatório em JSON")
+
+    args = parser.parse_args()
+
+    # Os logs por nota distorcem as medições
+    logging.getLogger('importacao_xml').setLevel(logging.WARNING)
+
+    logger.info(f"Gerando {args.notas} NF-e sintéticas (itens {args.itens}, "
+                f"namespace {args.namespace}, Base64 {args.base64:.0%})")
+    lote = gerar_lote(args)
+
+    bench = Benchmark()
+    diretorio = tempfile.mkdtemp(prefix='bench_importacao_')
+    try:
+        caminhos, zip_path, itens = etapas_parse(
+            bench, lote, diretorio, args.processos)
+        if args.db:
+            try:
+                etapas_banco(bench, lote, caminhos, zip_path,
+                             itens, args.processos, args.prefixo_chave)
+            finally:
+                if args.limpar:
+                    limpar_banco(args.prefixo_chave)
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps({
+            'parametros': vars(args),
+            'etapas': bench.etapas,
+        }, indent=2, ensure_ascii=False))
+    else:
+        bench.imprimir()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Confere o extrator do relatório Custo Analítico do ERP com o parser anterior.
+
+Compara iterar_registros_xls (modulos/integracao_erp/processor.py, tokenizador
+incremental usado na importação) com uma cópia da versão anterior
+(BeautifulSoup com html.parser) em casos de borda escritos à mão, em um
+relatório sintético e nos arquivos informados. Os registros devem ser
+idênticos, exceto data_processamento e dt_pagamento (que a versão anterior não
+gerava) e os lançamentos anteriores ao primeiro centro de custo, que a versão
+anterior gerava com centro_custo vazio (recusados na gravação) e a atual
+ignora. Também são medidos o tempo e o pico de memória de cada versão.
+
+Exemplos:
+    python scripts/comparar_extrator_erp.py
+    python scripts/comparar_extrator_erp.py --lancamentos 100000
+    python scripts/comparar_extrator_erp.py base.xls outro.xls
+"""
+
+import os
+import re
+import sys
+import time
+import random
+import logging
+import argparse
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+# Adicionar o diretório raiz ao PATH para importar os módulos do sistema
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+from modulos.integracao_erp.processor import iterar_registros_xls  # noqa: E402
+
+# Configuração de logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+logging.getLogger('integracao_erp.processor').setLevel(logging.WARNING)
+
+# Campos que a versão anterior não gerava
+CAMPOS_IGNORADOS = ('data_processamento', 'dt_pagamento')
+
+# Tamanhos de bloco usados nos casos de borda (blocos pequenos quebram tags e entidades)
+BLOCOS_CONFERENCIA = (None, 7, 64)
+
+CABECALHO = ('<html><head><meta http-equiv="Content-Type" content="text/html; charset=utf-8">'
+             '<style>td {{ font-size: 8pt }}</style></head><body>'
+             '<table><tr><td>Custo Analítico</td><td>{periodo}</td></tr></table>\n'
+             '<table border="1">\n')
+
+# Casos de borda: cada um é um documento completo
+CASOS = {
+    'sem tabela': '<html><body><p>vazio</p></body></html>',
+    'tabela sem linhas': '<table></table>',
+    'nbsp e entidades': (
+        '<table><tr><td>C.Custo:&nbsp;1001-01 Obras</td></tr>'
+        '<tr><td></td><td>&nbsp;12 - Material</td></tr>'
+        '<tr><td></td><td>&nbsp;</td><td>01/02/2024</td><td>NF&nbsp;123</td>'
+        '<td>Jos&eacute; &amp; Filhos &#199;ia</td><td></td><td>Compra&nbsp;&nbsp;de cimento</td>'
+        '<td></td><td></td><td></td><td>R$&nbsp;1.234,56</td></tr></table>'),
+    'celulas sem fechamento': (
+        '<table><tr><td>C.Custo: 2002-02<tr><td><td>7 Servicos<tr><td>x<td><td>02/02/2024'
+        '<td>55<td>Fornecedor<td><td>Hist<td><td><td><td>10,00</table>'),
+    'tags internas e br': (
+        '<table><tr><td><font><b>C.Custo:</b> 3003-03</font></td></tr>'
+        '<tr><td></td><td><span>9</span> Outros</td></tr>'
+        '<tr><td></td><td></td><td>03/03/2024<br>x</td><td>7</td><td><i>Emit</i></td><td></td>'
+        '<td>Linha<br/>dupla</td><td></td><td></td><td></td><td><font>99,90</font></td></tr></table>'),
+    'fechamento fora de ordem': (
+        '<table><tr><td><font>C.Custo: 4004-04</td></font></tr>'
+        '<tr><td></td><td>3 Cat</font></td></tr>'
+        '<tr><td></td><td></td><td>04/04/2024</td><td>1</td><td>E</td><td></td><td>H</td>'
+        '<td></td><td></td><td></td><td>5,00</td></tr></table>'),
+    'tabela aninhada': (
+        '<table><tr><td>C.Custo: 5005-05</td></tr>'
+        '<tr><td></td><td>4 Cat</td></tr>'
+        '<tr><td><table><tr><td>a</td><td>b</td></tr></table></td><td></td><td>05/05/2024</td>'
+        '<td>2</td><td>E</td><td></td><td>H</td><td></td><td></td><td></td><td>6,00</td></tr>'
+        '<tr><td></td><td></td><td>06/05/2024</td><td>3</td><td>E</td><td></td><td>H</td>'
+        '<td></td><td></td><td></td><td>7,00</td></tr></table>'),
+    'valores invalidos e zerados': (
+        '<table><tr><td>C.Custo: 6006-06</td></tr>'
+        '<tr><td></td><td></td><td>d</td><td>1</td><td>E</td><td></td><td>H</td>'
+        '<td></td><td></td><td></td><td>0,00</td></tr>'
+        '<tr><td></td><td></td><td>d</td><td>2</td><td>E</td><td></td><td>H</td>'
+        '<td></td><td></td><td></td><td>1.2,3,4</td></tr>'
+        '<tr><td></td><td></td><td>d</td><td>3</td><td>E</td><td></td><td>H</td>'
+        '<td></td><td></td><td></td><td>-8,00</td></tr>'
+        '<tr><td></td><td></td><td>d</td><td>4</td><td>E</td><td></td><td>H</td>'
+        '<td></td><td></td><td></td><td>abc</td></tr></table>'),
+    'script e comentario': (
+        '<table><tr><td>C.Custo: 7007-07<!-- 9999-99 --></td></tr>'
+        '<tr><td></td><td>5<script>var x = "<td>";</script> Cat</td></tr>'
+        '<tr><td></td><td></td><td>d</td><td>1</td><td>E</td><td></td><td>H</td>'
+        '<td></td><td></td><td></td><td>3,00</td></tr></table>'),
+    'rodape com total': (
+        '<table><tr><td>C.Custo: 9009-09</td></tr>'
+        '<tr><td></td><td>1 Cat</td></tr>'
+        '<tr><td></td><td></td><td>09/09/2024</td><td>1</td><td>E</td><td></td><td>H</td>'
+        '<td></td><td></td><td></td><td>11,00</td></tr></table>'
+        '<table><tr><td>Total</td><td></td><td></td><td></td><td></td><td></td><td></td>'
+        '<td></td><td></td><td></td><td>11,00</td></tr></table>'),
+    'lancamento antes do centro de custo': (
+        '<table><tr><td></td><td></td><td>01/01/2024</td><td>1</td><td>E</td><td></td><td>H</td>'
+        '<td></td><td></td><td></td><td>2,00</td></tr>'
+        '<tr><td>C.Custo: 1010-10</td></tr>'
+        '<tr><td></td><td></td><td>02/01/2024</td><td>2</td><td>E</td><td></td><td>H</td>'
+        '<td></td><td></td><td></td><td>3,00</td></tr></table>'),
+    'linha aberta no fim': (
+        '<table><tr><td>C.Custo: 8008-08</td></tr><tr><td></td><td></td><td>d</td><td>1</td>'
+        '<td>E</td><td></td><td>H</td><td></td><td></td><td></td><td>4,00'),
+}
+
+
+def extrair_dados_xls_legado(arquivo_path):
+    """Versão anterior da extração (árvore BeautifulSoup completa, só a maior tabela)"""
+    dados = []
+
+    with open(arquivo_path, 'r', encoding='utf-8', errors='ignore') as file:
+        html_content = file.read()
+    html_content = html_content.replace('&nbsp;', ' ')
+    soup = BeautifulSoup(html_content, 'html.parser')
+
+    tabelas = soup.find_all('table')
+    if not tabelas:
+        return dados
+    tabela_principal = max(tabelas, key=lambda t: len(t.find_all('tr')))
+
+    centro_custo_atual = None
+    categoria_atual = None
+    for row in tabela_principal.find_all('tr'):
+        cells = row.find_all('td')
+        if not cells:
+            continue
+        cell_texts = [c.text.strip() for c in cells]
+
+        if len(cell_texts) > 0 and "C.Custo:" in cell_texts[0]:
+            codigo_match = re.search(r'(\d{4}-\d{2})', cell_texts[0])
+            if codigo_match:
+                centro_custo_atual = codigo_match.group(1)
+            continue
+
+        if len(cell_texts) > 1 and cell_texts[1] and not cell_texts[1].isspace():
+            categoria_match = re.search(r'^(\d+)', cell_texts[1].strip())
+            if categoria_match:
+                categoria_atual = categoria_match.group(1)
+            continue
+
+        try:
+            if len(cell_texts) > 10:
+                valor_text = re.sub(r'[^\d.,]', '', cell_texts[10]).replace(
+                    '.', '').replace(',', '.')
+                if valor_text.strip() and float(valor_text) > 0:
+                    dados.append({
+                        'centro_custo': centro_custo_atual,
+                        'categoria': categoria_atual,
+                        'data_pagamento': cell_texts[2],
+                        'documento': cell_texts[3],
+                        'emitente': cell_texts[4],
+                        'historico': cell_texts[6],
+                        'valor': float(valor_text),
+                    })
+        except Exception:
+            continue
+
+    return dados
+
+
+def gerar_relatorio(caminho, lancamentos, semente=42):
+    """Grava um relatório Custo Analítico sintético com o número de lançamentos pedido"""
+    aleatorio = random.Random(semente)
+    with open(caminho, 'w', encoding='utf-8') as arquivo:
+        arquivo.write(CABECALHO.format(periodo='01/01/2024 a 31/12/2024'))
+        arquivo.write('<tr><td>Centro</td><td>Categoria</td><td>Pagamento</td><td>Documento</td>'
+                      '<td>Emitente</td><td>&nbsp;</td><td>Hist&oacute;rico</td><td></td><td></td>'
+                      '<td></td><td>Valor</td></tr>\n')
+        escritos = 0
+        centro = 0
+        while escritos < lancamentos:
+            centro += 1
+            arquivo.write(f'<tr><td colspan="11"><b>C.Custo:&nbsp;{1000 + centro:04d}-'
+                          f'{centro % 100:02d} Centro {centro}</b></td></tr>\n')
+            for categoria in range(aleatorio.randint(1, 6)):
+                arquivo.write(f'<tr><td></td><td>{categoria + 1:03d} - Categoria '
+                              f'{categoria + 1}</td></tr>\n')
+                for _ in range(aleatorio.randint(1, 60)):
+                    escritos += 1
+                    valor = aleatorio.choice((0, aleatorio.randint(1, 9999999)))
+                    valor_texto = f'{valor // 100:,}'.replace(',', '.') + f',{valor % 100:02d}'
+                    arquivo.write(
+                        f'<tr><td></td><td>&nbsp;</td><td>{aleatorio.randint(1, 28):02d}/'
+                        f'{aleatorio.randint(1, 12):02d}/2024</td><td>{escritos}</td>'
+                        f'<td>Fornecedor {aleatorio.randint(1, 500)} &amp; Cia</td><td></td>'
+                        f'<td>Pagamento ref. NF {escritos}<br>parcela 1</td><td></td><td></td>'
+                        f'<td></td><td align="right">{valor_texto}</td></tr>\n')
+                    if escritos >= lancamentos:
+                        break
+                if escritos >= lancamentos:
+                    break
+        arquivo.write('</table>\n<table><tr><td>Total geral</td></tr></table></body></html>\n')
+
+
+def _sem_campos_novos(registros):
+    return [{chave: valor for chave, valor in registro.items() if chave not in CAMPOS_IGNORADOS}
+            for registro in registros]
+
+
+def extrair_registros(caminho, bloco=None):
+    """Registros do extrator atual, como entregues à importação"""
+    return list(iterar_registros_xls(caminho, bloco))
+
+
+def conferir(caminho, nome, blocos=(None,)):
+    """
+    Compara as duas versões em um arquivo
+
+    Args:
+        caminho: Arquivo a conferir
+        nome: Nome exibido no log
+        blocos: Tamanhos de bloco de leitura testados no extrator novo
+
+    Returns:
+        bool: True se os registros forem idênticos
+    """
+    esperado = [registro for registro in extrair_dados_xls_legado(caminho)
+                if registro['centro_custo'] is not None]
+    for bloco in blocos:
+        obtido = _sem_campos_novos(extrair_registros(caminho, bloco))
+        if obtido != esperado:
+            diferenca = next((i for i, (a, b) in enumerate(zip(obtido, esperado)) if a != b),
+                             min(len(obtido), len(esperado)))
+            logger.error(f"DIVERGENTE: {nome} (bloco {bloco or 'padrão'}): {len(obtido)} registro(s) "
+                         f"contra {len(esperado)}; primeira diferença no registro {diferenca}")
+            return False
+    logger.info(f"ok: {nome} ({len(esperado)} registro(s))")
+    return True
+
+
+def medir(funcao, caminho):
+    """Tempo e pico de memória (tracemalloc) de uma extração"""
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    registros = funcao(caminho)
+    duracao = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(registros), duracao, pico
+
+
+def main():
+    """Função principal do script"""
+    parser = argparse.ArgumentParser(
+        description="Confere o extrator do relatório Custo Analítico com o parser anterior")
+    parser.add_argument('arquivos', nargs='*', help="Relatórios reais (.xls em HTML) a conferir")
+    parser.add_argument('--lancamentos', type=int, default=5000,
+                        help="Lançamentos do relatório sintético (padrão: 5000, 0 = não gerar)")
+
+    args = parser.parse_args()
+
+    divergentes = 0
+    with tempfile.TemporaryDirectory() as diretorio:
+        for nome, html in CASOS.items():
+            caminho = os.path.join(diretorio, 'caso.xls')
+            with open(caminho, 'w', encoding='utf-8') as arquivo:
+                arquivo.write(html)
+            divergentes += not conferir(caminho, nome, BLOCOS_CONFERENCIA)
+
+        arquivos = list(args.arquivos)
+        if args.lancamentos:
+            sintetico = os.path.join(diretorio, 'sintetico.xls')
+            gerar_relatorio(sintetico, args.lancamentos)
+            arquivos.append(sintetico)
+
+        for caminho in arquivos:
+            tamanho = os.path.getsize(caminho) / 1024 / 1024
+            divergentes += not conferir(caminho, f"{os.path.basename(caminho)} ({tamanho:.1f} MB)")
+            for nome, funcao in (('BeautifulSoup', extrair_dados_xls_legado),
+                                 ('tokenizador', extrair_registros)):
+                registros, duracao, pico = medir(funcao, caminho)
+                logger.info(f"  {nome:<14} {registros} registros em {duracao:.2f}s, "
+                            f"pico de memória {pico / 1024 / 1024:.1f} MB")
+
+    if divergentes:
+        logger.error(f"{divergentes} caso(s) divergente(s)")
+        return 1
+    logger.info("Extratores equivalentes em todos os casos")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
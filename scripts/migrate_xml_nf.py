@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Migra o XML das notas fiscais de nf_notas.xml_data (LONGTEXT) para a tabela
+nf_xml, comprimido com zlib.
+
+Execute antes database/db-update-nf-xml-comprimido.sql. As notas são migradas
+em lotes (uma transação por lote) e o script pode ser interrompido e executado
+novamente: só são lidas as notas que ainda têm xml_data preenchido.
+"""
+
+import sys
+import logging
+import argparse
+from pathlib import Path
+
+# Adicionar o diretório raiz ao PATH para importar os módulos do sistema
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dotenv import load_dotenv  # noqa: E402
+
+load_dotenv(dotenv_path=Path(__file__).resolve().parent.parent / '.env')
+
+from utils.db import get_pooled_connection  # noqa: E402
+from modulos.importacao_nf.xml_utils import comprimir_xml  # noqa: E402
+from modulos.importacao_nf.persistencia import gravar_xml_lote  # noqa: E402
+
+# Configuração de logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+def migrar_lote(connection, ultimo_id, tamanho_lote, simular=False):
+    """
+    Migra um lote de notas com id maior que `ultimo_id`
+
+    Args:
+        connection: Conexão com o banco de dados
+        ultimo_id: Maior id já processado
+        tamanho_lote: Quantidade de notas por lote
+        simular: Apenas comprime e contabiliza, sem gravar
+
+    Returns:
+        tuple: (maior id do lote ou None se não houver mais notas,
+                notas migradas, bytes originais, bytes comprimidos)
+    """
+    cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute("""
+            SELECT id, xml_data FROM nf_notas
+            WHERE id > %s AND xml_data IS NOT NULL
+            ORDER BY id
+            LIMIT %s
+        """, (ultimo_id, tamanho_lote))
+        notas = cursor.fetchall()
+        if not notas:
+            return None, 0, 0, 0
+
+        linhas = []
+        bytes_originais = 0
+        for nota in notas:
+            xml_bytes = nota['xml_data'].encode('utf-8')
+            bytes_originais += len(xml_bytes)
+            linhas.append((nota['id'], comprimir_xml(xml_bytes)))
+        bytes_comprimidos = sum(len(xml) for _, xml in linhas)
+
+        if not simular:
+            gravar_xml_lote(cursor, linhas)
+            ids = [nota['id'] for nota in notas]
+            cursor.execute(f"""
+                UPDATE nf_notas SET xml_data = NULL
+                WHERE id IN ({', '.join(['%s'] * len(ids))})
+            """, ids)
+            connection.commit()
+
+        return notas[-1]['id'], len(notas), bytes_originais, bytes_comprimidos
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def main():
+    """Função principal do script"""
+    parser = argparse.ArgumentParser(
+        description="Migra o XML das notas fiscais para a tabela nf_xml (comprimido)")
+    parser.add_argument('--lote', type=int, default=500,
+                        help="Notas migradas por transação (padrão: 500)")
+    parser.add_argument('--simular', action='store_true',
+                        help="Apenas mede a compressão, sem gravar no banco")
+    parser.add_argument('--otimizar', action='store_true',
+                        help="Executa OPTIMIZE TABLE nf_notas ao final para liberar espaço")
+
+    args = parser.parse_args()
+
+    connection = get_pooled_connection()
+    if not connection:
+        logger.error("Não foi possível conectar ao banco de dados")
+        return 1
+
+    total = bytes_originais = bytes_comprimidos = 0
+    ultimo_id = 0
+    try:
+        while True:
+            ultimo_id, migradas, originais, comprimidos = migrar_lote(
+                connection, ultimo_id, args.lote, args.simular)
+            if ultimo_id is None:
+                break
+            total += migradas
+            bytes_originais += originais
+            bytes_comprimidos += comprimidos
+            logger.info(f"{total} nota(s) processada(s) (até id {ultimo_id})")
+
+        if args.otimizar and not args.simular:
+            logger.info("Executando OPTIMIZE TABLE nf_notas...")
+            cursor = connection.cursor()
+            cursor.execute("OPTIMIZE TABLE nf_notas")
+            cursor.fetchall()
+            cursor.close()
+    except Exception as e:
+        logger.error(f"Erro na migração dos XMLs: {e}", exc_info=True)
+        return 1
+    finally:
+        connection.close()
+
+    taxa = (bytes_comprimidos / bytes_originais * 100) if bytes_originais else 0
+    logger.info(
+        f"{'Simulação concluída' if args.simular else 'Migração concluída'}: "
+        f"{total} nota(s), {bytes_originais / 1024 / 1024:.1f} MB -> "
+        f"{bytes_comprimidos / 1024 / 1024:.1f} MB ({taxa:.0f}%)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Particiona erp_transacoes por mês de pagamento (RANGE COLUMNS em dt_pagamento).
+
+Com a tabela particionada, os filtros por período (listagem de transações,
+relatórios, substituição do período na importação) só abrem as partições dos
+meses consultados. O particionamento é opcional: sem ele as mesmas consultas
+usam o índice idx_dt_pagamento.
+
+Na primeira execução a tabela é preparada e particionada:
+  - dt_pagamento é confirmada como NOT NULL (database/db-update-erp-transacoes-dt-pagamento.sql
+    já move os lançamentos sem data para erp_transacoes_sem_data);
+  - a chave primária e a chave única da chave natural passam a incluir
+    dt_pagamento (o MySQL exige a coluna de partição em toda chave única);
+  - uma partição por mês, do primeiro pagamento até --meses-futuros adiante,
+    mais p_anterior (datas menores) e p_futuro (MAXVALUE).
+
+Nas execuções seguintes (por exemplo, mensalmente no cron) p_futuro é
+reorganizada para criar as partições dos próximos meses.
+
+Sem --aplicar os comandos são apenas exibidos. O ALTER TABLE copia a tabela
+inteira na primeira execução; rode fora do horário de importação.
+
+Exemplos:
+    python scripts/particionar_erp_transacoes.py                # exibe os comandos
+    python scripts/particionar_erp_transacoes.py --aplicar
+    python scripts/particionar_erp_transacoes.py --aplicar --meses-futuros 6
+"""
+
+import sys
+import logging
+import argparse
+from datetime import date
+from pathlib import Path
+
+# Adicionar o diretório raiz ao PATH para importar os módulos do sistema
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dotenv import load_dotenv  # noqa: E402
+
+load_dotenv(dotenv_path=Path(__file__).resolve().parent.parent / '.env')
+
+from utils.db import get_pooled_connection  # noqa: E402
+
+# Configuração de logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+PARTICAO_ANTERIOR = 'p_anterior'
+PARTICAO_FUTURO = 'p_futuro'
+
+SQL_PREPARAR_TABELA = """
+    ALTER TABLE erp_transacoes
+        MODIFY dt_pagamento DATE NOT NULL,
+        DROP PRIMARY KEY,
+        ADD PRIMARY KEY (id, dt_pagamento),
+        DROP INDEX uk_erp_transacoes_chave,
+        ADD UNIQUE KEY uk_erp_transacoes_chave (chave_natural, dt_pagamento)"""
+
+
+def proximo_mes(data):
+    """Primeiro dia do mês seguinte ao de `data`"""
+    if data.month == 12:
+        return date(data.year + 1, 1, 1)
+    return date(data.year, data.month + 1, 1)
+
+
+def particoes_mensais(inicio, fim):
+    """
+    Definições das partições mensais de `inicio` até `fim` (exclusivo)
+
+    Args:
+        inicio: Primeiro dia do primeiro mês
+        fim: Primeiro dia do mês seguinte ao último
+
+    Returns:
+        list: Trechos "PARTITION pAAAAMM VALUES LESS THAN (...)"
+    """
+    particoes = []
+    mes = inicio
+    while mes < fim:
+        seguinte = proximo_mes(mes)
+        particoes.append(f"PARTITION p{mes:%Y%m} VALUES LESS THAN ('{seguinte:%Y-%m-%d}')")
+        mes = seguinte
+    return particoes
+
+
+def ler_particoes(cursor):
+    """
+    Partições atuais de erp_transacoes
+
+    Returns:
+        tuple: (método de particionamento ou None, limites das partições mensais)
+    """
+    cursor.execute("""
+        SELECT PARTITION_NAME, PARTITION_METHOD, PARTITION_DESCRIPTION
+        FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'erp_transacoes'
+          AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """)
+    linhas = cursor.fetchall()
+    if not linhas:
+        return None, []
+
+    limites = [date.fromisoformat(descricao.strip("'"))
+               for nome, metodo, descricao in linhas
+               if nome not in (PARTICAO_ANTERIOR, PARTICAO_FUTURO)]
+    return linhas[0][1], limites
+
+
+def montar_comandos(cursor, meses_futuros, hoje=None):
+    """
+    Comandos para particionar a tabela ou criar as partições que faltam
+
+    Args:
+        cursor: Cursor do banco de dados
+        meses_futuros: Meses após o atual que devem ter partição
+        hoje: Data de referência (padrão: hoje)
+
+    Returns:
+        list: Comandos SQL (vazia se nada precisa ser feito)
+
+    Raises:
+        ValueError: Se a tabela não puder ser particionada
+    """
+    hoje = hoje or date.today()
+    fim = date(hoje.year, hoje.month, 1)
+    for _ in range(meses_futuros + 1):
+        fim = proximo_mes(fim)
+
+    metodo, limites = ler_particoes(cursor)
+    if metodo is None:
+        cursor.execute("SELECT COUNT(*) FROM erp_transacoes WHERE dt_pagamento IS NULL")
+        sem_data = cursor.fetchone()[0]
+        if sem_data:
+            raise ValueError(f"{sem_data} lançamento(s) sem dt_pagamento; corrija-os antes de particionar")
+
+        cursor.execute("SELECT MIN(dt_pagamento) FROM erp_transacoes")
+        primeira = cursor.fetchone()[0] or hoje
+        inicio = date(primeira.year, primeira.month, 1)
+        particoes = ([f"PARTITION {PARTICAO_ANTERIOR} VALUES LESS THAN ('{inicio:%Y-%m-%d}')"]
+                     + particoes_mensais(inicio, max(fim, proximo_mes(inicio)))
+                     + [f"PARTITION {PARTICAO_FUTURO} VALUES LESS THAN (MAXVALUE)"])
+        return [
+            SQL_PREPARAR_TABELA,
+            "ALTER TABLE erp_transacoes PARTITION BY RANGE COLUMNS (dt_pagamento) (\n        "
+            + ",\n        ".join(particoes) + ")",
+        ]
+
+    if metodo != 'RANGE COLUMNS' or not limites:
+        raise ValueError(f"erp_transacoes já está particionada por {metodo}, fora do padrão deste script")
+
+    novas = particoes_mensais(max(limites), fim)
+    if not novas:
+        return []
+    novas.append(f"PARTITION {PARTICAO_FUTURO} VALUES LESS THAN (MAXVALUE)")
+    return [f"ALTER TABLE erp_transacoes REORGANIZE PARTITION {PARTICAO_FUTURO} INTO (\n        "
+            + ",\n        ".join(novas) + ")"]
+
+
+def main():
+    """Função principal do script"""
+    parser = argparse.ArgumentParser(
+        description="Particiona erp_transacoes por mês de pagamento")
+    parser.add_argument('--meses-futuros', type=int, default=3,
+                        help="Meses após o atual que devem ter partição (padrão: 3)")
+    parser.add_argument('--aplicar', action='store_true',
+                        help="Executa os comandos (sem esta opção eles são apenas exibidos)")
+
+    args = parser.parse_args()
+    if args.meses_futuros < 0:
+        parser.error("--meses-futuros não pode ser negativo")
+
+    connection = get_pooled_connection()
+    if not connection:
+        logger.error("Não foi possível conectar ao banco de dados")
+        return 1
+
+    cursor = connection.cursor()
+    try:
+        comandos = montar_comandos(cursor, args.meses_futuros)
+        if not comandos:
+            logger.info("Partições já criadas até o período pedido")
+            return 0
+
+        for comando in comandos:
+            print(comando.strip() + ";\n")
+            if args.aplicar:
+                cursor.execute(comando)
+
+        if args.aplicar:
+            logger.info(f"{len(comandos)} comando(s) executado(s)")
+        else:
+            logger.info("Nada foi alterado; use --aplicar para executar os comandos")
+        return 0
+    except ValueError as e:
+        logger.error(str(e))
+        return 2
+    except Exception as e:
+        logger.error(f"Erro ao particionar erp_transacoes: {e}", exc_info=True)
+        return 1
+    finally:
+        cursor.close()
+        connection.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Confere (e corrige) os totais de itens gravados em nf_notas.
+
+Recalcula total_itens e soma_itens a partir de nf_itens e atualiza as notas
+divergentes. Serve também para preencher as notas importadas antes de
+database/db-update-nf-total-itens.sql e db-update-nf-soma-itens.sql.
+
+As notas são percorridas em lotes por id (uma transação por lote), então o
+script pode ser interrompido e executado novamente.
+
+Exemplos:
+    python scripts/reconciliar_totais_nf.py --verificar   # apenas lista divergências
+    python scripts/reconciliar_totais_nf.py --lote 2000
+"""
+
+import sys
+import logging
+import argparse
+from pathlib import Path
+
+# Adicionar o diretório raiz ao PATH para importar os módulos do sistema
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dotenv import load_dotenv  # noqa: E402
+
+load_dotenv(dotenv_path=Path(__file__).resolve().parent.parent / '.env')
+
+from utils.db import get_pooled_connection  # noqa: E402
+
+# Configuração de logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+def reconciliar_lote(connection, ultimo_id, tamanho_lote, verificar=False):
+    """
+    Confere as notas com id maior que `ultimo_id`
+
+    Args:
+        connection: Conexão com o banco de dados
+        ultimo_id: Maior id já conferido
+        tamanho_lote: Quantidade de notas por lote
+        verificar: Apenas lista as divergências, sem corrigir
+
+    Returns:
+        tuple: (maior id do lote ou None se não houver mais notas,
+                notas conferidas, notas divergentes)
+    """
+    cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute("""
+            SELECT id FROM nf_notas WHERE id > %s ORDER BY id LIMIT %s
+        """, (ultimo_id, tamanho_lote))
+        ids = [linha['id'] for linha in cursor.fetchall()]
+        if not ids:
+            return None, 0, 0
+
+        cursor.execute("""
+            SELECT n.id, n.total_itens, n.soma_itens,
+                   COUNT(i.id) AS total_real,
+                   COALESCE(SUM(i.valor_total), 0) AS soma_real
+            FROM nf_notas n
+            LEFT JOIN nf_itens i ON i.nf_id = n.id
+            WHERE n.id BETWEEN %s AND %s
+            GROUP BY n.id, n.total_itens, n.soma_itens
+        """, (ids[0], ids[-1]))
+
+        divergentes = [
+            linha for linha in cursor.fetchall()
+            if linha['total_itens'] != linha['total_real']
+            or linha['soma_itens'] != linha['soma_real']]
+
+        for linha in divergentes:
+            logger.debug(
+                f"NF {linha['id']}: total_itens {linha['total_itens']} -> {linha['total_real']}, "
+                f"soma_itens {linha['soma_itens']} -> {linha['soma_real']}")
+
+        if divergentes and not verificar:
+            cursor.executemany("""
+                UPDATE nf_notas SET total_itens = %s, soma_itens = %s WHERE id = %s
+            """, [(linha['total_real'], linha['soma_real'], linha['id'])
+                  for linha in divergentes])
+            connection.commit()
+
+        return ids[-1], len(ids), len(divergentes)
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def main():
+    """Função principal do script"""
+    parser = argparse.ArgumentParser(
+        description="Confere e corrige total_itens/soma_itens das notas fiscais")
+    parser.add_argument('--lote', type=int, default=1000,
+                        help="Notas conferidas por transação (padrão: 1000)")
+    parser.add_argument('--verificar', action='store_true',
+                        help="Apenas lista as divergências, sem gravar (código de saída 2 se houver)")
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help="Mostra cada nota divergente")
+
+    args = parser.parse_args()
+    if args.verbose:
+        logger.setLevel(logging.DEBUG)
+
+    connection = get_pooled_connection()
+    if not connection:
+        logger.error("Não foi possível conectar ao banco de dados")
+        return 1
+
+    total = divergentes = 0
+    ultimo_id = 0
+    try:
+        while True:
+            ultimo_id, conferidas, divergentes_lote = reconciliar_lote(
+                connection, ultimo_id, args.lote, args.verificar)
+            if ultimo_id is None:
+                break
+            total += conferidas
+            divergentes += divergentes_lote
+            logger.info(f"{total} nota(s) conferida(s) (até id {ultimo_id}), "
+                        f"{divergentes} divergente(s)")
+    except Exception as e:
+        logger.error(f"Erro ao reconciliar os totais: {e}", exc_info=True)
+        return 1
+    finally:
+        connection.close()
+
+    if args.verificar:
+        logger.info(f"Verificação concluída: {divergentes} de {total} nota(s) divergente(s)")
+        return 2 if divergentes else 0
+
+    logger.info(f"Reconciliação concluída: {divergentes} de {total} nota(s) corrigida(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
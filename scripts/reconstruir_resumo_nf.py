@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Reconstrói o resumo diário das notas fiscais (nf_resumo_diario) a partir de
+nf_notas.
+
+Use após criar a tabela (database/db-update-nf-resumo-diario.sql) para
+preencher o histórico ou para corrigir o resumo depois de alterações feitas
+fora da importação. Cada dia de importação é recalculado em uma transação
+própria; por padrão todos os dias com notas são reconstruídos.
+
+Exemplos:
+    python scripts/reconstruir_resumo_nf.py
+    python scripts/reconstruir_resumo_nf.py --desde 2024-01-01 --ate 2024-01-31
+"""
+
+import sys
+import logging
+import argparse
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Adicionar o diretório raiz ao PATH para importar os módulos do sistema
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dotenv import load_dotenv  # noqa: E402
+
+load_dotenv(dotenv_path=Path(__file__).resolve().parent.parent / '.env')
+
+from utils.db import get_pooled_connection  # noqa: E402
+from modulos.importacao_nf.resumo import reconstruir_resumo_dia  # noqa: E402
+
+# Configuração de logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+def data_argumento(valor):
+    """Converte um argumento AAAA-MM-DD em date"""
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Data inválida: {valor} (use AAAA-MM-DD)")
+
+
+def periodo_notas(connection):
+    """
+    Primeiro e último dia de importação com notas (além dos dias já presentes
+    no resumo, para limpar dias cujas notas foram removidas)
+
+    Returns:
+        tuple: (primeiro dia, último dia) ou (None, None)
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("""
+            SELECT MIN(dia), MAX(dia) FROM (
+                SELECT MIN(DATE(data_importacao)) AS dia FROM nf_notas
+                UNION ALL SELECT MAX(DATE(data_importacao)) FROM nf_notas
+                UNION ALL SELECT MIN(dia_importacao) FROM nf_resumo_diario
+                UNION ALL SELECT MAX(dia_importacao) FROM nf_resumo_diario
+            ) dias
+        """)
+        return cursor.fetchone()
+    finally:
+        cursor.close()
+
+
+def main():
+    """Função principal do script"""
+    parser = argparse.ArgumentParser(
+        description="Reconstrói o resumo diário das notas fiscais (nf_resumo_diario)")
+    parser.add_argument('--desde', type=data_argumento,
+                        help="Primeiro dia de importação (AAAA-MM-DD, padrão: o mais antigo)")
+    parser.add_argument('--ate', type=data_argumento,
+                        help="Último dia de importação (AAAA-MM-DD, padrão: o mais recente)")
+
+    args = parser.parse_args()
+
+    connection = get_pooled_connection()
+    if not connection:
+        logger.error("Não foi possível conectar ao banco de dados")
+        return 1
+
+    try:
+        primeiro, ultimo = periodo_notas(connection)
+        desde = args.desde or primeiro
+        ate = args.ate or ultimo
+        if not desde or not ate:
+            logger.info("Nenhuma nota importada: nada a reconstruir")
+            return 0
+
+        dias = linhas = 0
+        dia = desde
+        cursor = connection.cursor()
+        try:
+            while dia <= ate:
+                linhas += reconstruir_resumo_dia(cursor, dia)
+                connection.commit()
+                dias += 1
+                if dias % 30 == 0:
+                    logger.info(f"{dias} dia(s) reconstruído(s) (até {dia})")
+                dia += timedelta(days=1)
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            cursor.close()
+    except Exception as e:
+        logger.error(f"Erro ao reconstruir o resumo diário: {e}", exc_info=True)
+        return 1
+    finally:
+        connection.close()
+
+    logger.info(f"Resumo reconstruído: {dias} dia(s) de {desde} a {ate}, {linhas} linha(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
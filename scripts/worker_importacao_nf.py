@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Worker da fila de importação de XML/ZIP de notas fiscais.
+
+Inicia um ou mais processos que reservam os jobs pendentes da tabela
+nf_importacao_jobs (criados pela rota /importar_xml) e processam os arquivos,
+atualizando o progresso consultado em /importar_xml/status/<job_id>.
+"""
+
+import os
+import sys
+import signal
+import logging
+import argparse
+import multiprocessing
+from pathlib import Path
+
+# Adicionar o diretório raiz ao PATH para importar os módulos do sistema
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dotenv import load_dotenv  # noqa: E402
+
+load_dotenv(dotenv_path=Path(__file__).resolve().parent.parent / '.env')
+
+from modulos.importacao_nf.jobs import loop_worker, liberar_jobs_travados  # noqa: E402
+
+# Configuração de logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(processName)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+def executar_worker(intervalo, parar):
+    """Ponto de entrada de cada processo worker"""
+    # O processo pai é quem trata os sinais de encerramento
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    # Só os workers da fila usam o pool de processos no parse dos ZIPs
+    from modulos.importacao_nf.app import habilitar_parse_em_processos
+    habilitar_parse_em_processos()
+    loop_worker(intervalo=intervalo, parar=parar)
+
+
+def main():
+    """Função principal do script"""
+    parser = argparse.ArgumentParser(
+        description="Processa a fila de importação de XML/ZIP de notas fiscais")
+    parser.add_argument('--processos', type=int,
+                        default=int(os.environ.get('NF_IMPORTACAO_WORKERS', 2)),
+                        help="Número de processos worker (padrão: 2)")
+    parser.add_argument('--intervalo', type=float, default=2.0,
+                        help="Segundos entre consultas à fila vazia (padrão: 2)")
+    parser.add_argument('--liberar-travados', type=int, default=30, metavar='MINUTOS',
+                        help="Devolve à fila jobs sem progresso há MINUTOS (padrão: 30)")
+
+    args = parser.parse_args()
+
+    liberar_jobs_travados(args.liberar_travados)
+
+    parar = multiprocessing.Event()
+
+    def encerrar(signum, frame):
+        logger.info("Encerrando workers após os jobs em andamento...")
+        parar.set()
+
+    signal.signal(signal.SIGINT, encerrar)
+    signal.signal(signal.SIGTERM, encerrar)
+
+    # Processos não-daemon: cada worker pode criar seu próprio pool de processos
+    processos = [
+        multiprocessing.Process(target=executar_worker, args=(args.intervalo, parar),
+                                name=f"worker-importacao-{i + 1}")
+        for i in range(max(1, args.processos))
+    ]
+    for processo in processos:
+        processo.start()
+
+    logger.info(f"{len(processos)} worker(s) de importação iniciado(s)")
+
+    for processo in processos:
+        processo.join()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
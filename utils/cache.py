@@ -0,0 +1,280 @@
+from flask import current_app, has_app_context
+import os
+import json
+import time
+import sqlite3
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger('cache')
+
+# Valores padrão do cache (podem ser sobrescritos pelo app.config ou pelo ambiente).
+# CACHE_BACKEND vazio: 'sqlite' com a fila de importação ativa, senão 'memoria'
+CACHE_DEFAULTS = {
+    'CACHE_BACKEND': '',
+    'CACHE_TTL': 300,
+    'CACHE_MAX_ITENS': 256,
+    'CACHE_SQLITE_PATH': os.path.join(tempfile.gettempdir(), 'sistema_cache.sqlite3'),
+}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class CacheMemoria:
+    """
+    Cache LRU com expiração (TTL) mantido na memória do processo.
+
+    Guarda até `max_itens` valores; ao atingir o limite, o menos usado
+    recentemente é descartado. A invalidação vale apenas para o processo.
+    """
+
+    backend = 'memoria'
+
+    def __init__(self, max_itens=256):
+        self.max_itens = max_itens
+        self.pid = os.getpid()
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidacoes = 0
+
+    def get(self, namespace, chave):
+        """
+        Busca um valor no cache.
+
+        Returns:
+            tuple: (encontrado, valor)
+        """
+        with self._lock:
+            item = self._itens.get((namespace, chave))
+            if item is None or item[1] < time.monotonic():
+                if item is not None:
+                    del self._itens[(namespace, chave)]
+                self.misses += 1
+                return False, None
+            self._itens.move_to_end((namespace, chave))
+            self.hits += 1
+            return True, item[0]
+
+    def set(self, namespace, chave, valor, ttl):
+        """Grava um valor que expira em `ttl` segundos."""
+        with self._lock:
+            self._itens[(namespace, chave)] = (valor, time.monotonic() + ttl)
+            self._itens.move_to_end((namespace, chave))
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+
+    def invalidar(self, namespace):
+        """Descarta todos os valores de um namespace."""
+        with self._lock:
+            for item in [item for item in self._itens if item[0] == namespace]:
+                del self._itens[item]
+            self.invalidacoes += 1
+
+    def stats(self):
+        """
+        Retorna estatísticas de uso do cache.
+
+        Returns:
+            dict: Backend, itens guardados, acertos, falhas e invalidações
+            desde o início do processo.
+        """
+        with self._lock:
+            return {
+                'backend': self.backend,
+                'itens': len(self._itens),
+                'max_itens': self.max_itens,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidacoes': self.invalidacoes,
+            }
+
+
+class CacheSQLite(CacheMemoria):
+    """
+    Cache com expiração (TTL) em um arquivo SQLite compartilhado pelos
+    processos do servidor na mesma máquina.
+
+    Uma invalidação feita por qualquer processo (por exemplo, o worker da fila
+    de importação) vale para todos. Os valores são guardados em JSON.
+    """
+
+    backend = 'sqlite'
+
+    def __init__(self, caminho, max_itens=256):
+        super().__init__(max_itens)
+        self.caminho = caminho
+        with self._conectar() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    namespace TEXT NOT NULL,
+                    chave TEXT NOT NULL,
+                    valor TEXT NOT NULL,
+                    expira REAL NOT NULL,
+                    PRIMARY KEY (namespace, chave)
+                )
+            """)
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_cache_expira ON cache(expira)")
+
+    @contextmanager
+    def _conectar(self):
+        # Uma conexão por operação: o objeto é usado por várias threads
+        connection = sqlite3.connect(self.caminho, timeout=5)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def _contar(self, atributo):
+        with self._lock:
+            setattr(self, atributo, getattr(self, atributo) + 1)
+
+    def get(self, namespace, chave):
+        with self._conectar() as connection:
+            linha = connection.execute(
+                "SELECT valor FROM cache WHERE namespace = ? AND chave = ? AND expira >= ?",
+                (namespace, chave, time.time())).fetchone()
+        if linha is None:
+            self._contar('misses')
+            return False, None
+        self._contar('hits')
+        return True, json.loads(linha[0])
+
+    def set(self, namespace, chave, valor, ttl):
+        agora = time.time()
+        with self._conectar() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO cache (namespace, chave, valor, expira) VALUES (?, ?, ?, ?)",
+                (namespace, chave, json.dumps(valor, default=str), agora + ttl))
+            # Remove os expirados e, acima do limite, os que expiram primeiro
+            connection.execute("DELETE FROM cache WHERE expira < ?", (agora,))
+            connection.execute("""
+                DELETE FROM cache WHERE rowid IN (
+                    SELECT rowid FROM cache ORDER BY expira DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_itens,))
+
+    def invalidar(self, namespace):
+        with self._conectar() as connection:
+            connection.execute("DELETE FROM cache WHERE namespace = ?", (namespace,))
+        self._contar('invalidacoes')
+
+    def stats(self):
+        estatisticas = super().stats()
+        with self._conectar() as connection:
+            estatisticas['itens'] = connection.execute(
+                "SELECT COUNT(*) FROM cache WHERE expira >= ?", (time.time(),)).fetchone()[0]
+        estatisticas['caminho'] = self.caminho
+        return estatisticas
+
+
+def _get_setting(name):
+    """Lê uma configuração do app Flask, do ambiente ou do padrão do cache."""
+    default = CACHE_DEFAULTS.get(name)
+    value = None
+    if has_app_context():
+        value = current_app.config.get(name)
+    if value is None:
+        value = os.environ.get(name)
+    if value is None:
+        return default
+    return type(default)(value)
+
+
+def _backend_padrao():
+    """
+    Backend usado sem CACHE_BACKEND configurado: com a fila de importação
+    (NF_IMPORTACAO_ASSINCRONA, ativa por padrão) as notas são gravadas pelos
+    workers, e a invalidação feita por eles só chega ao processo web por um
+    cache compartilhado
+    """
+    assincrona = None
+    if has_app_context():
+        assincrona = current_app.config.get('NF_IMPORTACAO_ASSINCRONA')
+    if assincrona is None:
+        assincrona = os.environ.get('NF_IMPORTACAO_ASSINCRONA', '1') == '1'
+    return 'sqlite' if assincrona else 'memoria'
+
+
+def get_cache():
+    """
+    Retorna o cache do processo, criando-o na primeira chamada
+    (CACHE_BACKEND = 'memoria' ou 'sqlite'; sem configuração, ver _backend_padrao).
+
+    Returns:
+        CacheMemoria: Cache configurado.
+    """
+    global _cache
+    cache = _cache
+    if cache is not None and cache.pid == os.getpid():
+        return cache
+
+    with _cache_lock:
+        if _cache is None or _cache.pid != os.getpid():
+            max_itens = _get_setting('CACHE_MAX_ITENS')
+            backend = _get_setting('CACHE_BACKEND') or _backend_padrao()
+            if backend == 'sqlite':
+                try:
+                    _cache = CacheSQLite(_get_setting('CACHE_SQLITE_PATH'), max_itens)
+                except sqlite3.Error as e:
+                    logger.error(f"Erro ao abrir o cache SQLite, usando memória: {e}")
+                    _cache = CacheMemoria(max_itens)
+            else:
+                _cache = CacheMemoria(max_itens)
+        return _cache
+
+
+def em_cache(namespace, params, calcular, ttl=None):
+    """
+    Retorna o valor guardado para (namespace, params) ou o calcula e guarda.
+
+    Args:
+        namespace: Grupo de valores invalidados juntos (ex.: relatórios da importação NF)
+        params: Parâmetros que identificam o valor (serializáveis em JSON)
+        calcular: Função sem argumentos chamada em caso de falha no cache
+        ttl: Segundos até expirar (padrão: CACHE_TTL)
+
+    Returns:
+        Valor guardado ou calculado.
+    """
+    cache = get_cache()
+    chave = json.dumps(params, sort_keys=True, default=str)
+    try:
+        encontrado, valor = cache.get(namespace, chave)
+        if encontrado:
+            return valor
+    except sqlite3.Error as e:
+        logger.warning(f"Erro ao ler o cache: {e}")
+
+    valor = calcular()
+    try:
+        cache.set(namespace, chave, valor, ttl or _get_setting('CACHE_TTL'))
+    except sqlite3.Error as e:
+        logger.warning(f"Erro ao gravar no cache: {e}")
+    return valor
+
+
+def invalidar_cache(namespace):
+    """Descarta os valores guardados de um namespace."""
+    try:
+        get_cache().invalidar(namespace)
+    except sqlite3.Error as e:
+        logger.warning(f"Erro ao invalidar o cache: {e}")
+
+
+def get_cache_stats():
+    """
+    Retorna as estatísticas do cache.
+
+    Returns:
+        dict: Backend, itens, acertos (hits), falhas (misses) e invalidações.
+    """
+    return get_cache().stats()
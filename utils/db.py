@@ -1,53 +1,345 @@
-from flask import current_app
+from flask import current_app, has_app_context
 import mysql.connector
 from mysql.connector import Error
+from mysql.connector.errors import PoolError
 import os
+import time
 import logging
+import threading
+from collections import deque
 from contextlib import contextmanager
 from flask import g
 
 logger = logging.getLogger('db')
 
+# Valores padrão do pool (podem ser sobrescritos pelo app.config ou pelo ambiente)
+POOL_DEFAULTS = {
+    'DB_POOL_SIZE': 5,
+    'DB_POOL_MAX_OVERFLOW': 10,
+    'DB_POOL_IDLE_TIMEOUT': 300,
+    'DB_POOL_TIMEOUT': 30,
+    'DB_POOL_PING': True,
+}
 
-def get_db_connection():
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class ConnectionPool:
     """
-    Cria e retorna uma conexão com o banco de dados MySQL.
+    Pool de conexões MySQL compartilhado por todo o processo.
 
-    Returns:
-        Connection: Objeto de conexão MySQL ou None se houver erro.
+    Mantém até `size` conexões ociosas e permite abrir mais `max_overflow`
+    conexões temporárias em picos de uso. Conexões ociosas há mais de
+    `idle_timeout` segundos são descartadas e, se `ping` estiver ativo,
+    cada conexão é verificada antes de ser entregue.
     """
-    # Verifica se já existe uma conexão no contexto da aplicação
-    if 'db' in g:
-        return g.db
 
-    try:
-        # Usar configuração do Flask se disponível
-        if current_app.config.get('MYSQL_HOST'):
-            connection = mysql.connector.connect(
-                host=current_app.config.get('MYSQL_HOST'),
-                database=current_app.config.get('MYSQL_DB'),
-                user=current_app.config.get('MYSQL_USER'),
-                password=current_app.config.get('MYSQL_PASSWORD')
-            )
-        else:
-            # Fallback para variáveis de ambiente
-            connection = mysql.connector.connect(
-                host=os.environ.get('DB_HOST', 'localhost'),
-                database=os.environ.get('DB_NAME', 'sistema_solicitacoes'),
-                user=os.environ.get('DB_USER', 'root'),
-                password=os.environ.get('DB_PASSWORD', 'sua_senha')
-            )
+    def __init__(self, connect_kwargs, size=5, max_overflow=10,
+                 idle_timeout=300, timeout=30, ping=True):
+        self.connect_kwargs = connect_kwargs
+        self.size = size
+        self.max_overflow = max_overflow
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.ping = ping
+        self.pid = os.getpid()
+
+        self._idle = deque()
+        self._cond = threading.Condition()
+        self._total = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._created = 0
+        self._recycled = 0
+
+    def _connect(self):
+        connection = mysql.connector.connect(**self.connect_kwargs)
+        with self._cond:
+            self._created += 1
+        return connection
 
-        # Armazenar a conexão no contexto da aplicação
-        if 'g' in globals() or 'g' in locals():
-            g.db = connection
+    def _discard(self, connection):
+        """Fecha uma conexão que não volta mais para o pool."""
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, connection):
+        try:
+            connection.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def acquire(self):
+        """
+        Retira uma conexão do pool, criando uma nova se houver capacidade.
+
+        Returns:
+            Connection: Conexão MySQL pronta para uso.
+
+        Raises:
+            PoolError: Se nenhuma conexão ficar disponível dentro do timeout.
+        """
+        deadline = time.monotonic() + self.timeout
+        connection = None
+
+        with self._cond:
+            while True:
+                # Reaproveitar conexões ociosas, descartando as expiradas
+                while self._idle:
+                    candidate, last_used = self._idle.pop()
+                    if time.monotonic() - last_used > self.idle_timeout:
+                        self._total -= 1
+                        self._recycled += 1
+                        self._discard(candidate)
+                        continue
+                    connection = candidate
+                    break
+
+                if connection is not None:
+                    break
+
+                if self._total < self.size + self.max_overflow:
+                    # Reservar a vaga antes de conectar fora do lock
+                    self._total += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolError(
+                        "Tempo esgotado aguardando conexão do pool")
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+            self._in_use += 1
+
+        try:
+            if connection is not None and self.ping and not self._is_healthy(connection):
+                with self._cond:
+                    self._recycled += 1
+                self._discard(connection)
+                connection = None
+
+            if connection is None:
+                connection = self._connect()
+        except Exception:
+            with self._cond:
+                self._total -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
 
         return connection
+
+    def release(self, connection):
+        """
+        Devolve uma conexão ao pool. Transações pendentes são desfeitas e
+        conexões excedentes ao tamanho do pool são fechadas.
+        """
+        healthy = True
+        try:
+            connection.rollback()
+        except Exception:
+            healthy = False
+
+        with self._cond:
+            self._in_use -= 1
+            if healthy and len(self._idle) < self.size:
+                self._idle.append((connection, time.monotonic()))
+                connection = None
+            else:
+                self._total -= 1
+                if not healthy:
+                    self._recycled += 1
+            self._cond.notify()
+
+        if connection is not None:
+            self._discard(connection)
+
+    def stats(self):
+        """
+        Retorna estatísticas de uso do pool.
+
+        Returns:
+            dict: Conexões em uso, ociosas, requisições aguardando,
+            conexões criadas e recicladas desde o início do processo.
+        """
+        with self._cond:
+            return {
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                'created': self._created,
+                'recycled': self._recycled,
+            }
+
+    def close_all(self):
+        """Fecha todas as conexões ociosas do pool."""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._total -= len(idle)
+        for connection, _ in idle:
+            self._discard(connection)
+
+
+class PooledConnection:
+    """
+    Conexão emprestada do pool. Repassa todos os atributos para a conexão
+    MySQL real; `close()` devolve a conexão ao pool em vez de fechá-la.
+    """
+
+    def __init__(self, pool, connection):
+        self._pool = pool
+        self._connection = connection
+
+    @property
+    def released(self):
+        return self._connection is None
+
+    def __getattr__(self, name):
+        connection = self.__dict__.get('_connection')
+        if connection is None:
+            raise Error(msg="Conexão já devolvida ao pool")
+        return getattr(connection, name)
+
+    def is_connected(self):
+        if self._connection is None:
+            return False
+        return self._connection.is_connected()
+
+    def close(self):
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            self._pool.release(connection)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _get_setting(name):
+    """Lê uma configuração do app Flask, do ambiente ou do padrão do pool."""
+    default = POOL_DEFAULTS.get(name)
+    value = None
+    if has_app_context():
+        value = current_app.config.get(name)
+    if value is None:
+        value = os.environ.get(name)
+    if value is None:
+        return default
+    if isinstance(default, bool):
+        return str(value).lower() in ('1', 'true', 'sim', 'yes', 'on')
+    return type(default)(value)
+
+
+def _get_connect_kwargs():
+    # Usar configuração do Flask se disponível
+    if has_app_context() and current_app.config.get('MYSQL_HOST'):
+        return {
+            'host': current_app.config.get('MYSQL_HOST'),
+            'database': current_app.config.get('MYSQL_DB'),
+            'user': current_app.config.get('MYSQL_USER'),
+            'password': current_app.config.get('MYSQL_PASSWORD')
+        }
+    # Fallback para variáveis de ambiente
+    return {
+        'host': os.environ.get('DB_HOST', 'localhost'),
+        'database': os.environ.get('DB_NAME', 'sistema_solicitacoes'),
+        'user': os.environ.get('DB_USER', 'root'),
+        'password': os.environ.get('DB_PASSWORD', 'sua_senha')
+    }
+
+
+def get_pool():
+    """
+    Retorna o pool de conexões do processo, criando-o na primeira chamada.
+    Após um fork o pool é recriado, pois conexões não podem ser compartilhadas
+    entre processos.
+
+    Returns:
+        ConnectionPool: Pool de conexões configurado.
+    """
+    global _pool
+    pool = _pool
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = ConnectionPool(
+                _get_connect_kwargs(),
+                size=_get_setting('DB_POOL_SIZE'),
+                max_overflow=_get_setting('DB_POOL_MAX_OVERFLOW'),
+                idle_timeout=_get_setting('DB_POOL_IDLE_TIMEOUT'),
+                timeout=_get_setting('DB_POOL_TIMEOUT'),
+                ping=_get_setting('DB_POOL_PING')
+            )
+        return _pool
+
+
+def get_pool_stats():
+    """
+    Retorna as estatísticas do pool de conexões.
+
+    Returns:
+        dict: Estatísticas do pool (em uso, aguardando, criadas, recicladas).
+    """
+    return get_pool().stats()
+
+
+def get_pooled_connection():
+    """
+    Retira uma conexão do pool sem associá-la ao contexto da requisição.
+    O chamador é responsável por chamar `close()` para devolvê-la.
+
+    Returns:
+        PooledConnection: Conexão do pool ou None se houver erro.
+    """
+    pool = get_pool()
+    try:
+        return PooledConnection(pool, pool.acquire())
     except Error as e:
         logger.error(f"Erro ao conectar ao MySQL: {e}")
         return None
 
 
+def get_db_connection():
+    """
+    Retorna uma conexão do pool com o banco de dados MySQL.
+    Dentro de uma requisição, a mesma conexão é reutilizada até o teardown.
+
+    Returns:
+        Connection: Objeto de conexão MySQL ou None se houver erro.
+    """
+    # Fora do contexto da aplicação (scripts, workers) não há onde guardar a conexão
+    if not has_app_context():
+        return get_pooled_connection()
+
+    # Verifica se já existe uma conexão no contexto da aplicação
+    db = g.get('db')
+    if db is not None and not db.released:
+        return db
+
+    connection = get_pooled_connection()
+
+    # Armazenar a conexão no contexto da aplicação
+    if connection is not None:
+        g.db = connection
+
+    return connection
+
+
 @contextmanager
 def db_cursor(dictionary=True, commit=True):
     """
@@ -91,8 +383,8 @@ def db_cursor(dictionary=True, commit=True):
     finally:
         if cursor:
             cursor.close()
-        # Não fechar a conexão se ela estiver armazenada no contexto da aplicação
-        if 'g' not in globals() and 'g' not in locals() or 'db' not in g:
+        # Não devolver a conexão se ela estiver armazenada no contexto da aplicação
+        if not has_app_context() or g.get('db') is not connection:
             connection.close()
 
 
@@ -238,17 +530,17 @@ def update_data(table, data, condition_column, condition_value):
 
 def close_db_connection(e=None):
     """
-    Fecha a conexão com o banco de dados armazenada no contexto da aplicação.
+    Devolve ao pool a conexão armazenada no contexto da aplicação.
     Esta função deve ser registrada como teardown_appcontext.
     """
     try:
         db = g.pop('db', None)
         if db is not None:
             try:
-                if hasattr(db, 'is_connected') and db.is_connected():
-                    db.close()
-                    logger.debug(
-                        "Conexão com o banco de dados fechada com sucesso")
+                # Devolve a conexão ao pool (sem ida ao servidor)
+                db.close()
+                logger.debug(
+                    "Conexão com o banco de dados devolvida ao pool")
             except Exception as e:
                 logger.error(
                     f"Erro ao fechar conexão com o banco de dados: {e}")
@@ -260,4 +552,6 @@ def init_app(app):
     """
     Inicializa as funções de banco de dados com a aplicação Flask.
     """
+    for key, value in POOL_DEFAULTS.items():
+        app.config.setdefault(key, os.environ.get(key, value))
     app.teardown_appcontext(close_db_connection)